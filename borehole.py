@@ -6,9 +6,9 @@ import matplotlib.gridspec as gridspec
 import matplotlib.patches as patches
 
 from .soillayer import SoilLayer
-
-GEF_COLUMN_TOP = 1
-GEF_COLUMN_BOTTOM = 2
+from .helpers import open_text
+from .gefheader import GEFHeader, GEF_ENCODING, read_gef_header
+from .gefheader import GEF_COLUMN_TOP, GEF_COLUMN_BOTTOM
 
 BOREHOLE_COLORS = {
     'N': '#8d9991',
@@ -31,7 +31,20 @@ class Borehole(BaseModel):
     filename: str = ""
 
     @classmethod
-    def from_file(self, filename: str) -> 'Borehole':
+    def from_file(self, filename: str, backend: str = None) -> 'Borehole':
+        """
+        Read a borehole file with the in-house parser or with the given GEF backend
+
+        Args:
+            filename (str): the name of the file
+            backend (str): one of the gefbackend.GEF_BACKEND_ values (optional)
+
+        Returns:
+            Borehole: the borehole
+        """
+        if backend is not None:
+            from .gefbackend import read_borehole # the backends use this class
+            return read_borehole(filename, backend)
         borehole = Borehole()
         borehole.read(filename)        
         return borehole
@@ -78,26 +91,15 @@ class Borehole(BaseModel):
         Read a GEF from the indivual lines
 
         Args:
-            lines (List[str]): list of strings
+            lines (List[str]): list of strings (or any iterable of lines like an open file)
 
         Returns:
             None
         """
-        reading_header = True
-        metadata = {
-            "record_seperator":"",
-            "column_seperator":" ",
-            "columninfo":{},
-            "last_column":2,
-        }
+        lines = iter(lines)
+        metadata = self._apply_header(read_gef_header(lines))
         for line in lines:
-            if reading_header:
-                if line.find("#EOH") >= 0:
-                    reading_header = False
-                else:
-                    self._parse_header_line(line, metadata)
-            else:
-                self._parse_data_line(line, metadata)
+            self._parse_data_line(line, metadata)
 
     def read(self, filename: str) -> None:
         self.filename = filename
@@ -118,73 +120,35 @@ class Borehole(BaseModel):
         Returns:
             None
         """
-        lines = open(filename, "r", encoding="utf-8", errors="ignore").readlines()
+        with open_text(filename, encoding=GEF_ENCODING) as f:
+            self.read_from_gef_stringlist(f)
 
-        # remove empty lines
-        lines = [line.strip() for line in lines if len(line.strip())>0]
+    def _apply_header(self, header: GEFHeader) -> dict:
+        """
+        Copy the header information to the borehole and return the metadata needed to read the datalines
 
-        self.read_from_gef_stringlist(lines)
+        Args:
+            header (GEFHeader): the header of the GEF file
+
+        Returns:
+            dict: the metadata for _parse_data_line
+        """
+        if header.x is not None and header.y is not None:
+            self.x = round(header.x, 2)
+            self.y = round(header.y, 2)
+        if header.z_top is not None:
+            self.z_top = header.z_top
+        self.name = header.name
+        self.filedate = header.filedate
+        self.startdate = header.startdate
+
+        return {
+            "record_seperator": header.record_seperator,
+            "column_seperator": header.column_seperator,
+            "columninfo": header.columninfo,
+            "last_column": header.num_columns,
+        }
 
-    def _parse_header_line(self, line: str, metadata: dict) -> None:
-        try:
-            keyword, argline = line.split("=")
-        except Exception as e:
-            raise ValueError(f"Error reading headerline '{line}' -> error {e}")
-
-        keyword = keyword.strip().replace("#", "")
-        argline = argline.strip()
-        args = argline.split(",")
-
-        if keyword == "RECORDSEPARATOR":
-            metadata["record_seperator"] = args[0]
-        elif keyword == "COLUMN":
-            metadata["last_column"] = int(args[0])
-        elif keyword == "COLUMNSEPARATOR":
-            metadata["column_seperator"] = args[0]
-        elif keyword == "COLUMNINFO":
-            try:
-                column = int(args[0])
-                dtype = int(args[3].strip())
-                metadata["columninfo"][dtype] = column - 1
-            except Exception as e:
-                raise ValueError(f"Error reading columninfo '{line}' -> error {e}")
-        elif keyword == "XYID":
-            try:
-                self.x = round(float(args[1].strip()), 2)
-                self.y = round(float(args[2].strip()), 2)
-            except Exception as e:
-                raise ValueError(f"Error reading xyid '{line}' -> error {e}")
-        elif keyword == "ZID":
-            try:
-                assert len(args) >= 2 # avoids a situation where #ZID= 0, -1,24, 0.01 leads to a z of -1 due to the erronous comma in 1,24 (should be 1.24)
-                self.z_top = float(args[1].strip())
-            except Exception as e:
-                raise ValueError(f"Error reading zid '{line}' -> error {e}")     
-        elif keyword == "TESTID":
-            self.name = args[0].strip()    
-        elif keyword == "FILEDATE":
-            try:
-                yyyy = int(args[0].strip())
-                mm = int(args[1].strip())
-                dd = int(args[2].strip())   
-
-                if yyyy < 1900 or yyyy > 2100 or mm < 1 or mm > 12 or dd < 1 or dd > 31:
-                    raise ValueError(f"Invalid date {yyyy}-{mm}-{dd}")            
-
-                self.filedate = f"{yyyy}{mm:02}{dd:02}"
-            except:                
-                self.filedate = ""
-        elif keyword == "STARTDATE":
-            try:
-                yyyy = int(args[0].strip())
-                mm = int(args[1].strip())
-                dd = int(args[2].strip())
-                self.startdate = f"{yyyy}{mm:02}{dd:02}"
-                if yyyy < 1900 or yyyy > 2100 or mm < 1 or mm > 12 or dd < 1 or dd > 31:
-                    raise ValueError(f"Invalid date {yyyy}-{mm}-{dd}")
-            except:                
-                self.startdate = ""
-        
     def _parse_data_line(self, line: str, metadata: dict) -> None:
         try:
             if len(line.strip()) == 0: return
@@ -206,7 +170,7 @@ class Borehole(BaseModel):
             soilcode = "_".join(args[soilcode_start_column:]).replace('"','').replace("'", '')
             soilcode = soilcode.replace(" ", "_")
 
-            self.soillayers.append(SoilLayer(
+            self.soillayers.append(SoilLayer.construct( # trusted values, skip the pydantic validation
                 z_bottom = round(z_bottom,2),
                 z_top = round(z_top,2),
                 soilcode = soilcode
@@ -0,0 +1,129 @@
+from typing import List, Tuple, Dict
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+from .soilinvestigation import SoilInvestigation, SoilInvestigationEnum
+from .spatialindex import join_within
+
+# default vertical resolution of the calibration table
+CALIBRATION_DZ = 0.1
+
+CALIBRATION_COLUMNS = ["pair", "cpt", "borehole", "distance", "z", "qc", "fs", "Rf", "u", "soilcode", "main_soil"]
+
+
+def _days(dates: np.ndarray) -> np.ndarray:
+    # YYYYMMDD integers to days since 1970, unknown dates (0) become nan
+    days = pd.to_datetime(pd.Series(dates).astype(str), format="%Y%m%d", errors="coerce")
+    return (days - pd.Timestamp("1970-01-01")).dt.days.to_numpy(dtype=float, na_value=np.nan)
+
+
+def cpt_borehole_pairs(project, radius: float, max_days: int = None) -> List[Tuple[float, SoilInvestigation, SoilInvestigation]]:
+    """
+    Return all CPT / borehole pairs within the given distance using a spatial join on the
+    investigation index, optionally only pairs with dates that differ at most max_days days
+
+    Args:
+        project (Project): the project with the indexed soil investigations
+        radius (float): the maximum distance between the CPT and the borehole
+        max_days (int): the maximum number of days between the dates (optional), pairs with an unknown date are skipped
+
+    Returns:
+        List[Tuple[float, SoilInvestigation, SoilInvestigation]]: distance, CPT and borehole sorted on CPT and distance
+    """
+    cpt_index, cpts = project.get_spatial_index(SoilInvestigationEnum.CPT)
+    borehole_index, boreholes = project.get_spatial_index(SoilInvestigationEnum.BOREHOLE)
+    ic, ib, distances = join_within(cpt_index, borehole_index, radius)
+
+    if max_days is not None and len(ic) > 0:
+        cpt_days = _days(project.get_attribute_columns(SoilInvestigationEnum.CPT)["date"])
+        borehole_days = _days(project.get_attribute_columns(SoilInvestigationEnum.BOREHOLE)["date"])
+        mask = np.abs(cpt_days[ic] - borehole_days[ib]) <= max_days # nan never matches
+        ic, ib, distances = ic[mask], ib[mask], distances[mask]
+
+    return [(d, cpts[c], boreholes[b]) for c, b, d in zip(ic.tolist(), ib.tolist(), distances.tolist())]
+
+
+def calibration_table(project, pairs: List[Tuple[float, SoilInvestigation, SoilInvestigation]], dz: float = CALIBRATION_DZ) -> Dict[str, np.ndarray]:
+    """
+    Return the resampled CPT values next to the borehole soillayer at the same level for each pair,
+    only the levels that are covered by both the CPT and the borehole are used
+
+    Args:
+        project (Project): the project used to read the soil investigations
+        pairs (List[Tuple[float, SoilInvestigation, SoilInvestigation]]): the pairs, see cpt_borehole_pairs
+        dz (float): the vertical resolution
+
+    Returns:
+        Dict[str, np.ndarray]: the columns, see CALIBRATION_COLUMNS
+    """
+    parts = []
+    for i, (distance, cpt_si, borehole_si) in enumerate(pairs):
+        try:
+            cpt = project.load_cpt(cpt_si.filename)
+            borehole = project.load_borehole(borehole_si.filename)
+        except Exception as e: # log errors to the Python console in QGis
+            print(f"Could not read the pair '{cpt_si.filename}' / '{borehole_si.filename}', got error '{e}'")
+            continue
+        if len(cpt.z) < 2 or len(borehole.soillayers) == 0:
+            continue
+
+        z_top = min(cpt.z[0], borehole.soillayers[0].z_top)
+        z_bottom = max(cpt.z_min, borehole.soillayers[-1].z_bottom)
+        if z_top <= z_bottom:
+            continue
+        z = np.round(np.arange(np.floor(z_top / dz) * dz, z_bottom, -dz), 6)
+        z = z[(z <= z_top) & (z >= z_bottom)]
+        if len(z) == 0:
+            continue
+
+        # the layer at each level, the layers go down so search on the negative bottoms
+        bottoms = np.array([-sl.z_bottom for sl in borehole.soillayers])
+        layer = np.clip(np.searchsorted(bottoms, -z, side="left"), 0, len(bottoms) - 1)
+        soilcodes = np.array([sl.soilcode for sl in borehole.soillayers], dtype=object)[layer]
+
+        data = cpt.resample(z)
+        parts.append({
+            "pair": np.full(len(z), i, dtype=np.int64),
+            "cpt": np.full(len(z), cpt_si.filename, dtype=object),
+            "borehole": np.full(len(z), borehole_si.filename, dtype=object),
+            "distance": np.full(len(z), distance),
+            "z": z,
+            "qc": data[:,1],
+            "fs": data[:,2],
+            "Rf": data[:,3],
+            "u": data[:,4],
+            "soilcode": soilcodes,
+            "main_soil": np.array([s[:1] for s in soilcodes], dtype=object),
+        })
+
+    if len(parts) == 0:
+        return {column: np.zeros(0) for column in CALIBRATION_COLUMNS}
+    return {column: np.concatenate([part[column] for part in parts]) for column in CALIBRATION_COLUMNS}
+
+
+def export_calibration_table(project, filename: str, radius: float, max_days: int = None, dz: float = CALIBRATION_DZ) -> int:
+    """
+    Write the calibration table of all CPT / borehole pairs within the given distance, the format
+    is based on the extension of the filename (.parquet, .feather or ; separated csv)
+
+    Args:
+        project (Project): the project with the indexed soil investigations
+        filename (str): the name of the file
+        radius (float): the maximum distance between the CPT and the borehole
+        max_days (int): the maximum number of days between the dates (optional)
+        dz (float): the vertical resolution
+
+    Returns:
+        int: the number of pairs
+    """
+    pairs = cpt_borehole_pairs(project, radius, max_days)
+    df = pd.DataFrame(calibration_table(project, pairs, dz))
+    suffix = Path(filename).suffix.lower()
+    if suffix == ".parquet":
+        df.to_parquet(filename, index=False)
+    elif suffix == ".feather":
+        df.to_feather(filename)
+    else:
+        df.to_csv(filename, sep=";", index=False)
+    return len(pairs)
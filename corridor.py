@@ -0,0 +1,167 @@
+from typing import List, Tuple
+import numpy as np
+from matplotlib.collections import LineCollection, PolyCollection
+
+from .spatialindex import SpatialIndex
+from .soilinvestigation import SoilInvestigation, SoilInvestigationEnum
+from .panelcache import BOREHOLE_DEFAULT_COLOR
+
+# long segments are split in parts of at most this number of times the corridor width
+# so the boxes that are used to query the spatial index stay close to the segment
+SEGMENT_PART_FACTOR = 4.0
+
+# default width (in m chainage) of a CPT or borehole in the cross section
+CROSS_SECTION_COLUMN_WIDTH = 20.0
+
+
+def polyline_chainage(x: np.ndarray, y: np.ndarray) -> np.ndarray:
+    """
+    Return the chainage (distance along the polyline) of each vertex
+
+    Args:
+        x (np.ndarray): x coordinates of the vertices
+        y (np.ndarray): y coordinates of the vertices
+
+    Returns:
+        np.ndarray: the chainage of each vertex, starting at 0.0
+    """
+    x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+    if len(x) == 0:
+        return np.zeros(0)
+    return np.concatenate([[0.0], np.cumsum(np.hypot(np.diff(x), np.diff(y)))])
+
+
+def corridor_query(index: SpatialIndex, x: np.ndarray, y: np.ndarray, width: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Return the points of the index within the given distance of the polyline sorted on chainage,
+    the candidates are found per (part of a) segment using the spatial index so only the points
+    close to the polyline are checked
+
+    Points that are close to more than one segment are projected on the closest segment
+
+    Args:
+        index (SpatialIndex): the spatial index
+        x (np.ndarray): x coordinates of the vertices of the polyline
+        y (np.ndarray): y coordinates of the vertices of the polyline
+        width (float): the maximum distance to the polyline (half the width of the corridor)
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray]: the indices of the points, the chainage and the offset
+        (positive on the left side of the polyline), for a single vertex there is no left or right side so
+        the chainage is 0.0 and the offset is the (positive) distance to the vertex
+    """
+    x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+    empty = (np.zeros(0, dtype=np.int64), np.zeros(0), np.zeros(0))
+    if len(index) == 0 or len(x) == 0:
+        return empty
+    if len(x) == 1: # a single location, the corridor is a circle
+        indices, distances = index.query_radius(x[0], y[0], width)
+        return indices, np.zeros(len(indices)), distances
+
+    chainage = polyline_chainage(x, y)
+    part_length = max(width * SEGMENT_PART_FACTOR, index.cellsize)
+
+    hit_indices, hit_distances, hit_chainages, hit_offsets = [], [], [], []
+    for i in range(len(x) - 1):
+        x1, y1, x2, y2 = x[i], y[i], x[i+1], y[i+1]
+        length = chainage[i+1] - chainage[i]
+
+        # query the boxes around the parts of the segment
+        num_parts = max(1, int(np.ceil(length / part_length)))
+        t = np.linspace(0.0, 1.0, num_parts + 1)
+        px, py = x1 + t * (x2 - x1), y1 + t * (y2 - y1)
+        candidates = [
+            index.query_box(min(px[j], px[j+1]) - width, min(py[j], py[j+1]) - width, max(px[j], px[j+1]) + width, max(py[j], py[j+1]) + width)
+            for j in range(num_parts)
+        ]
+        candidates = np.unique(np.concatenate(candidates))
+        if len(candidates) == 0:
+            continue
+
+        # project the candidates on the segment
+        dx, dy = index.x[candidates] - x1, index.y[candidates] - y1
+        if length > 0:
+            ux, uy = (x2 - x1) / length, (y2 - y1) / length
+            along = np.clip(dx * ux + dy * uy, 0.0, length)
+            distance = np.hypot(dx - along * ux, dy - along * uy)
+            side = ux * dy - uy * dx
+        else: # two locations on the same spot
+            along = np.zeros(len(candidates))
+            distance = np.hypot(dx, dy)
+            side = np.ones(len(candidates))
+
+        mask = distance <= width
+        hit_indices.append(candidates[mask])
+        hit_distances.append(distance[mask])
+        hit_chainages.append(chainage[i] + along[mask])
+        hit_offsets.append(np.where(side[mask] < 0, -distance[mask], distance[mask]))
+
+    if len(hit_indices) == 0:
+        return empty
+
+    indices, distances = np.concatenate(hit_indices), np.concatenate(hit_distances)
+    chainages, offsets = np.concatenate(hit_chainages), np.concatenate(hit_offsets)
+    if len(indices) == 0:
+        return empty
+
+    # keep the closest segment for each point
+    order = np.lexsort((distances, indices))
+    indices, chainages, offsets = indices[order], chainages[order], offsets[order]
+    first = np.concatenate([[True], indices[1:] != indices[:-1]])
+    indices, chainages, offsets = indices[first], chainages[first], offsets[first]
+
+    order = np.argsort(chainages, kind="stable")
+    return indices[order], chainages[order], offsets[order]
+
+
+def plot_cross_section(ax, project, hits: List[Tuple[float, float, SoilInvestigation]], qc_max: float, z_min: float, colors: dict, column_width: float = CROSS_SECTION_COLUMN_WIDTH, location_chainages: List[float] = []) -> None:
+    """
+    Draw the soil investigations along the trajectory, the CPTs are drawn as qc lines that start at their
+    chainage and the boreholes as columns of colored soillayers, all CPTs and all soillayers are drawn
+    as one collection each so the plot stays fast for a lot of soil investigations
+
+    Args:
+        ax: the matplotlib axes
+        project (Project): the project used to read the soil investigations
+        hits (List[Tuple[float, float, SoilInvestigation]]): chainage, offset and the soil investigation, see Project.get_corridor
+        qc_max (float): qc value that is drawn over the full column width
+        z_min (float): the lowest level to draw
+        colors (dict): the color for the first letter of the soilcode, like BOREHOLE_COLORS
+        column_width (float): the width of a soil investigation in m chainage
+        location_chainages (List[float]): chainage of the locations to mark (optional)
+
+    Returns:
+        None
+    """
+    cpt_lines, layer_polygons, layer_colors = [], [], []
+    for chainage, _, si in hits:
+        try:
+            if si.stype == SoilInvestigationEnum.CPT:
+                data = project.load_cpt(si.filename).as_numpy()
+                data = data[data[:,0] >= z_min]
+                qc = np.minimum(data[:,1], qc_max) / qc_max * column_width
+                cpt_lines.append(np.column_stack([chainage + qc, data[:,0]]))
+            elif si.stype == SoilInvestigationEnum.BOREHOLE:
+                for soillayer in project.load_borehole(si.filename).soillayers:
+                    if soillayer.z_top < z_min:
+                        break
+                    bottom = max(soillayer.z_bottom, z_min)
+                    layer_polygons.append([
+                        (chainage, soillayer.z_top), (chainage + column_width, soillayer.z_top),
+                        (chainage + column_width, bottom), (chainage, bottom)
+                    ])
+                    layer_colors.append(colors.get(soillayer.soilcode[:1], BOREHOLE_DEFAULT_COLOR))
+        except Exception as e: # log errors to the Python console in QGis
+            print(f"Could not draw '{si.filename}' in the cross section, got error '{e}'")
+
+    if len(layer_polygons) > 0:
+        ax.add_collection(PolyCollection(layer_polygons, facecolors=layer_colors, edgecolors="none"))
+    if len(cpt_lines) > 0:
+        ax.add_collection(LineCollection(cpt_lines, colors="k", linewidths=0.5))
+    if len(location_chainages) > 0:
+        ax.vlines(location_chainages, z_min, max([si.z_top for _, _, si in hits] + [0.0]), colors="#c0c0c0", linewidths=0.5, zorder=0)
+
+    ax.autoscale_view()
+    ax.set_ylim(bottom=z_min)
+    ax.set_xlabel("afstand langs traject [m]")
+    ax.set_ylabel("niveau [m tov NAP]")
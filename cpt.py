@@ -13,11 +13,9 @@ from enum import IntEnum
 
 from pydantic.utils import KeyType
 
-GEF_COLUMN_Z = 1
-GEF_COLUMN_QC = 2
-GEF_COLUMN_FS = 3
-GEF_COLUMN_U = 6
-GEF_COLUMN_Z_CORRECTED = 11
+from .helpers import open_text
+from .gefheader import GEFHeader, GEF_ENCODING, read_gef_header
+from .gefheader import GEF_COLUMN_Z, GEF_COLUMN_QC, GEF_COLUMN_FS, GEF_COLUMN_U
 
 class CPT(BaseModel):
     x: float = 0.0
@@ -40,7 +38,20 @@ class CPT(BaseModel):
     pre_excavated_depth: float = 0.0
 
     @classmethod
-    def from_file(self, filename: str) -> 'CPT':
+    def from_file(self, filename: str, backend: str = None) -> 'CPT':
+        """
+        Read a CPT file with the in-house parser or with the given GEF backend
+
+        Args:
+            filename (str): the name of the file
+            backend (str): one of the gefbackend.GEF_BACKEND_ values (optional)
+
+        Returns:
+            CPT: the CPT
+        """
+        if backend is not None:
+            from .gefbackend import read_cpt # the backends use this class
+            return read_cpt(filename, backend)
         cpt = CPT()
         cpt.read(filename)
         return cpt
@@ -96,26 +107,15 @@ class CPT(BaseModel):
         Read a GEF from the indivual lines
 
         Args:
-            lines (List[str]): list of strings
+            lines (List[str]): list of strings (or any iterable of lines like an open file)
 
         Returns:
             None
         """
-        reading_header = True
-        metadata = {
-            "record_seperator":"",
-            "column_seperator":" ",
-            "columnvoids":{}, 
-            "columninfo":{}
-        }
+        lines = iter(lines)
+        metadata = self._apply_header(read_gef_header(lines))
         for line in lines:
-            if reading_header:
-                if line.find("#EOH") >= 0:
-                    reading_header = False
-                else:
-                    self._parse_header_line(line, metadata)
-            else:
-                self._parse_data_line(line, metadata)
+            self._parse_data_line(line, metadata)
 
     def read(self, filename: str) -> None:
         self.filename = filename
@@ -135,82 +135,39 @@ class CPT(BaseModel):
         Returns:
             None
         """
-        lines = open(filename, "r", encoding="utf-8", errors="ignore").readlines()
+        with open_text(filename, encoding=GEF_ENCODING) as f:
+            self.read_from_gef_stringlist(f)
+
+    def _apply_header(self, header: GEFHeader) -> dict:
+        """
+        Copy the header information to the CPT and return the metadata needed to read the datalines
+
+        Args:
+            header (GEFHeader): the header of the GEF file
+
+        Returns:
+            dict: the metadata for _parse_data_line
+        """
+        if header.x is not None and header.y is not None:
+            self.x = round(header.x, 2)
+            self.y = round(header.y, 2)
+        if header.z_top is not None:
+            self.z_top = header.z_top
+        self.name = header.name
+        self.filedate = header.filedate
+        self.startdate = header.startdate
+        self.pre_excavated_depth = header.pre_excavated_depth
+
+        columninfo = dict(header.columninfo)
+        if header.cpt_z_column is not None:
+            columninfo[GEF_COLUMN_Z] = header.cpt_z_column # use corrected depth instead of depth
+        return {
+            "record_seperator": header.record_seperator,
+            "column_seperator": header.column_seperator,
+            "columnvoids": header.columnvoids,
+            "columninfo": columninfo
+        }
 
-        self.read_from_gef_stringlist(lines)
-  
-    def _parse_header_line(self, line: str, metadata: dict) -> None:
-        try:
-            args = line.split("=")
-            keyword, argline = args[0], args[1]
-        except Exception as e:
-            raise ValueError(f"Error reading headerline '{line}' -> error {e}")
-
-        keyword = keyword.strip().replace("#", "")
-        argline = argline.strip()
-        args = argline.split(",")
-
-        if keyword == "RECORDSEPARATOR":
-            metadata["record_seperator"] = args[0]
-        elif keyword == "COLUMNSEPARATOR":
-            metadata["column_seperator"] = args[0]
-        elif keyword == "COLUMNINFO":
-            try:
-                column = int(args[0])
-                dtype = int(args[3].strip())
-                if dtype == GEF_COLUMN_Z_CORRECTED:
-                    dtype = GEF_COLUMN_Z # use corrected depth instead of depth                
-                metadata["columninfo"][dtype] = column - 1
-            except Exception as e:
-                raise ValueError(f"Error reading columninfo '{line}' -> error {e}")
-        elif keyword == "XYID":
-            try:
-                self.x = round(float(args[1].strip()), 2)
-                self.y = round(float(args[2].strip()), 2)
-            except Exception as e:
-                raise ValueError(f"Error reading xyid '{line}' -> error {e}")
-        elif keyword == "ZID":
-            try:
-                self.z_top = float(args[1].strip())
-            except Exception as e:
-                raise ValueError(f"Error reading zid '{line}' -> error {e}")     
-        elif keyword == "MEASUREMENTVAR":
-            if args[0] == '13':
-                try:
-                    self.pre_excavated_depth = float(args[1])
-                except Exception as e:
-                    raise ValueError(f"Invalid pre-excavated depth found in line '{line}'. Got error '{e}'")        
-        elif keyword == "COLUMNVOID":
-            try:
-                col = int(args[0].strip())
-                metadata["columnvoids"][col - 1] = float(args[1].strip())
-            except Exception as e:
-                raise ValueError(f"Error reading columnvoid '{line}' -> error {e}")  
-        elif keyword == "TESTID":
-            self.name = args[0].strip()    
-        elif keyword == "FILEDATE":
-            try:
-                yyyy = int(args[0].strip())
-                mm = int(args[1].strip())
-                dd = int(args[2].strip())   
-
-                if yyyy < 1900 or yyyy > 2100 or mm < 1 or mm > 12 or dd < 1 or dd > 31:
-                    raise ValueError(f"Invalid date {yyyy}-{mm}-{dd}")            
-
-                self.filedate = f"{yyyy}{mm:02}{dd:02}"
-            except:                
-                self.filedate = ""
-        elif keyword == "STARTDATE":
-            try:
-                yyyy = int(args[0].strip())
-                mm = int(args[1].strip())
-                dd = int(args[2].strip())
-                self.startdate = f"{yyyy}{mm:02}{dd:02}"
-                if yyyy < 1900 or yyyy > 2100 or mm < 1 or mm > 12 or dd < 1 or dd > 31:
-                    raise ValueError(f"Invalid date {yyyy}-{mm}-{dd}")
-            except:                
-                self.startdate = ""
-        
     def _parse_data_line(self, line: str, metadata: dict) -> None:
         try:
             if len(line.strip())==0: return
@@ -285,4 +242,30 @@ class CPT(BaseModel):
         Returns:
             pd.DataFrame: the CPT data as a DataFrame"""
         data = self.as_numpy()
-        return pd.DataFrame(data=data, columns=["z", "qc", "fs", "Rf", "u"])
\ No newline at end of file
+        return pd.DataFrame(data=data, columns=["z", "qc", "fs", "Rf", "u"])
+
+    def resample(self, z: np.ndarray) -> np.ndarray:
+        """
+        Return the CPT data linearly interpolated on the given levels with the same
+        columns as as_numpy, levels outside the CPT get nan values
+
+        Args:
+            z (np.ndarray): the levels to resample on
+
+        Returns:
+            np.ndarray: the resampled CPT data"""
+        z = np.asarray(z, dtype=float)
+        result = np.full((len(z), 5), np.nan)
+        result[:,0] = z
+
+        data = self.as_numpy()
+        if len(data) < 2:
+            return result
+
+        # np.interp needs increasing levels and the CPT goes down
+        order = np.argsort(data[:,0], kind="stable")
+        zs = data[order,0]
+        inside = (z >= zs[0]) & (z <= zs[-1])
+        for col in range(1, 5):
+            result[inside, col] = np.interp(z[inside], zs, data[order, col])
+        return result
@@ -0,0 +1,227 @@
+from pydantic import BaseModel
+from typing import List, Tuple, Callable
+import numpy as np
+
+from .cpt import CPT
+
+# reasons in CleaningResult.flags, a sample is removed if one of the REMOVED_ flags is set
+REMOVED_VOID = 1 # nan in z, qc or fs
+REMOVED_PRE_EXCAVATED = 2 # in the pre excavated part of the CPT
+REMOVED_NOT_MONOTONIC = 4 # not deeper than the samples above it
+REMOVED_SPIKE = 8 # qc or fs far away from the rolling median
+REMOVED_MASK = REMOVED_VOID | REMOVED_PRE_EXCAVATED | REMOVED_NOT_MONOTONIC | REMOVED_SPIKE
+CHANGED_SMOOTHED = 16 # qc and fs replaced by the rolling median
+CHANGED_NEGATIVE_U = 32 # negative u set to 0.0
+
+
+class CleaningSettings(BaseModel):
+    remove_pre_excavated: bool = True
+    enforce_monotonic: bool = True
+    spike_window: int = 7 # number of samples of the rolling median used to find spikes, 0 to skip
+    spike_factor: float = 4.0 # spikes are more than this factor above or below the rolling median
+    median_window: int = 0 # smooth qc and fs with a rolling median of this number of samples, 0 to skip
+    clip_negative_u: bool = True
+
+
+class CleaningResult(BaseModel):
+    """
+    The cleaned data of one or more CPTs, the flags have the same length as the original data
+    and record why a sample was removed or changed
+    """
+    data: np.ndarray # the cleaned data with the columns of CPT.as_numpy
+    offsets: np.ndarray # start of each CPT in data, with the length of data as last value
+    flags: np.ndarray # the REMOVED_ and CHANGED_ flags of each original sample
+    original_offsets: np.ndarray # start of each CPT in flags, with the length of flags as last value
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    @property
+    def removed(self) -> np.ndarray:
+        return (self.flags & REMOVED_MASK) > 0
+
+    def cpt_data(self, index: int) -> np.ndarray:
+        return self.data[self.offsets[index]:self.offsets[index+1]]
+
+    def cpt_flags(self, index: int) -> np.ndarray:
+        return self.flags[self.original_offsets[index]:self.original_offsets[index+1]]
+
+    def num_removed(self, flag: int = REMOVED_MASK) -> int:
+        return int(np.count_nonzero(self.flags & flag))
+
+
+def rolling_median(values: np.ndarray, segments: np.ndarray, starts: np.ndarray, ends: np.ndarray, window: int) -> np.ndarray:
+    """
+    Return the centered rolling median of the values, the windows do not cross the segments and
+    are filled with the first or last value of the segment at the edges
+
+    Args:
+        values (np.ndarray): the values
+        segments (np.ndarray): the segment of each value
+        starts (np.ndarray): the first index of each segment
+        ends (np.ndarray): the index after the last value of each segment
+        window (int): the number of values in the window, even numbers are increased by one
+
+    Returns:
+        np.ndarray: the rolling median
+    """
+    if len(values) == 0:
+        return values.copy()
+    half = window // 2
+    indices = np.arange(len(values))[:,None] + np.arange(-half, half + 1)[None,:]
+    indices = np.clip(indices, starts[segments][:,None], ends[segments][:,None] - 1)
+    return np.median(values[indices], axis=1)
+
+
+def _segments(offsets: np.ndarray) -> np.ndarray:
+    return np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+
+
+def _offsets(segments: np.ndarray, num_segments: int) -> np.ndarray:
+    return np.concatenate([[0], np.cumsum(np.bincount(segments, minlength=num_segments))]).astype(np.int64)
+
+
+def clean_stack(data: np.ndarray, offsets: np.ndarray, z_top: np.ndarray, pre_excavated_depth: np.ndarray, settings: CleaningSettings = None) -> CleaningResult:
+    """
+    Clean the data of one or more CPTs that are stacked in one array, all steps work on the whole
+    stack at once and the rolling windows never cross two CPTs
+
+    The steps are
+        1. remove the samples with nan in z, qc or fs (void values)
+        2. remove the samples above the pre excavated depth
+        3. remove the samples that are not deeper than all samples above them
+        4. remove the samples where qc or fs differs more than spike_factor from the rolling median
+        5. replace qc and fs by their rolling median (optional)
+        6. set negative u to 0.0 and recompute Rf
+
+    Args:
+        data (np.ndarray): the data of the CPTs with the columns of CPT.as_numpy (z, qc, fs, Rf, u)
+        offsets (np.ndarray): start of each CPT in data, with the length of data as last value
+        z_top (np.ndarray): z_top of each CPT
+        pre_excavated_depth (np.ndarray): the pre excavated depth of each CPT
+        settings (CleaningSettings): the cleaning settings (optional)
+
+    Returns:
+        CleaningResult: the cleaned data and the flags of the original samples
+    """
+    if settings is None:
+        settings = CleaningSettings()
+    data = np.asarray(data, dtype=float)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    num_cpts = len(offsets) - 1
+    segments = _segments(offsets)
+    flags = np.zeros(len(data), dtype=np.int64)
+
+    z, qc, fs = data[:,0], data[:,1], data[:,2]
+    flags[~(np.isfinite(z) & np.isfinite(qc) & np.isfinite(fs))] |= REMOVED_VOID
+
+    if settings.remove_pre_excavated:
+        depth = np.asarray(z_top, dtype=float)[segments] - z
+        flags[depth < np.asarray(pre_excavated_depth, dtype=float)[segments]] |= REMOVED_PRE_EXCAVATED
+
+    if settings.enforce_monotonic and len(data) > 0:
+        # shift each CPT below the previous one so one running minimum works for all CPTs
+        valid = np.isfinite(z)
+        shift = np.nanmax(z) - np.nanmin(z) + 1.0 if np.any(valid) else 1.0
+        shifted = np.where(valid, z - segments * shift, np.inf)
+        previous = np.concatenate([[np.inf], np.minimum.accumulate(shifted)[:-1]])
+        flags[valid & (shifted >= previous)] |= REMOVED_NOT_MONOTONIC
+
+    keep = flags == 0
+    data, segments = data[keep], segments[keep]
+    kept_offsets = _offsets(segments, num_cpts)
+    starts, ends = kept_offsets[:-1], kept_offsets[1:]
+
+    if settings.spike_window > 1 and len(data) > 0:
+        log_factor = np.log(settings.spike_factor)
+        spike = np.zeros(len(data), dtype=bool)
+        for column in [1, 2]:
+            values = np.log(np.maximum(data[:,column], 1e-9))
+            spike |= np.abs(values - rolling_median(values, segments, starts, ends, settings.spike_window)) > log_factor
+        flags[np.flatnonzero(keep)[spike]] |= REMOVED_SPIKE
+        keep[np.flatnonzero(keep)[spike]] = False
+        data, segments = data[~spike], segments[~spike]
+        kept_offsets = _offsets(segments, num_cpts)
+        starts, ends = kept_offsets[:-1], kept_offsets[1:]
+
+    data = data.copy()
+    if settings.median_window > 1 and len(data) > 0:
+        for column in [1, 2]:
+            data[:,column] = rolling_median(data[:,column], segments, starts, ends, settings.median_window)
+        flags[keep] |= CHANGED_SMOOTHED
+
+    if settings.clip_negative_u:
+        negative = data[:,4] < 0
+        flags[np.flatnonzero(keep)[negative]] |= CHANGED_NEGATIVE_U
+        data[negative,4] = 0.0
+
+    data[:,3] = data[:,2] / data[:,1] * 100.0
+    return CleaningResult(data=data, offsets=kept_offsets, flags=flags, original_offsets=offsets)
+
+
+def clean_cpts(cpts: List[CPT], settings: CleaningSettings = None) -> CleaningResult:
+    """
+    Clean the data of the CPTs in one pass, see clean_stack
+
+    Args:
+        cpts (List[CPT]): the CPTs
+        settings (CleaningSettings): the cleaning settings (optional)
+
+    Returns:
+        CleaningResult: the cleaned data in the order of the CPTs
+    """
+    parts = [cpt.as_numpy().reshape(-1, 5) for cpt in cpts]
+    offsets = np.concatenate([[0], np.cumsum([len(p) for p in parts])]).astype(np.int64)
+    data = np.concatenate(parts) if len(parts) > 0 else np.zeros((0, 5))
+    return clean_stack(
+        data, offsets,
+        np.array([cpt.z_top for cpt in cpts], dtype=float),
+        np.array([cpt.pre_excavated_depth for cpt in cpts], dtype=float),
+        settings
+    )
+
+
+def cleaned_copy(cpt: CPT, data: np.ndarray) -> CPT:
+    """Return a copy of the CPT with the given data (columns like CPT.as_numpy)"""
+    result = cpt.copy(exclude={"z", "qc", "fs", "Rf", "u"})
+    result.z, result.qc, result.fs, result.Rf, result.u = (data[:,i].tolist() for i in range(5))
+    return result
+
+
+def clean_cpt(cpt: CPT, settings: CleaningSettings = None) -> Tuple[CPT, CleaningResult]:
+    """
+    Return a cleaned copy of the CPT and the cleaning result with the flags of the original samples
+
+    Args:
+        cpt (CPT): the CPT
+        settings (CleaningSettings): the cleaning settings (optional)
+
+    Returns:
+        Tuple[CPT, CleaningResult]: the cleaned CPT and the cleaning result
+    """
+    result = clean_cpts([cpt], settings)
+    return cleaned_copy(cpt, result.data), result
+
+
+class CleaningLoader:
+    """
+    Loader for the parse cache that reads and cleans a CPT, loaders with the same reader and
+    settings are equal so they share the cache entries
+    """
+
+    def __init__(self, read: Callable[[str], CPT], settings: CleaningSettings):
+        self.read = read
+        self.settings = settings
+        self._key = (read, settings.json())
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, CleaningLoader) and self._key == other._key
+
+    def __hash__(self) -> int:
+        return hash(self._key)
+
+    def __call__(self, filename: str) -> CPT:
+        return clean_cpt(self.read(filename), self.settings)[0]
@@ -0,0 +1,204 @@
+from typing import Iterable, Iterator, Tuple, Dict, Callable, List, Optional
+from pathlib import Path
+from itertools import islice
+
+from .location import Location
+from .layerstats import LayerStatistics, STATISTICS_COLUMNS
+
+DAM_COLUMNS = ["soilprofile_id", "top_level", "soil_name"]
+
+# returns the statistics for each soillayer of a location (None if unknown), like Project.get_layer_statistics
+StatisticsGetter = Callable[[Location], List[Optional[LayerStatistics]]]
+
+# DAM expects the first layer to start at this level
+DAM_FIRST_LAYER_TOP = 10.0
+
+# number of rows that are formatted and written at once
+EXPORT_BATCH_SIZE = 50000
+
+# buffer size of the output file
+EXPORT_BUFFER_SIZE = 1024 * 1024
+
+DAM_FORMAT_CSV = "csv"
+DAM_FORMAT_PARQUET = "parquet"
+DAM_FORMAT_FEATHER = "feather"
+DAM_FORMATS = {
+    ".csv": DAM_FORMAT_CSV,
+    ".parquet": DAM_FORMAT_PARQUET,
+    ".feather": DAM_FORMAT_FEATHER,
+}
+
+
+def dam_format_from_filename(filename: str) -> str:
+    """Return the export format based on the extension of the filename, unknown extensions are written as csv"""
+    return DAM_FORMATS.get(Path(filename).suffix.lower(), DAM_FORMAT_CSV)
+
+
+def iter_dam_rows(locations: Iterable[Location]) -> Iterator[Tuple[str, float, str]]:
+    """
+    Yield the DAM soilprofile rows (soilprofile_id, top_level, soil_name) of the given locations,
+    locations without soillayers are skipped
+
+    Args:
+        locations (Iterable[Location]): the locations
+
+    Returns:
+        Iterator[Tuple[str, float, str]]: the rows
+    """
+    for location in locations:
+        for i, soillayer in enumerate(location.soillayers):
+            yield (location.name, DAM_FIRST_LAYER_TOP if i == 0 else soillayer.z_top, soillayer.soilcode)
+
+
+def iter_dam_statistics_rows(locations: Iterable[Location], statistics: StatisticsGetter) -> Iterator[tuple]:
+    """
+    Yield the DAM soilprofile rows followed by the values of the STATISTICS_COLUMNS of the soillayer,
+    the values are nan if there are no statistics for the soillayer
+
+    Args:
+        locations (Iterable[Location]): the locations
+        statistics (StatisticsGetter): returns the statistics of the soillayers of a location
+
+    Returns:
+        Iterator[tuple]: the rows
+    """
+    empty = tuple(float("nan") for _ in STATISTICS_COLUMNS)
+    for location in locations:
+        stats = statistics(location)
+        for i, (soillayer, ls) in enumerate(zip(location.soillayers, stats)):
+            values = empty if ls is None else tuple(ls.values.get(column, float("nan")) for column in STATISTICS_COLUMNS)
+            yield (location.name, DAM_FIRST_LAYER_TOP if i == 0 else soillayer.z_top, soillayer.soilcode) + values
+
+
+def iter_dam_batches(locations: Iterable[Location], batch_size: int = EXPORT_BATCH_SIZE, statistics: StatisticsGetter = None) -> Iterator[Dict[str, list]]:
+    """
+    Yield the DAM soilprofile rows in columns of at most batch_size rows so the memory use
+    does not depend on the number of soillayers
+
+    Args:
+        locations (Iterable[Location]): the locations
+        batch_size (int): the maximum number of rows per batch
+        statistics (StatisticsGetter): add the STATISTICS_COLUMNS using this function (optional)
+
+    Returns:
+        Iterator[Dict[str, list]]: the batches with the DAM_COLUMNS (and STATISTICS_COLUMNS) as keys
+    """
+    if statistics is None:
+        columns, rows = DAM_COLUMNS, iter_dam_rows(locations)
+    else:
+        columns, rows = DAM_COLUMNS + STATISTICS_COLUMNS, iter_dam_statistics_rows(locations, statistics)
+
+    batch = {column: [] for column in columns}
+    for row in rows:
+        for column, value in zip(columns, row):
+            batch[column].append(value)
+        if len(batch[columns[0]]) >= batch_size:
+            yield batch
+            batch = {column: [] for column in columns}
+    if len(batch[columns[0]]) > 0:
+        yield batch
+
+
+def _format_statistics(values: tuple) -> str:
+    # empty fields for unknown values
+    return ";".join("" if v != v else f"{v:.3f}" for v in values)
+
+
+def write_dam_csv(locations: Iterable[Location], filename: str, batch_size: int = EXPORT_BATCH_SIZE, statistics: StatisticsGetter = None) -> int:
+    """
+    Write the DAM soilprofiles csv file, the rows are formatted per batch and written
+    through a large buffer
+
+    Args:
+        locations (Iterable[Location]): the locations
+        filename (str): the name of the csv file
+        batch_size (int): the number of rows that are written at once
+        statistics (StatisticsGetter): add the STATISTICS_COLUMNS using this function (optional)
+
+    Returns:
+        int: the number of rows written
+    """
+    num_rows = 0
+    with open(filename, 'w', buffering=EXPORT_BUFFER_SIZE) as f:
+        if statistics is None:
+            f.write(";".join(DAM_COLUMNS) + "\n")
+            rows = iter_dam_rows(locations)
+        else:
+            f.write(";".join(DAM_COLUMNS + STATISTICS_COLUMNS) + "\n")
+            rows = iter_dam_statistics_rows(locations, statistics)
+        while True:
+            if statistics is None:
+                lines = [f"{name};{z:.2f};{soilcode}\n" for name, z, soilcode in islice(rows, batch_size)]
+            else:
+                lines = [f"{row[0]};{row[1]:.2f};{row[2]};{_format_statistics(row[3:])}\n" for row in islice(rows, batch_size)]
+            if len(lines) == 0:
+                break
+            f.write("".join(lines))
+            num_rows += len(lines)
+    return num_rows
+
+
+def write_dam_columnar(locations: Iterable[Location], filename: str, fmt: str = DAM_FORMAT_PARQUET, batch_size: int = EXPORT_BATCH_SIZE, statistics: StatisticsGetter = None) -> int:
+    """
+    Write the DAM soilprofiles to a Parquet or Feather file, every batch is written as a separate
+    record batch / row group so the memory use does not depend on the number of soillayers,
+    this needs pyarrow
+
+    Args:
+        locations (Iterable[Location]): the locations
+        filename (str): the name of the file
+        fmt (str): DAM_FORMAT_PARQUET or DAM_FORMAT_FEATHER
+        batch_size (int): the number of rows per record batch
+        statistics (StatisticsGetter): add the STATISTICS_COLUMNS using this function (optional)
+
+    Returns:
+        int: the number of rows written
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError(f"Exporting to {fmt} needs the pyarrow package, use the csv format or install pyarrow")
+
+    fields = [(DAM_COLUMNS[0], pa.string()), (DAM_COLUMNS[1], pa.float64()), (DAM_COLUMNS[2], pa.string())]
+    if statistics is not None:
+        fields += [(column, pa.float64()) for column in STATISTICS_COLUMNS]
+    schema = pa.schema(fields)
+    if fmt == DAM_FORMAT_PARQUET:
+        writer = pa.parquet.ParquetWriter(filename, schema)
+    elif fmt == DAM_FORMAT_FEATHER:
+        writer = pa.ipc.new_file(filename, schema)
+    else:
+        raise ValueError(f"Unknown columnar format '{fmt}'")
+
+    num_rows = 0
+    try:
+        for batch in iter_dam_batches(locations, batch_size, statistics):
+            writer.write_batch(pa.RecordBatch.from_pydict(batch, schema=schema))
+            num_rows += len(batch[DAM_COLUMNS[0]])
+    finally:
+        writer.close()
+    return num_rows
+
+
+def export_to_dam(locations: Iterable[Location], filename: str, fmt: str = None, batch_size: int = EXPORT_BATCH_SIZE, statistics: StatisticsGetter = None) -> int:
+    """
+    Write the DAM soilprofiles of the given locations, the format is based on the extension
+    of the filename if not given
+
+    Args:
+        locations (Iterable[Location]): the locations
+        filename (str): the name of the file
+        fmt (str): one of the DAM_FORMAT_ values (optional)
+        batch_size (int): the number of rows that are written at once
+        statistics (StatisticsGetter): add the STATISTICS_COLUMNS using this function (optional)
+
+    Returns:
+        int: the number of rows written
+    """
+    if fmt is None:
+        fmt = dam_format_from_filename(filename)
+    if fmt == DAM_FORMAT_CSV:
+        return write_dam_csv(locations, filename, batch_size, statistics)
+    return write_dam_columnar(locations, filename, fmt, batch_size, statistics)
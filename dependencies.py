@@ -0,0 +1,145 @@
+from typing import List, Dict, Tuple, Set
+import numpy as np
+
+from .location import Location
+from .soilinvestigation import SoilInvestigation, SoilInvestigationEnum
+from .spatialindex import SpatialIndex
+
+# kinds of derived results per location
+DERIVED_CLOSEST = "closest"
+DERIVED_PROFILE = "profile"
+DERIVED_LAYER_STATISTICS = "layer_statistics"
+
+
+def source_signature(si: SoilInvestigation) -> str:
+    """Return a value that changes if the soil investigation is moved or its file is changed"""
+    return f"{si.fingerprint};{si.x_rd:.2f};{si.y_rd:.2f};{si.z_top};{si.z_min}"
+
+
+class _Records:
+    # the dependencies of one kind of derived result for all locations
+    def __init__(self, num_locations: int):
+        self.reach = np.full(num_locations, np.nan) # nan if there is no result
+        self.stype = np.zeros(num_locations, dtype=np.int64) # the SoilInvestigationEnum that was used, 0 for all types
+        self.sources: List[Dict[str, str]] = [{} for _ in range(num_locations)] # filename -> source_signature
+        self.dirty = np.zeros(num_locations, dtype=bool)
+
+
+class DependencyTracker:
+    """
+    Records which soil investigations the derived results of each location came from so only the
+    results that can change are invalidated if the soil investigations are replaced
+
+    A result depends on its sources (removed or changed sources make it dirty) and on the area in
+    which a new soil investigation would have been one of the closest (the reach), a result with fewer
+    sources than requested has the maximum search distance as reach
+
+    Usage:
+        tracker.record(DERIVED_CLOSEST, index, hits, max_distance, num)
+        dirty = tracker.update(old_soilinvestigations, new_soilinvestigations)
+        if tracker.is_dirty(DERIVED_CLOSEST, index):
+            ... recompute ...
+    """
+
+    def __init__(self, locations: List[Location]):
+        self.locations = locations
+        self._index = SpatialIndex([l.x_rd for l in locations], [l.y_rd for l in locations])
+        self._records: Dict[str, _Records] = {}
+        self._users: Dict[str, Set[Tuple[str, int]]] = {} # filename -> the results that used it
+
+    def _get_records(self, kind: str) -> _Records:
+        if not kind in self._records.keys():
+            self._records[kind] = _Records(len(self.locations))
+        return self._records[kind]
+
+    def _forget(self, kind: str, index: int) -> None:
+        records = self._get_records(kind)
+        for filename in records.sources[index].keys():
+            users = self._users.get(filename)
+            if users is not None:
+                users.discard((kind, index))
+                if len(users) == 0:
+                    del self._users[filename]
+        records.sources[index] = {}
+        records.reach[index] = np.nan
+
+    def record(self, kind: str, index: int, hits: List[Tuple[float, SoilInvestigation]], max_distance: float, num: int, stype: SoilInvestigationEnum = None) -> None:
+        """
+        Record the sources of a (re)computed result and mark it clean
+
+        Args:
+            kind (str): the kind of result like DERIVED_CLOSEST
+            index (int): the index of the location
+            hits (List[Tuple[float, SoilInvestigation]]): distance and soil investigation of the sources, closest first
+            max_distance (float): the search distance that was used
+            num (int): the maximum number of sources that was requested
+            stype (SoilInvestigationEnum): the type of soil investigation that was searched for (optional)
+        """
+        records = self._get_records(kind)
+        self._forget(kind, index)
+        records.sources[index] = {si.filename: source_signature(si) for _, si in hits}
+        records.reach[index] = hits[-1][0] if len(hits) >= num else max_distance
+        records.stype[index] = int(stype) if stype is not None else 0
+        records.dirty[index] = False
+        for _, si in hits:
+            self._users.setdefault(si.filename, set()).add((kind, index))
+
+    def has_result(self, kind: str, index: int) -> bool:
+        """True if a clean result of this kind was recorded for the location"""
+        records = self._records.get(kind)
+        return records is not None and not records.dirty[index] and not np.isnan(records.reach[index])
+
+    def is_dirty(self, kind: str, index: int) -> bool:
+        records = self._records.get(kind)
+        return records is not None and bool(records.dirty[index])
+
+    def dirty(self, kind: str) -> np.ndarray:
+        """Return the indices of the locations with a dirty result of this kind"""
+        records = self._records.get(kind)
+        return np.flatnonzero(records.dirty) if records is not None else np.zeros(0, dtype=np.int64)
+
+    def mark_clean(self, kind: str, index: int) -> None:
+        self._get_records(kind).dirty[index] = False
+
+    def update(self, old: List[SoilInvestigation], new: List[SoilInvestigation]) -> Dict[str, np.ndarray]:
+        """
+        Mark the results dirty that depend on soil investigations that were removed or changed and the
+        results where an added (or moved) soil investigation is within the reach
+
+        Args:
+            old (List[SoilInvestigation]): the current soil investigations
+            new (List[SoilInvestigation]): the soil investigations that replace them
+
+        Returns:
+            Dict[str, np.ndarray]: the indices of the locations that became dirty per kind of result
+        """
+        old_signatures = {si.filename: source_signature(si) for si in old}
+        new_signatures = {si.filename: source_signature(si) for si in new}
+        changed = [f for f, s in old_signatures.items() if new_signatures.get(f) != s] # removed or changed
+        added = [si for si in new if old_signatures.get(si.filename) != new_signatures[si.filename]] # added or changed
+
+        dirty = {kind: np.zeros(len(self.locations), dtype=bool) for kind in self._records.keys()}
+        for filename in changed:
+            for kind, index in self._users.get(filename, set()):
+                dirty[kind][index] = True
+
+        if len(added) > 0 and len(self.locations) > 0:
+            for kind, records in self._records.items():
+                recorded = ~np.isnan(records.reach)
+                if not np.any(recorded):
+                    continue
+                max_reach = float(np.max(records.reach[recorded]))
+                for si in added:
+                    indices, distances = self._index.query_radius(si.x_rd, si.y_rd, max_reach)
+                    hit = recorded[indices] & (distances <= records.reach[indices]) # nan reach never matches
+                    hit &= (records.stype[indices] == 0) | (records.stype[indices] == int(si.stype))
+                    dirty[kind][indices[hit]] = True
+
+        result = {}
+        for kind, mask in dirty.items():
+            indices = np.flatnonzero(mask)
+            for index in indices.tolist():
+                self._forget(kind, index)
+            self._records[kind].dirty[indices] = True
+            result[kind] = indices
+        return result
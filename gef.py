@@ -0,0 +1,211 @@
+from typing import List, Iterator
+from itertools import islice
+import numpy as np
+
+from .helpers import open_text
+from .cpt import CPT
+from .gefheader import GEF_ENCODING, GEF_COLUMN_Z, GEF_COLUMN_QC, GEF_COLUMN_FS, GEF_COLUMN_U, read_gef_header
+
+# default number of datalines per chunk
+DEFAULT_CHUNKSIZE = 50000
+
+
+class CPTStreamReader:
+    """
+    Read a CPT GEF file in chunks, the header is read when the file is opened and the data
+    is returned as numpy arrays of at most chunksize rows with the same columns as CPT.as_numpy
+    (z, qc, fs, Rf, u) so the memory use does not depend on the size of the file
+
+    Usage:
+        with CPTStreamReader(filename) as reader:
+            print(reader.cpt.name)
+            for chunk in reader:
+                ...
+    """
+
+    def __init__(self, filename: str, chunksize: int = DEFAULT_CHUNKSIZE):
+        self.filename = str(filename)
+        self.chunksize = chunksize
+        self.cpt = CPT(filename=self.filename)
+        self.metadata = {}
+        self._stream = open_text(self.filename, encoding=GEF_ENCODING)
+        try:
+            self._read_header()
+        except:
+            self.close()
+            raise
+
+    def __enter__(self) -> 'CPTStreamReader':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def close(self) -> None:
+        if self._stream is not None:
+            self._stream.close()
+            self._stream = None
+
+    def _read_header(self) -> None:
+        self.metadata = self.cpt._apply_header(read_gef_header(self._stream))
+
+        for dtype in [GEF_COLUMN_Z, GEF_COLUMN_QC, GEF_COLUMN_FS]:
+            if not dtype in self.metadata["columninfo"].keys():
+                raise ValueError(f"Missing columninfo for quantity {dtype} in '{self.filename}'")
+
+    def __iter__(self) -> Iterator[np.ndarray]:
+        while self._stream is not None:
+            lines = list(islice(self._stream, self.chunksize))
+            if len(lines) == 0:
+                break
+            chunk = self.parse_lines(lines)
+            if len(chunk) > 0:
+                yield chunk
+        self.close()
+
+    def parse_lines(self, lines: List[str]) -> np.ndarray:
+        """
+        Convert datalines to a numpy array with columns z, qc, fs, Rf, u using the same rules as
+        CPT._parse_data_line (void rows are skipped, qc and fs are clipped at small positive values)
+
+        Args:
+            lines (List[str]): the datalines
+
+        Returns:
+            np.ndarray: the data
+        """
+        raw = self._to_array(lines)
+        if len(raw) == 0:
+            return np.zeros((0, 5))
+
+        # skip rows that have a columnvoid
+        mask = np.ones(len(raw), dtype=bool)
+        for col_index, voidvalue in self.metadata["columnvoids"].items():
+            if col_index < raw.shape[1]:
+                mask &= raw[:,col_index] != voidvalue
+        raw = raw[mask]
+
+        columninfo = self.metadata["columninfo"]
+        result = np.zeros((len(raw), 5))
+        result[:,0] = self.cpt.z_top - np.abs(raw[:,columninfo[GEF_COLUMN_Z]])
+        result[:,1] = np.where(raw[:,columninfo[GEF_COLUMN_QC]] <= 0, 1e-3, raw[:,columninfo[GEF_COLUMN_QC]])
+        result[:,2] = np.where(raw[:,columninfo[GEF_COLUMN_FS]] <= 0, 1e-6, raw[:,columninfo[GEF_COLUMN_FS]])
+        result[:,3] = result[:,2] / result[:,1] * 100.0
+        if GEF_COLUMN_U in columninfo.keys():
+            result[:,4] = raw[:,columninfo[GEF_COLUMN_U]]
+        return result
+
+    def _to_array(self, lines: List[str]) -> np.ndarray:
+        """Convert the datalines to a 2D array of the raw GEF values"""
+        record_seperator = self.metadata["record_seperator"]
+        column_seperator = self.metadata["column_seperator"]
+
+        rows = []
+        for line in lines:
+            if record_seperator != "":
+                line = line.replace(record_seperator, "")
+            if column_seperator.strip() != "":
+                line = line.replace(column_seperator, " ")
+            if len(line.strip()) > 0:
+                rows.append(line)
+        if len(rows) == 0:
+            return np.zeros((0, 0))
+
+        # fast path, all rows have the same number of values
+        tokens = " ".join(rows).split()
+        ncols = len(rows[0].split())
+        if ncols > 0 and len(tokens) == ncols * len(rows):
+            try:
+                return np.array(tokens, dtype=float).reshape(len(rows), ncols)
+            except ValueError as e:
+                raise ValueError(f"Error reading datalines in '{self.filename}' -> error {e}")
+
+        # slow path, the rows have different lengths, use the columns that are in all rows
+        values = [row.split() for row in rows]
+        ncols = min([len(v) for v in values])
+        try:
+            return np.array([v[:ncols] for v in values], dtype=float)
+        except ValueError as e:
+            raise ValueError(f"Error reading datalines in '{self.filename}' -> error {e}")
+
+    def read_all(self) -> np.ndarray:
+        """Return all (remaining) data as one numpy array with columns z, qc, fs, Rf, u"""
+        chunks = list(self)
+        if len(chunks) == 0:
+            return np.zeros((0, 5))
+        return np.concatenate(chunks)
+
+
+class DepthBinner:
+    """
+    Aggregate CPT chunks on the fly to the mean value per depth bin, only the sums per bin
+    are kept so the memory use depends on the depth range and not on the number of readings
+
+    Usage:
+        binner = DepthBinner(dz=0.1)
+        with CPTStreamReader(filename) as reader:
+            for chunk in reader:
+                binner.add(chunk)
+        data = binner.result()
+    """
+
+    def __init__(self, dz: float = 0.1):
+        self.dz = dz
+        self._sums = {}
+        self._counts = {}
+
+    def add(self, chunk: np.ndarray) -> None:
+        """
+        Add a chunk with z in the first column
+
+        Args:
+            chunk (np.ndarray): the data with columns like CPT.as_numpy
+
+        Returns:
+            None
+        """
+        if len(chunk) == 0:
+            return
+        bins = np.floor(chunk[:,0] / self.dz).astype(np.int64)
+        keys, inverse = np.unique(bins, return_inverse=True)
+        counts = np.bincount(inverse, minlength=len(keys))
+        sums = np.column_stack([np.bincount(inverse, weights=chunk[:,col], minlength=len(keys)) for col in range(1, chunk.shape[1])])
+        for key, count, s in zip(keys.tolist(), counts, sums):
+            if key in self._sums.keys():
+                self._sums[key] += s
+                self._counts[key] += count
+            else:
+                self._sums[key] = s
+                self._counts[key] = count
+
+    def result(self) -> np.ndarray:
+        """
+        Return the mean values per bin from top to bottom, the first column is the center of the bin
+
+        Returns:
+            np.ndarray: the binned data
+        """
+        if len(self._sums) == 0:
+            return np.zeros((0, 5))
+        keys = np.array(sorted(self._sums.keys(), reverse=True))
+        means = np.array([self._sums[k] / self._counts[k] for k in keys.tolist()])
+        return np.column_stack([(keys + 0.5) * self.dz, means])
+
+
+def read_cpt_binned(filename: str, dz: float = 0.1, chunksize: int = DEFAULT_CHUNKSIZE) -> np.ndarray:
+    """
+    Return the CPT data averaged per depth bin without holding all readings in memory
+
+    Args:
+        filename (str): the name of the file
+        dz (float): the height of the bins
+        chunksize (int): the number of datalines per chunk
+
+    Returns:
+        np.ndarray: the binned data with columns z, qc, fs, Rf, u
+    """
+    binner = DepthBinner(dz)
+    with CPTStreamReader(filename, chunksize=chunksize) as reader:
+        for chunk in reader:
+            binner.add(chunk)
+    return binner.result()
@@ -0,0 +1,334 @@
+from pydantic import BaseModel
+from typing import List, Tuple
+import argparse
+import io
+import time
+import numpy as np
+
+from .helpers import open_text, case_insensitive_glob
+from .cpt import CPT
+from .borehole import Borehole
+from .soillayer import SoilLayer
+from .gef import CPTStreamReader
+from .gefheader import GEF_ENCODING
+from .soilinvestigation import SoilInvestigationEnum
+from .settings import SONDERINGEN_MAP, BORINGEN_MAP
+
+GEF_BACKEND_PYTHON = "python"
+GEF_BACKEND_NUMPY = "numpy"
+GEF_BACKEND_PYGEF = "pygef"
+
+DEFAULT_GEF_BACKEND = GEF_BACKEND_PYTHON
+
+# tolerances used to compare the results of the backends
+COMPARE_RTOL = 1e-6
+COMPARE_ATOL = 1e-6
+COMPARE_XY_TOLERANCE = 0.01
+
+
+class GEFBackend:
+    """
+    Reader for CPT and borehole GEF files, all backends return the CPT and Borehole objects
+    of this tool so the rest of the code does not depend on the backend
+    """
+    name = ""
+
+    def is_available(self) -> bool:
+        return True
+
+    def read_cpt(self, filename: str) -> CPT:
+        raise NotImplementedError()
+
+    def read_borehole(self, filename: str) -> Borehole:
+        raise NotImplementedError()
+
+
+class PythonGEFBackend(GEFBackend):
+    """The line by line parsers of CPT and Borehole"""
+    name = GEF_BACKEND_PYTHON
+
+    def read_cpt(self, filename: str) -> CPT:
+        cpt = CPT()
+        cpt.read(filename)
+        return cpt
+
+    def read_borehole(self, filename: str) -> Borehole:
+        borehole = Borehole()
+        borehole.read(filename)
+        return borehole
+
+
+class NumpyGEFBackend(PythonGEFBackend):
+    """
+    Reads the CPT datalines with the vectorized parser of gef.CPTStreamReader, boreholes only have
+    a few datalines so they are read with the line by line parser
+    """
+    name = GEF_BACKEND_NUMPY
+
+    def read_cpt(self, filename: str) -> CPT:
+        with CPTStreamReader(filename) as reader:
+            data = reader.read_all()
+            cpt = reader.cpt
+        cpt.z, cpt.qc, cpt.fs, cpt.Rf, cpt.u = (data[:,i].tolist() for i in range(5))
+        return cpt
+
+
+class PygefGEFBackend(GEFBackend):
+    """
+    Reads the GEF files with pygef (0.8 or later), pygef is an optional dependency so it is only
+    imported when it is used
+    """
+    name = GEF_BACKEND_PYGEF
+
+    def is_available(self) -> bool:
+        try:
+            import pygef
+        except ImportError:
+            return False
+        return hasattr(pygef, "read_cpt") and hasattr(pygef, "read_bore")
+
+    def _pygef(self):
+        try:
+            import pygef
+        except ImportError:
+            raise ImportError("The pygef backend needs the pygef package, use another backend or install pygef")
+        return pygef
+
+    def _read_bytes(self, filename: str) -> io.BytesIO:
+        # read through open_text so files in archives can be used
+        with open_text(filename, encoding=GEF_ENCODING) as f:
+            return io.BytesIO(f.read().encode(GEF_ENCODING))
+
+    def _apply_metadata(self, target, data) -> None:
+        location = getattr(data, "delivered_location", None)
+        if location is not None:
+            target.x, target.y = round(float(location.x), 2), round(float(location.y), 2)
+        z_top = getattr(data, "delivered_vertical_position_offset", None)
+        if z_top is not None:
+            target.z_top = float(z_top)
+        target.name = str(getattr(data, "alias", None) or getattr(data, "bro_id", None) or "")
+        date = getattr(data, "research_report_date", None)
+        if date is not None:
+            target.startdate = date.strftime("%Y%m%d")
+
+    def read_cpt(self, filename: str) -> CPT:
+        data = self._pygef().read_cpt(self._read_bytes(filename))
+        cpt = CPT(filename=str(filename))
+        self._apply_metadata(cpt, data)
+        predrilled_depth = getattr(data, "predrilled_depth", None)
+        if predrilled_depth is not None:
+            cpt.pre_excavated_depth = float(predrilled_depth)
+
+        df = data.data
+        column = lambda name: df[name].to_numpy().astype(float) if name in df.columns else np.zeros(len(df))
+        depth = column("depth") if "depth" in df.columns else column("penetrationLength")
+        u = column("porePressureU2")
+        # same rules as CPT._parse_data_line
+        valid = np.isfinite(depth) & np.isfinite(column("coneResistance")) & np.isfinite(column("localFriction"))
+        qc, fs = column("coneResistance")[valid], column("localFriction")[valid]
+        qc, fs = np.where(qc <= 0, 1e-3, qc), np.where(fs <= 0, 1e-6, fs)
+        cpt.z = (cpt.z_top - np.abs(depth[valid])).tolist()
+        cpt.qc, cpt.fs, cpt.Rf = qc.tolist(), fs.tolist(), (fs / qc * 100.0).tolist()
+        cpt.u = np.nan_to_num(u[valid]).tolist()
+        return cpt
+
+    def read_borehole(self, filename: str) -> Borehole:
+        data = self._pygef().read_bore(self._read_bytes(filename))
+        borehole = Borehole(filename=str(filename))
+        self._apply_metadata(borehole, data)
+
+        df = data.data
+        tops = df["upperBoundary"].to_numpy().astype(float)
+        bottoms = df["lowerBoundary"].to_numpy().astype(float)
+        names = df["geotechnicalSoilName"].to_list() if "geotechnicalSoilName" in df.columns else [""] * len(df)
+        borehole.soillayers = [
+            SoilLayer.construct( # trusted values, skip the pydantic validation
+                z_top = round(borehole.z_top - top, 2),
+                z_bottom = round(borehole.z_top - bottom, 2),
+                soilcode = str(name or "").replace(" ", "_")
+            ) for top, bottom, name in zip(tops.tolist(), bottoms.tolist(), names)
+        ]
+        borehole._merge_layers()
+        return borehole
+
+
+GEF_BACKENDS = {backend.name: backend for backend in [PythonGEFBackend(), NumpyGEFBackend(), PygefGEFBackend()]}
+
+
+def get_gef_backend(name: str = None) -> GEFBackend:
+    """
+    Return the GEF backend with the given name
+
+    Args:
+        name (str): one of the GEF_BACKEND_ values, DEFAULT_GEF_BACKEND if not given
+
+    Returns:
+        GEFBackend: the backend, raises a ValueError for unknown names and an ImportError if the backend is not available
+    """
+    if name is None:
+        name = DEFAULT_GEF_BACKEND
+    if not name in GEF_BACKENDS.keys():
+        raise ValueError(f"Unknown GEF backend '{name}', use one of {list(GEF_BACKENDS.keys())}")
+    backend = GEF_BACKENDS[name]
+    if not backend.is_available():
+        raise ImportError(f"The GEF backend '{name}' is not available, check if the needed package is installed")
+    return backend
+
+
+def available_gef_backends() -> List[str]:
+    return [name for name, backend in GEF_BACKENDS.items() if backend.is_available()]
+
+
+def read_cpt(filename: str, backend: str = None) -> CPT:
+    return get_gef_backend(backend).read_cpt(filename)
+
+
+def read_borehole(filename: str, backend: str = None) -> Borehole:
+    return get_gef_backend(backend).read_borehole(filename)
+
+
+class BackendReport(BaseModel):
+    backend: str
+    num_files: int = 0
+    num_errors: int = 0
+    seconds: float = 0.0
+    num_differences: int = 0 # files with results that differ from the reference backend
+    differences: List[str] = []
+    errors: List[str] = []
+
+    @property
+    def files_per_second(self) -> float:
+        return self.num_files / self.seconds if self.seconds > 0 else 0.0
+
+
+def _compare_metadata(reference, result) -> List[str]:
+    differences = []
+    if abs(reference.x - result.x) > COMPARE_XY_TOLERANCE or abs(reference.y - result.y) > COMPARE_XY_TOLERANCE:
+        differences.append(f"coordinates ({reference.x}, {reference.y}) <> ({result.x}, {result.y})")
+    if abs(reference.z_top - result.z_top) > COMPARE_ATOL:
+        differences.append(f"z_top {reference.z_top} <> {result.z_top}")
+    reference_date = reference.startdate or reference.filedate
+    result_date = result.startdate or result.filedate
+    if reference_date != result_date:
+        differences.append(f"date '{reference_date}' <> '{result_date}'")
+    return differences
+
+
+def compare_cpts(reference: CPT, result: CPT) -> List[str]:
+    """
+    Return the differences between two readings of the same CPT, the channels are compared
+    as arrays with the COMPARE_ tolerances
+
+    Args:
+        reference (CPT): the CPT read with the reference backend
+        result (CPT): the CPT read with the other backend
+
+    Returns:
+        List[str]: a description of each difference, empty if the CPTs are the same
+    """
+    differences = _compare_metadata(reference, result)
+    a, b = reference.as_numpy(), result.as_numpy()
+    if a.shape != b.shape:
+        differences.append(f"{len(a)} <> {len(b)} readings")
+        return differences
+    for i, channel in enumerate(["z", "qc", "fs", "Rf", "u"]):
+        if not np.allclose(a[:,i], b[:,i], rtol=COMPARE_RTOL, atol=COMPARE_ATOL):
+            differences.append(f"channel {channel} max difference {np.max(np.abs(a[:,i] - b[:,i])):.6g}")
+    return differences
+
+
+def compare_boreholes(reference: Borehole, result: Borehole) -> List[str]:
+    """
+    Return the differences between two readings of the same borehole
+
+    Args:
+        reference (Borehole): the borehole read with the reference backend
+        result (Borehole): the borehole read with the other backend
+
+    Returns:
+        List[str]: a description of each difference, empty if the boreholes are the same
+    """
+    differences = _compare_metadata(reference, result)
+    if len(reference.soillayers) != len(result.soillayers):
+        differences.append(f"{len(reference.soillayers)} <> {len(result.soillayers)} soillayers")
+        return differences
+    for i, (a, b) in enumerate(zip(reference.soillayers, result.soillayers)):
+        if abs(a.z_top - b.z_top) > COMPARE_ATOL or abs(a.z_bottom - b.z_bottom) > COMPARE_ATOL or a.soilcode != b.soilcode:
+            differences.append(f"soillayer {i} ({a.z_top}, {a.z_bottom}, {a.soilcode}) <> ({b.z_top}, {b.z_bottom}, {b.soilcode})")
+    return differences
+
+
+def compare_backends(files: List[Tuple[str, SoilInvestigationEnum]], backends: List[str] = None, reference: str = GEF_BACKEND_PYTHON) -> List[BackendReport]:
+    """
+    Read all files with each backend and report the throughput and the differences with the
+    results of the reference backend, files that the reference backend cannot read are not compared
+
+    Args:
+        files (List[Tuple[str, SoilInvestigationEnum]]): the files and their type
+        backends (List[str]): the backends to run (optional), all available backends if not given
+        reference (str): the backend that gives the expected results
+
+    Returns:
+        List[BackendReport]: a report per backend, the reference backend first
+    """
+    if backends is None:
+        backends = available_gef_backends()
+    backends = [reference] + [b for b in backends if b != reference]
+
+    expected, reports = {}, []
+    for name in backends:
+        backend = get_gef_backend(name)
+        readers = {SoilInvestigationEnum.CPT: backend.read_cpt, SoilInvestigationEnum.BOREHOLE: backend.read_borehole}
+        report = BackendReport(backend=name, num_files=len(files))
+
+        results = []
+        start = time.perf_counter()
+        for filename, stype in files:
+            try:
+                results.append(readers[stype](filename))
+            except Exception as e:
+                results.append(None)
+                report.num_errors += 1
+                report.errors.append(f"{filename}: {e}")
+        report.seconds = time.perf_counter() - start
+
+        for (filename, stype), result in zip(files, results):
+            if name == reference:
+                expected[filename] = result
+                continue
+            if result is None or expected.get(filename) is None:
+                continue
+            compare = compare_cpts if stype == SoilInvestigationEnum.CPT else compare_boreholes
+            differences = compare(expected[filename], result)
+            if len(differences) > 0:
+                report.num_differences += 1
+                report.differences += [f"{filename}: {d}" for d in differences]
+        reports.append(report)
+    return reports
+
+
+def main(args: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Compare the results and the speed of the GEF backends")
+    parser.add_argument("--cpts", nargs="*", default=[SONDERINGEN_MAP], help="directories with CPT files")
+    parser.add_argument("--boreholes", nargs="*", default=[BORINGEN_MAP], help="directories with borehole files")
+    parser.add_argument("--backends", nargs="*", default=None, help=f"backends to compare, available: {available_gef_backends()}")
+    parser.add_argument("--reference", default=GEF_BACKEND_PYTHON, help="backend with the expected results")
+    parser.add_argument("--verbose", action="store_true", help="print all differences and errors")
+    args = parser.parse_args(args)
+
+    files = []
+    for roots, stype in [(args.cpts, SoilInvestigationEnum.CPT), (args.boreholes, SoilInvestigationEnum.BOREHOLE)]:
+        for root in roots:
+            files += [(str(f), stype) for f in case_insensitive_glob(root, ".gef")]
+
+    reports = compare_backends(files, args.backends, args.reference)
+    for report in reports:
+        print(f"{report.backend:10s} {report.num_files} files in {report.seconds:.2f}s ({report.files_per_second:.1f} files/s), {report.num_errors} errors, {report.num_differences} files with differences")
+        if args.verbose:
+            for line in report.errors + report.differences:
+                print(f"    {line}")
+    return 1 if any(r.num_differences > 0 for r in reports) else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,185 @@
+from pydantic import BaseModel
+from typing import List, Dict, Iterator, Optional
+
+# all GEF files are decoded with the same encoding, latin-1 maps every byte so decoding never fails
+GEF_ENCODING = "latin-1"
+
+# GEF column quantities
+GEF_COLUMN_Z = 1
+GEF_COLUMN_QC = 2
+GEF_COLUMN_FS = 3
+GEF_COLUMN_U = 6
+GEF_COLUMN_Z_CORRECTED = 11
+
+GEF_COLUMN_TOP = 1
+GEF_COLUMN_BOTTOM = 2
+
+GEF_MEASUREMENTVAR_PRE_EXCAVATED_DEPTH = 13
+
+
+class GEFHeader(BaseModel):
+    """
+    The header of a GEF file, created by tokenizing the header lines once using
+    the HEADER_PARSERS dispatch table
+    """
+    x: Optional[float] = None
+    y: Optional[float] = None
+    z_top: Optional[float] = None
+
+    name: str = ""
+    filedate: str = ""
+    startdate: str = ""
+
+    record_seperator: str = ""
+    column_seperator: str = " "
+    num_columns: int = 2
+    columninfo: Dict[int, int] = {} # quantity -> column index (0 based)
+    columnvoids: Dict[int, float] = {} # column index (0 based) -> void value
+    measurementvars: Dict[int, float] = {}
+
+    errors: List[str] = []
+    warnings: List[str] = []
+
+    @property
+    def date(self) -> str:
+        """Return the startdate or if not available the filedate, can be an empty string"""
+        if self.startdate != "":
+            return self.startdate
+        return self.filedate
+
+    @property
+    def pre_excavated_depth(self) -> float:
+        return self.measurementvars.get(GEF_MEASUREMENTVAR_PRE_EXCAVATED_DEPTH, 0.0)
+
+    @property
+    def has_u(self) -> bool:
+        return GEF_COLUMN_U in self.columninfo.keys()
+
+    @property
+    def cpt_z_column(self) -> Optional[int]:
+        """Return the column with the depth of a CPT, the corrected depth is used if available"""
+        return self.columninfo.get(GEF_COLUMN_Z_CORRECTED, self.columninfo.get(GEF_COLUMN_Z))
+
+    def parse_line(self, line: str, strict: bool = True) -> None:
+        """
+        Parse one header line, in strict mode errors raise a ValueError, otherwise the errors
+        are added to the errors of the header
+
+        Args:
+            line (str): the header line
+            strict (bool): raise errors
+
+        Returns:
+            None
+        """
+        if len(line.strip()) == 0:
+            return
+
+        keyword, seperator, argline = line.partition("=")
+        if seperator == "":
+            self._error(f"Error reading headerline '{line.strip()}' -> error missing '='", strict)
+            return
+
+        keyword = keyword.strip().replace("#", "")
+        parser = HEADER_PARSERS.get(keyword)
+        if parser is None:
+            return
+
+        try:
+            parser(self, [arg.strip() for arg in argline.strip().split(",")])
+        except Exception as e:
+            self._error(f"Error reading {keyword.lower()} '{line.strip()}' -> error {e}", strict)
+
+    def _error(self, message: str, strict: bool) -> None:
+        if strict:
+            raise ValueError(message)
+        self.errors.append(message)
+
+
+def _parse_date(header: GEFHeader, args: List[str], keyword: str) -> str:
+    try:
+        yyyy, mm, dd = int(args[0]), int(args[1]), int(args[2])
+        if yyyy < 1900 or yyyy > 2100 or mm < 1 or mm > 12 or dd < 1 or dd > 31:
+            raise ValueError(f"Invalid date {yyyy}-{mm}-{dd}")
+        return f"{yyyy}{mm:02}{dd:02}"
+    except Exception as e:
+        header.warnings.append(f"Invalid {keyword.lower()} '{','.join(args)}', got error '{e}'")
+        return ""
+
+
+def _parse_filedate(header: GEFHeader, args: List[str]) -> None:
+    header.filedate = _parse_date(header, args, "FILEDATE")
+
+
+def _parse_startdate(header: GEFHeader, args: List[str]) -> None:
+    header.startdate = _parse_date(header, args, "STARTDATE")
+
+
+def _parse_xyid(header: GEFHeader, args: List[str]) -> None:
+    header.x = float(args[1])
+    header.y = float(args[2])
+
+
+def _parse_zid(header: GEFHeader, args: List[str]) -> None:
+    # avoids a situation where #ZID= 0, -1,24, 0.01 leads to a z of -1 due to the erronous comma in 1,24 (should be 1.24)
+    if len(args) < 2:
+        raise ValueError("expected at least 2 arguments")
+    if len(args) > 3: # code, height and accuracy
+        header.warnings.append(f"#ZID has {len(args)} values '{','.join(args)}', possibly a decimal comma in the height")
+    header.z_top = float(args[1])
+
+
+def _parse_columninfo(header: GEFHeader, args: List[str]) -> None:
+    header.columninfo[int(args[3])] = int(args[0]) - 1
+
+
+def _parse_columnvoid(header: GEFHeader, args: List[str]) -> None:
+    header.columnvoids[int(args[0]) - 1] = float(args[1])
+
+
+def _parse_measurementvar(header: GEFHeader, args: List[str]) -> None:
+    # only the pre excavated depth is used, the other MEASUREMENTVAR lines are not parsed
+    if args[0] == str(GEF_MEASUREMENTVAR_PRE_EXCAVATED_DEPTH):
+        header.measurementvars[GEF_MEASUREMENTVAR_PRE_EXCAVATED_DEPTH] = float(args[1])
+
+
+def _set(attribute: str, convert=str):
+    def parser(header: GEFHeader, args: List[str]) -> None:
+        setattr(header, attribute, convert(args[0]))
+    return parser
+
+
+HEADER_PARSERS = {
+    "XYID": _parse_xyid,
+    "ZID": _parse_zid,
+    "TESTID": _set("name"),
+    "FILEDATE": _parse_filedate,
+    "STARTDATE": _parse_startdate,
+    "RECORDSEPARATOR": _set("record_seperator"),
+    "COLUMNSEPARATOR": _set("column_seperator"),
+    "COLUMN": _set("num_columns", int),
+    "COLUMNINFO": _parse_columninfo,
+    "COLUMNVOID": _parse_columnvoid,
+    "MEASUREMENTVAR": _parse_measurementvar,
+}
+
+
+def read_gef_header(lines: Iterator[str], strict: bool = True) -> GEFHeader:
+    """
+    Tokenize the header lines up to and including the #EOH line, the iterator is left at the
+    first dataline so the data can be read from the same iterator
+
+    Args:
+        lines (Iterator[str]): the lines of the file, like an open file or iter(list_of_lines)
+        strict (bool): raise a ValueError on invalid header lines instead of collecting the errors
+
+    Returns:
+        GEFHeader: the header
+    """
+    header = GEFHeader()
+    for line in lines:
+        if line.find("#EOH") >= 0:
+            return header
+        header.parse_line(line, strict=strict)
+    header._error("Could not find #EOH", strict)
+    return header
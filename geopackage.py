@@ -0,0 +1,226 @@
+from typing import List, Tuple, Iterable
+from pathlib import Path
+from datetime import datetime, timezone
+import sqlite3
+import struct
+
+from .soilinvestigation import SoilInvestigation, SoilInvestigationEnum
+
+# Amersfoort / RD New
+SRS_ID_RD = 28992
+SRS_WKT_RD = (
+    'PROJCS["Amersfoort / RD New",GEOGCS["Amersfoort",DATUM["Amersfoort",SPHEROID["Bessel 1841",6377397.155,299.1528128,'
+    'AUTHORITY["EPSG","7004"]],TOWGS84[565.2369,50.0087,465.658,-0.406857,0.350733,-1.87035,4.0812],AUTHORITY["EPSG","6289"]],'
+    'PRIMEM["Greenwich",0,AUTHORITY["EPSG","8901"]],UNIT["degree",0.0174532925199433,AUTHORITY["EPSG","9122"]],'
+    'AUTHORITY["EPSG","4289"]],PROJECTION["Oblique_Stereographic"],PARAMETER["latitude_of_origin",52.1561605555556],'
+    'PARAMETER["central_meridian",5.38763888888889],PARAMETER["scale_factor",0.9999079],PARAMETER["false_easting",155000],'
+    'PARAMETER["false_northing",463000],UNIT["metre",1,AUTHORITY["EPSG","9001"]],AXIS["Easting",EAST],AXIS["Northing",NORTH],'
+    'AUTHORITY["EPSG","28992"]]'
+)
+
+GPKG_APPLICATION_ID = 0x47504B47 # 'GPKG'
+GPKG_USER_VERSION = 10200 # GeoPackage 1.2
+
+TABLE_SOILINVESTIGATIONS = "soilinvestigations"
+TABLE_LOCATIONS = "locations"
+GEOMETRY_COLUMN = "geom"
+
+STYPE_NAMES = {
+    SoilInvestigationEnum.NONE: "",
+    SoilInvestigationEnum.CPT: "cpt",
+    SoilInvestigationEnum.BOREHOLE: "borehole",
+}
+
+
+def point_to_gpkg_blob(x: float, y: float, srs_id: int = SRS_ID_RD) -> bytes:
+    """
+    Return a point as GeoPackage geometry blob (header without envelope + little endian WKB)
+
+    Args:
+        x (float): x coordinate
+        y (float): y coordinate
+        srs_id (int): the spatial reference id
+
+    Returns:
+        bytes: the geometry blob
+    """
+    return struct.pack("<2sBBi", b"GP", 0, 1, srs_id) + struct.pack("<BIdd", 1, 1, x, y)
+
+
+def gpkg_blob_to_point(blob: bytes) -> Tuple[float, float]:
+    """
+    Return the x, y coordinates of a point GeoPackage geometry blob
+
+    Args:
+        blob (bytes): the geometry blob
+
+    Returns:
+        Tuple[float, float]: x, y
+    """
+    flags = blob[3]
+    envelope_size = [0, 32, 48, 48, 64][(flags >> 1) & 0x07]
+    wkb = blob[8 + envelope_size:]
+    byteorder = "<" if wkb[0] == 1 else ">"
+    return struct.unpack(f"{byteorder}dd", wkb[5:21])
+
+
+def _create_gpkg_tables(conn: sqlite3.Connection) -> None:
+    conn.execute(f"PRAGMA application_id = {GPKG_APPLICATION_ID}")
+    conn.execute(f"PRAGMA user_version = {GPKG_USER_VERSION}")
+    conn.execute("""CREATE TABLE gpkg_spatial_ref_sys (
+        srs_name TEXT NOT NULL, srs_id INTEGER NOT NULL PRIMARY KEY, organization TEXT NOT NULL,
+        organization_coordsys_id INTEGER NOT NULL, definition TEXT NOT NULL, description TEXT)""")
+    conn.executemany("INSERT INTO gpkg_spatial_ref_sys VALUES (?,?,?,?,?,?)", [
+        ("Undefined cartesian SRS", -1, "NONE", -1, "undefined", "undefined cartesian coordinate reference system"),
+        ("Undefined geographic SRS", 0, "NONE", 0, "undefined", "undefined geographic coordinate reference system"),
+        ("WGS 84 geodetic", 4326, "EPSG", 4326,
+            'GEOGCS["WGS 84",DATUM["WGS_1984",SPHEROID["WGS 84",6378137,298.257223563,AUTHORITY["EPSG","7030"]],'
+            'AUTHORITY["EPSG","6326"]],PRIMEM["Greenwich",0,AUTHORITY["EPSG","8901"]],'
+            'UNIT["degree",0.0174532925199433,AUTHORITY["EPSG","9122"]],AUTHORITY["EPSG","4326"]]',
+            "longitude/latitude coordinates in decimal degrees on the WGS 84 spheroid"),
+        ("Amersfoort / RD New", SRS_ID_RD, "EPSG", SRS_ID_RD, SRS_WKT_RD, "Rijksdriehoekstelsel"),
+    ])
+    conn.execute("""CREATE TABLE gpkg_contents (
+        table_name TEXT NOT NULL PRIMARY KEY, data_type TEXT NOT NULL, identifier TEXT UNIQUE, description TEXT DEFAULT '',
+        last_change DATETIME NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ','now')),
+        min_x DOUBLE, min_y DOUBLE, max_x DOUBLE, max_y DOUBLE, srs_id INTEGER,
+        CONSTRAINT fk_gc_r_srs_id FOREIGN KEY (srs_id) REFERENCES gpkg_spatial_ref_sys(srs_id))""")
+    conn.execute("""CREATE TABLE gpkg_geometry_columns (
+        table_name TEXT NOT NULL, column_name TEXT NOT NULL, geometry_type_name TEXT NOT NULL,
+        srs_id INTEGER NOT NULL, z TINYINT NOT NULL, m TINYINT NOT NULL,
+        CONSTRAINT pk_geom_cols PRIMARY KEY (table_name, column_name),
+        CONSTRAINT fk_gc_tn FOREIGN KEY (table_name) REFERENCES gpkg_contents(table_name),
+        CONSTRAINT fk_gc_srs FOREIGN KEY (srs_id) REFERENCES gpkg_spatial_ref_sys (srs_id))""")
+    conn.execute("""CREATE TABLE gpkg_extensions (
+        table_name TEXT, column_name TEXT, extension_name TEXT NOT NULL, definition TEXT NOT NULL, scope TEXT NOT NULL,
+        CONSTRAINT ge_tce UNIQUE (table_name, column_name, extension_name))""")
+
+
+def _write_point_table(conn: sqlite3.Connection, table: str, columns: List[Tuple[str, str]], rows: Iterable[tuple], description: str) -> None:
+    """
+    Write a point feature table with an R-tree spatial index, every row starts with x, y followed by the column values
+
+    Args:
+        conn (sqlite3.Connection): the connection to the GeoPackage
+        table (str): the name of the table
+        columns (List[Tuple[str, str]]): the name and sqlite type of the attribute columns
+        rows (Iterable[tuple]): the rows as (x, y, *values)
+        description (str): the description of the table
+
+    Returns:
+        None
+    """
+    rows = list(rows)
+    coldefs = ", ".join([f"{name} {ctype}" for name, ctype in columns])
+    colnames = ", ".join([name for name, _ in columns])
+    placeholders = ", ".join(["?"] * (len(columns) + 2))
+    rtree = f"rtree_{table}_{GEOMETRY_COLUMN}"
+
+    conn.execute(f"CREATE TABLE {table} (fid INTEGER PRIMARY KEY AUTOINCREMENT, {GEOMETRY_COLUMN} POINT, {coldefs})")
+    conn.executemany(
+        f"INSERT INTO {table} (fid, {GEOMETRY_COLUMN}, {colnames}) VALUES ({placeholders})",
+        ((fid, point_to_gpkg_blob(row[0], row[1]), *row[2:]) for fid, row in enumerate(rows, start=1))
+    )
+
+    # bulk load the spatial index after the data instead of maintaining it per row
+    conn.execute(f"CREATE VIRTUAL TABLE {rtree} USING rtree(id, minx, maxx, miny, maxy)")
+    conn.executemany(
+        f"INSERT INTO {rtree} VALUES (?,?,?,?,?)",
+        ((fid, row[0], row[0], row[1], row[1]) for fid, row in enumerate(rows, start=1))
+    )
+
+    if len(rows) > 0:
+        bounds = (min([r[0] for r in rows]), min([r[1] for r in rows]), max([r[0] for r in rows]), max([r[1] for r in rows]))
+    else:
+        bounds = (None, None, None, None)
+
+    conn.execute(
+        "INSERT INTO gpkg_contents (table_name, data_type, identifier, description, last_change, min_x, min_y, max_x, max_y, srs_id) VALUES (?,?,?,?,?,?,?,?,?,?)",
+        (table, "features", table, description, datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000Z"), *bounds, SRS_ID_RD)
+    )
+    conn.execute("INSERT INTO gpkg_geometry_columns VALUES (?,?,?,?,?,?)", (table, GEOMETRY_COLUMN, "POINT", SRS_ID_RD, 0, 0))
+    conn.execute(
+        "INSERT INTO gpkg_extensions VALUES (?,?,?,?,?)",
+        (table, GEOMETRY_COLUMN, "gpkg_rtree_index", "http://www.geopackage.org/spec120/#extension_rtree", "write-only")
+    )
+
+
+def export_to_geopackage(project, filename: str) -> None:
+    """
+    Write the soil investigation index and the locations of the project to a GeoPackage
+    with an R-tree spatial index on both tables, everything is written in one transaction
+
+    The tables are named 'soilinvestigations' and 'locations' and can be added to QGIS
+    as a vector layer
+
+    Args:
+        project (Project): the project to export
+        filename (str): the name of the GeoPackage, an existing file will be overwritten
+
+    Returns:
+        None
+    """
+    if Path(filename).exists():
+        Path(filename).unlink()
+
+    conn = sqlite3.connect(filename)
+    try:
+        with conn:
+            _create_gpkg_tables(conn)
+            _write_point_table(
+                conn,
+                TABLE_SOILINVESTIGATIONS,
+                [("stype", "TEXT"), ("name", "TEXT"), ("date", "TEXT"), ("z_top", "DOUBLE"), ("z_min", "DOUBLE"), ("has_u", "BOOLEAN"), ("pre_excavated_depth", "DOUBLE"), ("filename", "TEXT")],
+                ((si.x_rd, si.y_rd, STYPE_NAMES[si.stype], si.name, si.date, si.z_top, si.z_min, si.has_u, si.pre_excavated_depth, si.filename) for si in project.soilinvestigations),
+                "CPT and borehole index"
+            )
+            _write_point_table(
+                conn,
+                TABLE_LOCATIONS,
+                [("name", "TEXT"), ("num_soillayers", "INTEGER")],
+                ((l.x_rd, l.y_rd, l.name, len(l.soillayers)) for l in project.locations),
+                "Locations"
+            )
+    finally:
+        conn.close()
+
+
+def soilinvestigations_from_geopackage(filename: str, bbox: Tuple[float, float, float, float] = None) -> List[SoilInvestigation]:
+    """
+    Read the soil investigation index from a GeoPackage written by export_to_geopackage, if a bounding box
+    is given only the soil investigations inside the box are read using the R-tree index
+
+    Args:
+        filename (str): the name of the GeoPackage
+        bbox (Tuple[float, float, float, float]): xmin, ymin, xmax, ymax (optional)
+
+    Returns:
+        List[SoilInvestigation]: the soil investigations
+    """
+    stypes = {v: k for k, v in STYPE_NAMES.items()}
+    sql = f"SELECT t.{GEOMETRY_COLUMN}, t.stype, t.name, t.date, t.z_top, t.z_min, t.has_u, t.pre_excavated_depth, t.filename FROM {TABLE_SOILINVESTIGATIONS} t"
+    params = ()
+    if bbox is not None:
+        sql += f" JOIN rtree_{TABLE_SOILINVESTIGATIONS}_{GEOMETRY_COLUMN} r ON t.fid = r.id WHERE r.maxx >= ? AND r.minx <= ? AND r.maxy >= ? AND r.miny <= ?"
+        params = (bbox[0], bbox[2], bbox[1], bbox[3])
+
+    conn = sqlite3.connect(filename)
+    try:
+        result = []
+        for geom, stype, name, date, z_top, z_min, has_u, pre_excavated_depth, sifilename in conn.execute(sql, params):
+            x, y = gpkg_blob_to_point(geom)
+            result.append(SoilInvestigation.construct(
+                stype = stypes.get(stype, SoilInvestigationEnum.NONE),
+                filename = sifilename,
+                x_rd = x,
+                y_rd = y,
+                name = name,
+                date = date,
+                z_top = z_top,
+                z_min = z_min,
+                has_u = bool(has_u),
+                pre_excavated_depth = pre_excavated_depth
+            ))
+        return result
+    finally:
+        conn.close()
@@ -24,6 +24,7 @@
 
 import os
 from pathlib import Path
+import numpy as np
 import matplotlib.pyplot as plt
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 from matplotlib.backends.backend_qt5agg import NavigationToolbar2QT as NavigationToolbar
@@ -33,15 +34,19 @@ import matplotlib.patches as patches
 
 from qgis.PyQt import uic
 from qgis.PyQt import QtWidgets, QtGui
-from qgis.core import QgsRectangle
+from qgis.core import QgsRectangle, QgsVectorLayer, QgsProject
 
 from .project import Project
 from .settings import GRONDSOORTEN, SONDERINGEN_MAP, BORINGEN_MAP, PLOT_Y_MIN
-from .helpers import case_insensitive_glob
-from .soilinvestigation import SoilInvestigation, SoilInvestigationEnum
-from .cpt import CPT
-from .borehole import Borehole, BOREHOLE_COLORS
+from .helpers import iter_files
+from .soilinvestigation import SoilInvestigation, SoilInvestigationEnum, deduplicate
+from .borehole import BOREHOLE_COLORS
 from .soillayer import SoilLayer
+from .panelcache import PanelCache, panel_key, render_cpt_panel, render_borehole_panel
+from .locationmodel import set_location_model
+from .soiltypedelegate import SoilTypeDelegate
+from .corridor import plot_cross_section
+from .locationview import LocationProfileView
 
 # This loads your .ui file so that PyQt can populate your plugin with the elements from Qt Designer
 FORM_CLASS, _ = uic.loadUiType(os.path.join(
@@ -69,6 +74,9 @@ class HDSRToolDialog(QtWidgets.QDialog, FORM_CLASS):
 
         self.project = Project()
         self.soilinvestigations = []
+        self._panel_cache = PanelCache()
+        self._location_model = None
+        self._layer_view = None
         self._init()
         self._connect()
         self._prev_index = -1
@@ -76,6 +84,10 @@ class HDSRToolDialog(QtWidgets.QDialog, FORM_CLASS):
 
     def _init(self):
         self.project.soiltypes_from_csvstring(GRONDSOORTEN)
+        # the soiltype combobox is only created while editing a cell
+        self._soiltype_delegate = SoilTypeDelegate(self.project.soiltypes, self.tableWidget)
+        self.tableWidget.setItemDelegateForColumn(2, self._soiltype_delegate)
+        self.tableWidget.setEditTriggers(self.tableWidget.editTriggers() | QtWidgets.QAbstractItemView.SelectedClicked)
         self._updateUI()
         self.tableWidget.setColumnCount(3)
         self.tableWidget.setHorizontalHeaderLabels(["bovenzijde", "onderzijde", "grondsoort"])          
@@ -87,10 +99,14 @@ class HDSRToolDialog(QtWidgets.QDialog, FORM_CLASS):
         self.pbPrevious.clicked.connect(self.onPbPreviousClicked)
         self.pbNext.clicked.connect(self.onPbNextClicked)
         self.pbLast.clicked.connect(self.onPbLastClicked)
+        self.pbNextTodo.clicked.connect(self.onPbNextTodoClicked)
         self.pbStart.clicked.connect(self.onPbStartClicked)
         self.pbUpdate.clicked.connect(self.onPbUpdateClicked)
         self.pbReset.clicked.connect(self.onPbResetClicked)
         self.pbExport.clicked.connect(self.onPbExportClicked)
+        self.pbExportGpkg.clicked.connect(self.onPbExportGpkgClicked)
+        self.pbCrossSection.clicked.connect(self.onPbCrossSectionClicked)
+        self.pbLayerOverview.clicked.connect(self.onPbLayerOverviewClicked)
         self.cbLocations.currentIndexChanged.connect(self.onCbLocationsCurrentIndexChanged)
         self.checkboxAuto.stateChanged.connect(self.onCheckboxAutoStateChanged)
         self.pbLoad.clicked.connect(self.onPbLoadClicked)
@@ -115,16 +131,14 @@ class HDSRToolDialog(QtWidgets.QDialog, FORM_CLASS):
         filename = QtWidgets.QFileDialog.getOpenFileName(self, 'Load project file', "", "json files (*.json)")[0]
         if filename == "":
             return
-        try:
-            self.project = Project.from_file(filename)            
-        except Exception as e:
+        # only project files written by this tool skip the validation, other files are validated
+        self.project = Project.from_file(filename, validate=False)
+        if self.project is None:
+            QtWidgets.QMessageBox.warning(self, "HDSR tool", f"Het projectbestand '{filename}' kon niet gelezen worden, zie de Python console voor details.")
             self.project = Project()
 
         self._updateUI()
-        self.cbLocations.clear()        
-        if len(self.project.locations) > 0:
-            self.cbLocations.addItems([l.name for l in self.project.locations])            
-            self.cbLocations.setCurrentIndex(0)        
+        self._set_locations()
         self._afterUpdateLocation()
 
     def onPbSaveClicked(self):
@@ -151,65 +165,139 @@ class HDSRToolDialog(QtWidgets.QDialog, FORM_CLASS):
         # _save_location_soillayers with the previous index
         # after that we update the _prev_index and everything is fine
         self._save_location_soillayers(self._prev_index)
+        if self._layer_view is not None:
+            self._layer_view.update_location(self._prev_index)
         self._prev_index = self.cbLocations.currentIndex()
         self._afterUpdateLocation()
+        if self._layer_view is not None:
+            self._layer_view.set_current(self.cbLocations.currentIndex())
+            self._layer_view.ax.figure.canvas.draw_idle()
 
     def onPbExportClicked(self):
         if self.cbLocations.currentIndex() > -1:
             self._save_location_soillayers(self.cbLocations.currentIndex())
-        filename = QtWidgets.QFileDialog.getSaveFileName(self, 'Save soilprofiles', "soilprofiles.csv", "csv files (*.csv)")[0]
+        filename = QtWidgets.QFileDialog.getSaveFileName(self, 'Save soilprofiles', "soilprofiles.csv", "csv files (*.csv);;Parquet files (*.parquet);;Feather files (*.feather)")[0]
 
         if filename == "":
             return
         
-        self.project.export_to_dam(filename)
+        try:
+            self.project.export_to_dam(filename)
+        except Exception as e:
+            QtWidgets.QMessageBox.warning(self, "HDSR tool", f"Fout bij het wegschrijven van de grondopbouw, '{e}'")
+            return
         QtWidgets.QMessageBox.information(self, "HDSR tool", f"Grondopbouw weggeschreven naar bestand '{filename}'") 
 
+    def onPbExportGpkgClicked(self):
+        if self.cbLocations.currentIndex() > -1:
+            self._save_location_soillayers(self.cbLocations.currentIndex())
+        filename = QtWidgets.QFileDialog.getSaveFileName(self, 'Save GeoPackage', "hdsr_tool.gpkg", "GeoPackage files (*.gpkg)")[0]
+
+        if filename == "":
+            return
+
+        self.project.export_to_geopackage(filename)
+
+        # show the soil investigations and the locations on the map
+        for layername in ["soilinvestigations", "locations"]:
+            layer = QgsVectorLayer(f"{filename}|layername={layername}", layername, "ogr")
+            if layer.isValid():
+                QgsProject.instance().addMapLayer(layer)
+
+        QtWidgets.QMessageBox.information(self, "HDSR tool", f"Grondonderzoek en locaties weggeschreven naar bestand '{filename}'")
+
+
+    def onPbCrossSectionClicked(self):
+        if len(self.project.locations) < 2:
+            QtWidgets.QMessageBox.warning(self, "HDSR tool", "Er zijn minimaal 2 locaties nodig voor een lengteprofiel.")
+            return
+
+        hits = self.project.get_corridor(self.spSearchDistance.value())
+        if len(hits) == 0:
+            QtWidgets.QMessageBox.warning(self, "HDSR tool", "Er is geen grondonderzoek gevonden langs het traject, verruim de zoekafstand.")
+            return
+
+        dialog = QtWidgets.QDialog(self)
+        dialog.setWindowTitle(f"Lengteprofiel ({len(hits)} grondonderzoeken)")
+        dialog.resize(1200, 600)
+        figure = Figure()
+        canvas = FigureCanvas(figure)
+        layout = QtWidgets.QVBoxLayout(dialog)
+        layout.addWidget(NavigationToolbar(canvas, dialog))
+        layout.addWidget(canvas)
+
+        ax = figure.add_subplot(1, 1, 1)
+        plot_cross_section(ax, self.project, hits, QC_MAX, PLOT_Y_MIN, BOREHOLE_COLORS, location_chainages=self.project.location_chainage().tolist())
+        canvas.draw()
+        dialog.show()
+
+    def onPbLayerOverviewClicked(self):
+        if not self.project.has_locations:
+            return
+        if self.cbLocations.currentIndex() > -1:
+            self._save_location_soillayers(self.cbLocations.currentIndex())
+
+        dialog = QtWidgets.QDialog(self)
+        dialog.setWindowTitle(f"Overzicht grondopbouw ({len(self.project.locations)} locaties)")
+        dialog.resize(1200, 600)
+        figure = Figure()
+        canvas = FigureCanvas(figure)
+        layout = QtWidgets.QVBoxLayout(dialog)
+        layout.addWidget(NavigationToolbar(canvas, dialog))
+        layout.addWidget(canvas)
+
+        # clicking on a location selects it in this dialog
+        self._layer_view = LocationProfileView(
+            figure.add_subplot(1, 1, 1), self.project.locations, self.project.soiltypes, on_select=self.cbLocations.setCurrentIndex
+        )
+        self._layer_view.set_current(self.cbLocations.currentIndex())
+        dialog.finished.connect(self._onLayerOverviewClosed)
+        canvas.draw()
+        dialog.show()
+
+    def _onLayerOverviewClosed(self):
+        self._layer_view = None
 
     def onPbResetClicked(self):
         self.tableWidget.setRowCount(0)
         self._save_location_soillayers(self.cbLocations.currentIndex())
 
     def onPbUpdateClicked(self):
+        # the files are read while the directories are searched so the total is unknown, show a busy bar
+        self.pbarMain.setMaximum(0)
         self.pbarMain.setValue(0)
-        # find all cpt and borehole files
-        cpt_files = case_insensitive_glob(SONDERINGEN_MAP, ".gef")
-        borehole_files = case_insensitive_glob(BORINGEN_MAP, ".gef")
-        self.pbarMain.setMaximum(len(cpt_files) + len(borehole_files))
 
         sis = []
-        for i, cptfile in enumerate(cpt_files):
-            self.pbarMain.setValue(i)
-            si = SoilInvestigation.from_file(cptfile)
-            if si is not None: 
-                si.stype = SoilInvestigationEnum.CPT # todo, kan ook uit GEF gelezen worden maar omdat GEF niet altijd betrouwbaar is maar even zo gedaan
-                sis.append(si)
-            
-        for boreholefile in borehole_files:
-            self.pbarMain.setValue(self.pbarMain.value() + 1)
-            si = SoilInvestigation.from_file(boreholefile)
-
-            if si is not None:
-                si.stype = SoilInvestigationEnum.BOREHOLE
-                sis.append(si)
-        
-        self.project.soilinvestigations = sis
+        # files that did not change since the last update are not read again
+        known = {si.filename: si for si in self.project.soilinvestigations}
+        # todo, stype kan ook uit GEF gelezen worden maar omdat GEF niet altijd betrouwbaar is maar even zo gedaan
+        for root, stype in [(SONDERINGEN_MAP, SoilInvestigationEnum.CPT), (BORINGEN_MAP, SoilInvestigationEnum.BOREHOLE)]:
+            for i, (_, si) in enumerate(SoilInvestigation.iter_from_files(iter_files(root, ".gef"), stype=stype, known=known)):
+                if si is not None:
+                    sis.append(si)
+                if i % 100 == 0:
+                    QtWidgets.QApplication.processEvents()
+
+        # remove copies of the same soil investigation so they do not take up the plots,
+        # only the results of the locations near new, changed or removed soil investigations are invalidated
+        self.project.set_soilinvestigations(deduplicate(sis))
+        num_duplicates = len(sis) - len(self.project.soilinvestigations)
+        self.pbarMain.setMaximum(100)
         self.pbarMain.setValue(0)
-        QtWidgets.QMessageBox.information(self, "HDSR tool", f"Er zijn {len(self.project.cpts)} sonderingen en {len(self.project.boreholes)} boringen gevonden") 
+        QtWidgets.QMessageBox.information(self, "HDSR tool", f"Er zijn {len(self.project.cpts)} sonderingen en {len(self.project.boreholes)} boringen gevonden ({num_duplicates} dubbele bestanden overgeslagen)") 
 
     
     def _update_closest_soilinvestigations(self):
         self._clear_figure()
 
         self.soilinvestigations = []                
-        loc = self.project.locations[self.cbLocations.currentIndex()]
 
         if len(self.project.soilinvestigations) == 0:
             QtWidgets.QMessageBox.warning(self, "HDSR tool", "Er is geen grondonderzoek gevonden, heb je 'update grondonderzoek' uitgevoerd?")     
             return      
 
         # use project to find the closest ones
-        sis = self.project.get_closest(loc.x_rd, loc.y_rd, max_distance=self.spSearchDistance.value(), num=self.num_soilinvestigations_to_show)
+        sis = self.project.get_location_closest(self.cbLocations.currentIndex(), max_distance=self.spSearchDistance.value(), num=self.num_soilinvestigations_to_show)
 
         if len(sis) == 0:
             QtWidgets.QMessageBox.warning(self, "HDSR tool", "Er is geen grondonderzoek gevonden, verruim de zoekafstand.")     
@@ -240,6 +328,24 @@ class HDSRToolDialog(QtWidgets.QDialog, FORM_CLASS):
         if self.project.has_locations:
             self.cbLocations.setCurrentIndex(len(self.project.locations) - 1)
 
+    def onPbNextTodoClicked(self):
+        if self._location_model is None or not self.project.has_locations:
+            return
+        # save first so the status of the current location is up to date
+        self._save_location_soillayers(self.cbLocations.currentIndex())
+        index = self._location_model.status.next_todo(self.cbLocations.currentIndex())
+        if index == -1:
+            QtWidgets.QMessageBox.information(self, "HDSR tool", "Alle locaties hebben een grondopbouw.")
+        elif index != self.cbLocations.currentIndex():
+            self.cbLocations.setCurrentIndex(index)
+
+    def _set_locations(self):
+        # the previous index belongs to the old locations, do not save the table to the new locations
+        self._prev_index = -1
+        self._location_model = set_location_model(self.cbLocations, self.project.locations)
+        self.cbLocations.setCurrentIndex(0 if self.project.has_locations else -1)
+        self._prev_index = self.cbLocations.currentIndex()
+
     def onPbLocationsClicked(self):
         # this is a workaround a bug from matplotlib which does not allow negative sized figures
         # which happens if you initialize the figure in the constructor so we now create this 
@@ -259,13 +365,19 @@ class HDSRToolDialog(QtWidgets.QDialog, FORM_CLASS):
 
         # first reset the current project
         self.project.reset()
-        self.cbLocations.clear()
-        
-        self.project.locations_from_csvfile(filename)
-        if len(self.project.locations) > 0:
-            self.cbLocations.addItems([l.name for l in self.project.locations])            
-            self.cbLocations.setCurrentIndex(0)
         
+        try:
+            errors = self.project.locations_from_csvfile(filename)
+        except Exception as e: # log errors to the Python console in QGis
+            print(f"Could not read locations file '{filename}', got error '{e}'")
+            QtWidgets.QMessageBox.warning(self, "HDSR tool", f"Het bestand '{filename}' kon niet gelezen worden, zie de Python console voor details.")
+            errors = []
+        for error in errors: # log errors to the Python console in QGis
+            print(f"Could not read location from line {error.linenumber} '{error.line}', {error.message}")
+        if len(errors) > 0:
+            QtWidgets.QMessageBox.warning(self, "HDSR tool", f"{len(errors)} regels in '{filename}' konden niet gelezen worden, zie de Python console voor details.")
+
+        self._set_locations()
         self._afterUpdateLocation()
 
     def onFigureMouseClicked(self, e):
@@ -298,9 +410,7 @@ class HDSRToolDialog(QtWidgets.QDialog, FORM_CLASS):
             self.tableWidget.setItem(self.tableWidget.rowCount()-1, 0, QtWidgets.QTableWidgetItem(f"{lastvalue}"))
             self.tableWidget.setItem(self.tableWidget.rowCount()-1, 1, QtWidgets.QTableWidgetItem(f"{value:.2f}"))
 
-        cbSoillayers = QtWidgets.QComboBox()
-        cbSoillayers.addItems([st.name for st in self.project.soiltypes])
-        self.tableWidget.setCellWidget(self.tableWidget.rowCount()-1,2,cbSoillayers)        
+        self.tableWidget.setItem(self.tableWidget.rowCount()-1, 2, self._soiltype_delegate.item(self._soiltype_delegate.default_name))
 
     def remove_last_from_table(self):
         if self.tableWidget.rowCount() > 0:
@@ -314,7 +424,7 @@ class HDSRToolDialog(QtWidgets.QDialog, FORM_CLASS):
                     try:
                         top = float(self.tableWidget.item(i,0).text())
                         bottom = float(self.tableWidget.item(i,1).text())
-                        name = self.tableWidget.cellWidget(i,2).currentText()          
+                        name = self.tableWidget.item(i,2).text()
                         self.project.locations[index].soillayers.append(SoilLayer(
                             z_top = top,
                             z_bottom = bottom,
@@ -322,6 +432,8 @@ class HDSRToolDialog(QtWidgets.QDialog, FORM_CLASS):
                         ))          
                     except Exception as e: # log any errors to the python console
                         print(f"Error trying to save a soillayer to the location; {e}")
+            if self._location_model is not None:
+                self._location_model.update_location(index)
     
     def _afterUpdateLocation(self):
         if self.cbLocations.currentIndex() > -1:
@@ -333,16 +445,7 @@ class HDSRToolDialog(QtWidgets.QDialog, FORM_CLASS):
             for i in range(len(location.soillayers)):
                 self.tableWidget.setItem(i, 0, QtWidgets.QTableWidgetItem(f"{location.soillayers[i].z_top:.2f}"))
                 self.tableWidget.setItem(i, 1, QtWidgets.QTableWidgetItem(f"{location.soillayers[i].z_bottom:.2f}"))
-                cbSoillayers = QtWidgets.QComboBox()
-                cbSoillayers.addItems([st.name for st in self.project.soiltypes])
-                try:
-                    index = [st.name for st in self.project.soiltypes].index(location.soillayers[i].soilcode)
-                    cbSoillayers.setCurrentIndex(index)
-                except Exception as e:
-                    cbSoillayers.setCurrentIndex(0)
-                    print(f"Error,could not find soilname '{location.soillayers[i].soilcode}' in the given resources, got error '{e}'")                
-                    
-                self.tableWidget.setCellWidget(i,2,cbSoillayers) 
+                self.tableWidget.setItem(i, 2, self._soiltype_delegate.item(location.soillayers[i].soilcode))
 
             self.soilinvestigations = []
 
@@ -352,6 +455,7 @@ class HDSRToolDialog(QtWidgets.QDialog, FORM_CLASS):
    
     def _updateUI(self):
         soiltypes = self.project.soiltypes
+        self._soiltype_delegate.set_soiltypes(soiltypes)
         self.tableSoiltypes.setRowCount(len(soiltypes))
         for i, soiltype in enumerate(soiltypes):
             self.tableSoiltypes.setItem(i,0,QtWidgets.QTableWidgetItem(soiltype.name))   
@@ -373,62 +477,53 @@ class HDSRToolDialog(QtWidgets.QDialog, FORM_CLASS):
     def _update_figure(self):
         self._figure.clear()        
 
+        # the last panel shows the interpolated profile at the location
+        profile = None
+        if self.cbLocations.currentIndex() > -1:
+            try:
+                profile = self.project.get_location_profile(self.cbLocations.currentIndex(), max_distance=self.spSearchDistance.value(), num=self.num_soilinvestigations_to_show)
+            except Exception as e: # log any errors to the python console
+                print(f"Error creating the interpolated profile; {e}")
+
         axs = []
-        num = 101 + len(self.soilinvestigations) * 10 # this will create the second number of the subplot which are the num of columns
-        for i in range(len(self.soilinvestigations)):
+        numcols = len(self.soilinvestigations) + (1 if profile is not None else 0)
+        for i in range(numcols):
             if i > 0:
-                axs.append(self._figure.add_subplot(num+i, sharey=axs[0]))
+                axs.append(self._figure.add_subplot(1, numcols, i+1, sharey=axs[0]))
             else:
-                axs.append(self._figure.add_subplot(num+i))
+                axs.append(self._figure.add_subplot(1, numcols, i+1))
         
+        # the soil investigations are drawn as cached images which is a lot faster than drawing them again
+        width, height = self._canvas.width() / max(numcols, 1), self._canvas.height()
+        z_top = None
         for i, msi in enumerate(self.soilinvestigations):
             dist, si = msi[0], msi[1]
-            if si.stype == SoilInvestigationEnum.CPT:                
-                try:
-                    cpt = CPT.from_file(si.filename)
-                    axs[i].title.set_text(f"{cpt.name} ({int(dist)}m)")
-                    qcs = [min(qc, QC_MAX) for qc in cpt.qc]
-
-                    zs = [z for z in cpt.z if z > PLOT_Y_MIN]
-
-                    axs[i].plot(qcs[:len(zs)], zs, 'k-')                    
-                    rfs = [min(rf, RF_MAX) for rf in cpt.Rf]
-                    axs[i].plot(rfs[:len(zs)], zs, 'g--') 
+            try:
+                if si.stype == SoilInvestigationEnum.CPT:
+                    key = panel_key(si, width, height, QC_MAX, RF_MAX, PLOT_Y_MIN)
+                    panel = self._panel_cache.get(key, lambda: render_cpt_panel(self.project.load_cpt(si.filename), width, height, QC_MAX, RF_MAX, PLOT_Y_MIN))
                     axs[i].grid(axis="both")
-                    axs[i].set_xlim(0, QC_MAX)
-                except:
-                    pass
-            else:
-                try:
-                    borehole = Borehole.from_file(si.filename)                    
-                    axs[i].title.set_text(f"{borehole.name} ({int(dist)}m)")
-
-                    for soillayer in borehole.soillayers:
-                        if soillayer.z_top < PLOT_Y_MIN:
-                            break
-
-                        if soillayer.z_bottom < PLOT_Y_MIN:
-                            soillayer.z_bottom = PLOT_Y_MIN
-
-
-                        if len(soillayer.short_soilcode) > 0 and soillayer.short_soilcode[0] in BOREHOLE_COLORS.keys():
-                            color = BOREHOLE_COLORS[soillayer.short_soilcode[0]]
-                        else:
-                            color = "#ccccc8"
-                        axs[i].add_patch(
-                            patches.Rectangle(
-                                (0.1, soillayer.z_bottom),
-                                0.8,
-                                soillayer.height,
-                                fill=True,                                    
-                                facecolor=color,
-                                edgecolor="#000"
-                            )                        
-                        )
-                        axs[i].text(0.1, soillayer.z_bottom + 0.1, soillayer.short_soilcode)
-                        
-                except Exception as e:
-                    print(e)
-                    pass     
+                else:
+                    key = panel_key(si, width, height, BOREHOLE_COLORS, PLOT_Y_MIN)
+                    panel = self._panel_cache.get(key, lambda: render_borehole_panel(self.project.load_borehole(si.filename), width, height, BOREHOLE_COLORS, PLOT_Y_MIN))
+
+                axs[i].imshow(panel.image, extent=panel.extent, aspect="auto", interpolation="nearest")
+                axs[i].title.set_text(f"{panel.title} ({int(dist)}m)")
+                axs[i].set_xlim(panel.extent[0], panel.extent[1])
+                z_top = panel.extent[3] if z_top is None else max(z_top, panel.extent[3])
+            except Exception as e: # log any errors to the python console
+                print(e)
+
+        if z_top is not None:
+            axs[0].set_ylim(PLOT_Y_MIN, z_top)
+
+        if profile is not None:
+            data = profile.as_numpy()
+            data = data[data[:,0] > PLOT_Y_MIN]
+            axs[-1].title.set_text(f"interpolatie ({len(profile.sources)} sond.)")
+            axs[-1].plot(np.minimum(data[:,1], QC_MAX), data[:,0], 'k-')
+            axs[-1].plot(np.minimum(data[:,2], RF_MAX), data[:,0], 'g--')
+            axs[-1].grid(axis="both")
+            axs[-1].set_xlim(0, QC_MAX)
 
         self._canvas.draw()
@@ -1,10 +1,262 @@
-from typing import List
+from typing import List, Tuple, IO, Iterator
+from fnmatch import fnmatch
 from pathlib import Path
+import io
+import os
+import zipfile
 
-def case_insensitive_glob(filepath: str, fileextension: str) -> List[Path]:
-    p = Path(filepath)
+# files inside archives are referenced as 'archive.zip!folder/member.gef'
+ARCHIVE_SEPARATOR = "!"
+ARCHIVE_EXTENSIONS = [".zip"]
+
+
+def split_archive_path(filename: str) -> Tuple[str, str]:
+    """
+    Split a filename into the archive and the member in the archive
+
+    Args:
+        filename (str): filename like 'archive.zip!member.gef' or a normal filename
+
+    Returns:
+        Tuple[str, str]: the archive and the member or the filename and an empty string if this is not an archive path
+    """
+    filename = str(filename)
+    if filename.find(ARCHIVE_SEPARATOR) > -1:
+        archive, member = filename.split(ARCHIVE_SEPARATOR, 1)
+        if Path(archive).suffix.lower() in ARCHIVE_EXTENSIONS:
+            # zip members always use forward slashes, Path on Windows does not
+            return archive, member.replace("\\", "/")
+    return filename, ""
+
+
+def is_archive_path(filename: str) -> bool:
+    return split_archive_path(filename)[1] != ""
+
+
+def open_text(filename: str, encoding: str = "latin-1", errors: str = "strict", zfile: zipfile.ZipFile = None) -> IO[str]:
+    """
+    Open a normal file or a file inside a zip archive as a text stream without extracting the archive
+
+    Args:
+        filename (str): the filename, use 'archive.zip!member.gef' for files in archives
+        encoding (str): the encoding of the file
+        errors (str): how to handle encoding errors
+        zfile (zipfile.ZipFile): an already opened archive to read the member from (optional)
+
+    Returns:
+        IO[str]: the text stream, the caller is responsible for closing it
+    """
+    archive, member = split_archive_path(filename)
+    if member == "":
+        return open(archive, "r", encoding=encoding, errors=errors)
+
+    if zfile is not None:
+        return io.TextIOWrapper(zfile.open(member), encoding=encoding, errors=errors)
+
+    # the member stream keeps the underlying file open after the archive is closed
+    with zipfile.ZipFile(archive) as zf:
+        return io.TextIOWrapper(zf.open(member), encoding=encoding, errors=errors)
+
+
+def file_signature(filename: str) -> Tuple[float, int]:
+    """
+    Return the modification time and size of a file (or the archive that contains it) to detect changes
+
+    Args:
+        filename (str): the filename, use 'archive.zip!member.gef' for files in archives
+
+    Returns:
+        Tuple[float, int]: modification time and size
+    """
+    stat = os.stat(split_archive_path(filename)[0])
+    return stat.st_mtime, stat.st_size
+
+
+def read_lines(filename: str, encoding: str = "latin-1", errors: str = "strict") -> List[str]:
+    with open_text(filename, encoding=encoding, errors=errors) as f:
+        return f.readlines()
+
+
+def read_tail(filename: str, stream: IO[str] = None, num_lines: int = 1, blocksize: int = 8192) -> List[str]:
+    """
+    Return the last non empty lines of a file, for normal files only the end of the file is read,
+    for archive members the remainder of the (optional) open stream is consumed
+
+    Args:
+        filename (str): the filename, use 'archive.zip!member.gef' for files in archives
+        stream (IO[str]): an open text stream of the file that may be consumed (optional)
+        num_lines (int): the maximum number of lines to return
+        blocksize (int): the number of bytes to read from the end of normal files
+
+    Returns:
+        List[str]: the last non empty lines (stripped), can be less than num_lines
+    """
+    archive, member = split_archive_path(filename)
+    if member == "":
+        with open(archive, "rb") as f:
+            f.seek(0, 2)
+            size = f.tell()
+            f.seek(max(0, size - blocksize))
+            lines = f.read().decode("latin-1").splitlines()
+            if size > blocksize: # the first line is incomplete
+                lines = lines[1:]
+    elif stream is not None:
+        lines = stream.read().splitlines()
+    else:
+        lines = read_lines(filename)
+
+    lines = [line.strip() for line in lines if len(line.strip()) > 0]
+    return lines[-num_lines:] if num_lines > 0 else []
+
+
+def read_last_line(filename: str, stream: IO[str] = None) -> str:
+    lines = read_tail(filename, stream, num_lines=1)
+    return lines[0] if len(lines) > 0 else ""
+
+
+def file_size(filename: str, zfile: zipfile.ZipFile = None) -> int:
+    """
+    Return the (uncompressed) size of a file in bytes
+
+    Args:
+        filename (str): the filename, use 'archive.zip!member.gef' for files in archives
+        zfile (zipfile.ZipFile): the opened archive if the file is an archive member (optional)
+
+    Returns:
+        int: the size in bytes
+    """
+    archive, member = split_archive_path(filename)
+    if member == "":
+        return os.stat(archive).st_size
+    if zfile is not None:
+        return zfile.getinfo(member).file_size
+    with zipfile.ZipFile(archive) as zf:
+        return zf.getinfo(member).file_size
+
+
+def archive_members(archive: str, fileextension: str) -> List[str]:
+    """
+    Return the archive paths of all members with the given extension
+
+    Args:
+        archive (str): the filename of the archive
+        fileextension (str): the extension to look for (case insensitive)
+
+    Returns:
+        List[str]: the files as 'archive.zip!member.gef'
+    """
     result = []
-    for filename in p.glob('**/*'):
-        if str(filename.suffix).lower() == fileextension.lower():
-            result.append(filename.absolute())
-    return result
\ No newline at end of file
+    try:
+        with zipfile.ZipFile(archive) as zf:
+            for info in zf.infolist():
+                if info.is_dir():
+                    continue
+                if Path(info.filename).suffix.lower() == fileextension.lower():
+                    result.append(f"{archive}{ARCHIVE_SEPARATOR}{info.filename}")
+    except Exception as e: # log errors to the Python console in QGis
+        print(f"Could not read archive '{archive}', got error '{e}'")
+    return result
+
+
+class FileEntry:
+    """
+    A file found by iter_files with the stat information of the file on disk, for archive members
+    this is the stat information of the archive (like file_signature)
+    """
+    __slots__ = ["filename", "mtime", "size"]
+
+    def __init__(self, filename: str, mtime: float, size: int):
+        self.filename = filename
+        self.mtime = mtime
+        self.size = size
+
+    def __str__(self) -> str:
+        return self.filename
+
+    def __repr__(self) -> str:
+        return f"FileEntry('{self.filename}', {self.mtime}, {self.size})"
+
+    @property
+    def signature(self) -> Tuple[float, int]:
+        """The same value as file_signature(filename) without another stat call"""
+        return self.mtime, self.size
+
+
+def _matches(name: str, patterns: List[str]) -> bool:
+    name = name.lower()
+    return any(fnmatch(name, pattern.lower()) for pattern in patterns)
+
+
+def iter_files(
+        root: str,
+        fileextension: str,
+        include: List[str] = None,
+        exclude: List[str] = None,
+        exclude_dirs: List[str] = None,
+        include_archives: bool = True
+    ) -> Iterator[FileEntry]:
+    """
+    Yield the files with the given extension (case insensitive) in the directory and all subdirectories
+    while the directories are read so the caller can start processing before the traversal is done,
+    the stat information of os.scandir is returned with each file so no extra stat calls are needed
+
+    Directories that match exclude_dirs are not entered, symbolic links to directories are not followed
+    and directories that can not be read are skipped with a message
+
+    Args:
+        root (str): the directory to search
+        fileextension (str): the extension like '.gef'
+        include (List[str]): only return files with a name that matches one of these patterns like 'CPT*' (optional)
+        exclude (List[str]): skip files with a name that matches one of these patterns (optional)
+        exclude_dirs (List[str]): skip directories with a name that matches one of these patterns like '.*' or 'archief' (optional)
+        include_archives (bool): also return the members of zip archives as 'archive.zip!member.gef'
+
+    Returns:
+        Iterator[FileEntry]: the files with their absolute path
+    """
+    fileextension = fileextension.lower()
+    include, exclude, exclude_dirs = include or [], exclude or [], exclude_dirs or []
+
+    stack = [os.path.abspath(root)]
+    while len(stack) > 0:
+        directory = stack.pop()
+        subdirectories = []
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        if not _matches(entry.name, exclude_dirs):
+                            subdirectories.append(entry.path)
+                        continue
+
+                    suffix = os.path.splitext(entry.name)[1].lower()
+                    is_archive = include_archives and suffix in ARCHIVE_EXTENSIONS
+                    if suffix != fileextension and not is_archive:
+                        continue
+                    if not entry.is_file():
+                        continue
+                    stat = entry.stat()
+
+                    if suffix == fileextension:
+                        if len(include) > 0 and not _matches(entry.name, include):
+                            continue
+                        if _matches(entry.name, exclude):
+                            continue
+                        yield FileEntry(entry.path, stat.st_mtime, stat.st_size)
+                    else:
+                        for member in archive_members(entry.path, fileextension):
+                            name = member.rsplit("/", 1)[-1]
+                            if len(include) > 0 and not _matches(name, include):
+                                continue
+                            if _matches(name, exclude):
+                                continue
+                            yield FileEntry(member, stat.st_mtime, stat.st_size)
+        except OSError as e: # log errors to the Python console in QGis
+            print(f"Could not read directory '{directory}', got error '{e}'")
+
+        # depth first in alphabetical order
+        stack += sorted(subdirectories, reverse=True)
+
+
+def case_insensitive_glob(filepath: str, fileextension: str, include_archives: bool = True) -> List[Path]:
+    return [Path(entry.filename) for entry in iter_files(filepath, fileextension, include_archives=include_archives)]
@@ -0,0 +1,103 @@
+from pydantic import BaseModel
+from typing import List, Optional, TYPE_CHECKING
+import numpy as np
+
+if TYPE_CHECKING:
+    from .cpt import CPT
+
+# default vertical resolution of the interpolated profiles
+DEFAULT_DZ = 0.05
+# inverse distance power
+DEFAULT_POWER = 2.0
+# distances below this value are clipped to avoid infinite weights
+MIN_DISTANCE = 0.1
+
+
+class InterpolatedProfile(BaseModel):
+    x_rd: float
+    y_rd: float
+
+    z: List[float] = []
+    qc: List[float] = []
+    Rf: List[float] = []
+
+    sources: List[str] = []
+    distances: List[float] = []
+    weights: List[float] = []
+
+    def as_numpy(self) -> np.array:
+        """
+        Return the profile as a numpy array with columns z, qc, Rf
+
+        Args:
+            None
+
+        Returns:
+            np.array: the profile as a numpy array"""
+        return np.transpose(np.array([self.z, self.qc, self.Rf]))
+
+
+def common_z_grid(z_top: float, z_bottom: float, dz: float = DEFAULT_DZ) -> np.ndarray:
+    """
+    Return the levels of a z grid from z_top down to z_bottom with step dz, the levels
+    are multiples of dz so grids with the same dz line up
+
+    Args:
+        z_top (float): highest level
+        z_bottom (float): lowest level
+        dz (float): step size
+
+    Returns:
+        np.ndarray: the levels from top to bottom
+    """
+    top = np.floor(z_top / dz) * dz
+    bottom = np.ceil(z_bottom / dz) * dz
+    return np.round(np.arange(top, bottom - dz / 2, -dz), 6)
+
+
+def idw_profile(cpts: List['CPT'], distances: np.ndarray, z: np.ndarray = None, dz: float = DEFAULT_DZ, power: float = DEFAULT_POWER) -> Optional[InterpolatedProfile]:
+    """
+    Return the inverse distance weighted qc and Rf profile of the given CPTs, the CPTs are
+    resampled on a common z grid and combined without looping over the readings, levels that
+    are not covered by any CPT get nan values
+
+    Args:
+        cpts (List[CPT]): the CPTs
+        distances (np.ndarray): the distance of each CPT to the point of interest
+        z (np.ndarray): the z grid, if not given the grid covers all CPTs with step dz (optional)
+        dz (float): step size of the generated z grid
+        power (float): the inverse distance power
+
+    Returns:
+        InterpolatedProfile: the profile (x_rd and y_rd are set to 0.0) or None if there are no CPTs with data
+    """
+    valid = [i for i, cpt in enumerate(cpts) if len(cpt.z) > 1]
+    if len(valid) == 0:
+        return None
+    cpts = [cpts[i] for i in valid]
+    distances = np.asarray(distances, dtype=float)[valid]
+
+    if z is None:
+        z = common_z_grid(max([cpt.z_top for cpt in cpts]), min([cpt.z_min for cpt in cpts]), dz)
+
+    # stacked (num_cpts, num_levels) arrays of the resampled channels
+    data = np.stack([cpt.resample(z) for cpt in cpts])
+    qc, rf = data[:,:,1], data[:,:,3]
+
+    weights = 1.0 / np.power(np.maximum(distances, MIN_DISTANCE), power)
+    w = np.where(np.isnan(qc), 0.0, weights[:,None])
+    wsum = w.sum(axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        qc_result = np.where(wsum > 0, (w * np.nan_to_num(qc)).sum(axis=0) / wsum, np.nan)
+        rf_result = np.where(wsum > 0, (w * np.nan_to_num(rf)).sum(axis=0) / wsum, np.nan)
+
+    return InterpolatedProfile.construct(
+        x_rd = 0.0,
+        y_rd = 0.0,
+        z = z.tolist(),
+        qc = qc_result.tolist(),
+        Rf = rf_result.tolist(),
+        sources = [cpt.filename for cpt in cpts],
+        distances = distances.tolist(),
+        weights = (weights / weights.sum()).tolist()
+    )
@@ -0,0 +1,161 @@
+from pydantic import BaseModel
+from typing import List, Dict, Tuple, Callable, TYPE_CHECKING
+import numpy as np
+
+from .soilinvestigation import SoilInvestigationEnum
+
+if TYPE_CHECKING:
+    from .location import Location
+
+# the CPT channels (columns of CPT.as_numpy) that are summarized per layer
+STATISTICS_CHANNELS = {"qc": 1, "fs": 2, "Rf": 3, "u": 4}
+
+# the statistics per channel, pct is the (linearly interpolated) percentile of LayerStatistics.percentile
+STATISTICS_TYPES = ["mean", "min", "pct"]
+
+STATISTICS_COLUMNS = [f"{channel}_{stat}" for channel in STATISTICS_CHANNELS.keys() for stat in STATISTICS_TYPES]
+
+# default percentile, the lower characteristic value
+DEFAULT_PERCENTILE = 5.0
+
+
+class LayerStatistics(BaseModel):
+    """
+    The statistics of the readings of the nearest CPTs within one soillayer of a location, the
+    layer levels are stored so statistics of changed soillayers can be recognized
+    """
+    z_top: float
+    z_bottom: float
+    num_cpts: int
+    num_values: int
+    percentile: float
+    max_distance: float = 100.0 # the search distance of the CPTs
+    num: int = 4 # the maximum number of CPTs
+    values: Dict[str, float] = {} # see STATISTICS_COLUMNS, nan if there are no readings
+
+    def matches(self, soillayer) -> bool:
+        return abs(self.z_top - soillayer.z_top) < 1e-6 and abs(self.z_bottom - soillayer.z_bottom) < 1e-6
+
+
+def segment_statistics(segments: np.ndarray, values: np.ndarray, num_segments: int, percentile: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Return the number of values, the mean, the minimum and the percentile of the values per segment,
+    the values are sorted once on segment and value so all segments are reduced at once
+
+    Args:
+        segments (np.ndarray): the segment (0..num_segments-1) of each value
+        values (np.ndarray): the values, nan values are ignored
+        num_segments (int): the number of segments
+        percentile (float): the percentile (0-100)
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]: count, mean, min and percentile per segment, nan for empty segments
+    """
+    valid = np.isfinite(values)
+    segments, values = segments[valid], values[valid]
+    order = np.lexsort((values, segments))
+    segments, values = segments[order], values[order]
+
+    counts = np.bincount(segments, minlength=num_segments)
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    filled = counts > 0
+
+    mean, minimum, pct = np.full(num_segments, np.nan), np.full(num_segments, np.nan), np.full(num_segments, np.nan)
+    if len(values) == 0:
+        return counts, mean, minimum, pct
+
+    # reduceat needs increasing start indices so only reduce the filled segments
+    starts, n = starts[filled], counts[filled]
+    mean[filled] = np.add.reduceat(values, starts) / n
+    minimum[filled] = values[starts] # sorted within the segment
+
+    position = starts + percentile / 100.0 * (n - 1)
+    lower = np.floor(position).astype(np.int64)
+    upper = np.minimum(lower + 1, starts + n - 1)
+    pct[filled] = values[lower] + (values[upper] - values[lower]) * (position - lower)
+    return counts, mean, minimum, pct
+
+
+def compute_layer_statistics(
+        project,
+        locations: List['Location'],
+        max_distance: float = 100.0,
+        num: int = 4,
+        percentile: float = DEFAULT_PERCENTILE,
+        on_closest: Callable[[int, list], None] = None
+    ) -> List[List[LayerStatistics]]:
+    """
+    Return the statistics of the readings of the nearest CPTs per soillayer for all locations, the
+    readings of all locations are collected first and reduced in one pass per channel
+
+    A reading belongs to the layer with z_bottom <= z <= z_top, readings outside the soillayers are ignored
+
+    Args:
+        project (Project): the project used to find and read the CPTs
+        locations (List[Location]): the locations
+        max_distance (float): only use CPTs within this distance
+        num (int): the maximum number of CPTs per location
+        percentile (float): the percentile (0-100) to compute
+        on_closest (Callable[[int, list], None]): called with the index of each location with soillayers and its closest CPTs (optional)
+
+    Returns:
+        List[List[LayerStatistics]]: the statistics for each soillayer of each location
+    """
+    segment_parts, data_parts, num_cpts = [], [], []
+    num_segments = 0
+    for i, location in enumerate(locations):
+        if len(location.soillayers) == 0:
+            num_cpts.append(0)
+            continue
+
+        tops = np.array([sl.z_top for sl in location.soillayers])
+        bottoms = np.array([sl.z_bottom for sl in location.soillayers])
+        n = 0
+        closest = project.get_closest(location.x_rd, location.y_rd, max_distance=max_distance, num=num, stype=SoilInvestigationEnum.CPT)
+        if on_closest is not None:
+            on_closest(i, closest)
+        for _, si in closest:
+            try:
+                data = project.load_cpt(si.filename).as_numpy()
+            except Exception as e: # log errors to the Python console in QGis
+                print(f"Could not read CPT '{si.filename}', got error '{e}'")
+                continue
+            n += 1
+
+            # the layers go down so search on the negative bottoms
+            layer = np.searchsorted(-bottoms, -data[:,0], side="left")
+            inside = layer < len(bottoms)
+            inside[inside] &= data[inside,0] <= tops[layer[inside]]
+            segment_parts.append(layer[inside] + num_segments)
+            data_parts.append(data[inside])
+
+        num_cpts.append(n)
+        num_segments += len(location.soillayers)
+
+    segments = np.concatenate(segment_parts) if len(segment_parts) > 0 else np.zeros(0, dtype=np.int64)
+    data = np.concatenate(data_parts) if len(data_parts) > 0 else np.zeros((0, 5))
+
+    columns, counts = {}, np.zeros(num_segments, dtype=np.int64)
+    for channel, column in STATISTICS_CHANNELS.items():
+        count, mean, minimum, pct = segment_statistics(segments, data[:,column], num_segments, percentile)
+        columns[f"{channel}_mean"], columns[f"{channel}_min"], columns[f"{channel}_pct"] = mean.tolist(), minimum.tolist(), pct.tolist()
+        counts = np.maximum(counts, count)
+    counts = counts.tolist()
+
+    result, segment = [], 0
+    for location, n in zip(locations, num_cpts):
+        stats = []
+        for soillayer in location.soillayers:
+            stats.append(LayerStatistics.construct( # trusted values, skip the pydantic validation
+                z_top = soillayer.z_top,
+                z_bottom = soillayer.z_bottom,
+                num_cpts = n,
+                num_values = counts[segment],
+                percentile = percentile,
+                max_distance = max_distance,
+                num = num,
+                values = {column: columns[column][segment] for column in STATISTICS_COLUMNS}
+            ))
+            segment += 1
+        result.append(stats)
+    return result
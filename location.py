@@ -1,6 +1,8 @@
 from pydantic import BaseModel
 from typing import List
+import numpy as np
 from .soillayer import SoilLayer
+from .layerstats import LayerStatistics
 
 class Location(BaseModel):
     name: str
@@ -8,3 +10,45 @@ class Location(BaseModel):
     y_rd: float
 
     soillayers: List[SoilLayer] = []
+    zone: int = -1 # suggested zone, see Project.compute_zones
+    layer_statistics: List[LayerStatistics] = [] # statistics per soillayer, see Project.compute_layer_statistics
+
+
+class LocationStatus:
+    """
+    Bitmap with the locations that have soillayers, the bitmap is built once and updated
+    for each changed location so the status never needs a scan over all locations
+    """
+
+    def __init__(self, locations: List[Location]):
+        self.done = np.array([len(l.soillayers) > 0 for l in locations], dtype=bool)
+
+    def __len__(self) -> int:
+        return len(self.done)
+
+    @property
+    def num_done(self) -> int:
+        return int(np.count_nonzero(self.done))
+
+    def update(self, index: int, location: Location) -> None:
+        if 0 <= index < len(self.done):
+            self.done[index] = len(location.soillayers) > 0
+
+    def next_todo(self, index: int) -> int:
+        """
+        Return the index of the first location after the given index without soillayers, the search
+        continues at the start of the list
+
+        Args:
+            index (int): the current index
+
+        Returns:
+            int: the index of the next location without soillayers or -1 if all locations have soillayers
+        """
+        todo = np.flatnonzero(~self.done[index + 1:])
+        if len(todo) > 0:
+            return int(todo[0]) + index + 1
+        todo = np.flatnonzero(~self.done[:index + 1])
+        if len(todo) > 0:
+            return int(todo[0])
+        return -1
@@ -0,0 +1,110 @@
+from pydantic import BaseModel
+from typing import List, Iterator
+import csv
+import numpy as np
+import pandas as pd
+
+from .location import Location
+
+LOCATIONS_CSV_SEPARATOR = ";"
+
+# tried in this order if no encoding is given, csv files from Excel on Windows are cp1252 and latin-1 accepts any byte
+LOCATIONS_CSV_ENCODINGS = ["utf-8-sig", "cp1252", "latin-1"]
+
+LOCATION_FIELDS = {"name", "x_rd", "y_rd", "soillayers"}
+
+
+class LocationRowError(BaseModel):
+    linenumber: int # 1 based line number in the file
+    line: str
+    message: str
+
+
+class LocationTable(BaseModel):
+    """
+    The locations of a csv file as columns, the Location objects are only created
+    when they are requested
+    """
+    names: np.ndarray # object array with the names
+    x: np.ndarray
+    y: np.ndarray
+    errors: List[LocationRowError] = []
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def location(self, index: int) -> Location:
+        return Location.construct( # trusted values, skip the pydantic validation
+            _fields_set = LOCATION_FIELDS,
+            name = self.names[index],
+            x_rd = float(self.x[index]),
+            y_rd = float(self.y[index]),
+            soillayers = []
+        )
+
+    def iter_locations(self) -> Iterator[Location]:
+        for name, x, y in zip(self.names.tolist(), self.x.tolist(), self.y.tolist()):
+            yield Location.construct(_fields_set=LOCATION_FIELDS, name=name, x_rd=x, y_rd=y, soillayers=[])
+
+
+def _to_float(column: pd.Series) -> np.ndarray:
+    # Dutch decimal commas are allowed, invalid values become nan
+    return pd.to_numeric(column.str.strip().str.replace(",", ".", regex=False), errors="coerce").to_numpy(dtype=float)
+
+
+def read_locations_csv(filename: str, separator: str = LOCATIONS_CSV_SEPARATOR, encoding: str = None) -> LocationTable:
+    """
+    Read a locations csv file with a header line followed by lines with name;x;y (extra columns
+    are ignored), the coordinates are parsed for all lines at once and the invalid lines are
+    returned as errors instead of stopping the import, empty lines are skipped
+
+    The line in the errors only contains the first three columns
+
+    Args:
+        filename (str): the name of the csv file
+        separator (str): the column separator
+        encoding (str): the encoding of the file, if not given the LOCATIONS_CSV_ENCODINGS are tried in order
+
+    Returns:
+        LocationTable: the valid locations and the errors
+    """
+    encodings = [encoding] if encoding is not None else LOCATIONS_CSV_ENCODINGS
+    for i, enc in enumerate(encodings):
+        try:
+            # only the first three columns are read, extra columns are ignored and missing columns are empty
+            df = pd.read_csv(
+                filename, sep=separator, header=None, skiprows=1, names=range(3), usecols=range(3), index_col=False,
+                dtype=str, keep_default_na=False, skip_blank_lines=False, quoting=csv.QUOTE_NONE, encoding=enc
+            )
+            break
+        except UnicodeDecodeError:
+            if i == len(encodings) - 1:
+                raise
+    df = df[(df[0].str.strip() != "") | (df[1].str.strip() != "") | (df[2].str.strip() != "")] # empty lines
+
+    names = df[0].str.strip()
+    x, y = _to_float(df[1]), _to_float(df[2])
+    missing_name = (names == "").to_numpy()
+    invalid_x, invalid_y = ~np.isfinite(x), ~np.isfinite(y)
+    valid = ~(missing_name | invalid_x | invalid_y)
+
+    errors = []
+    linenumbers = df.index.to_numpy() + 2 # skip the header line and start at 1
+    for i in np.flatnonzero(~valid):
+        row = df.iloc[i].tolist()
+        if missing_name[i]:
+            message = "missing name"
+        else:
+            axis, value = ("x", row[1].strip()) if invalid_x[i] else ("y", row[2].strip())
+            message = f"missing {axis} coordinate" if value == "" else f"invalid {axis} coordinate '{value}'"
+        errors.append(LocationRowError.construct(linenumber=int(linenumbers[i]), line=separator.join(row), message=message))
+
+    return LocationTable(
+        names = names.to_numpy(dtype=object)[valid],
+        x = x[valid],
+        y = y[valid],
+        errors = errors
+    )
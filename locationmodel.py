@@ -0,0 +1,75 @@
+from qgis.PyQt import QtCore, QtGui, QtWidgets
+
+from .location import LocationStatus
+
+# color of the locations that already have soillayers
+LOCATION_DONE_COLOR = "#808080"
+
+
+class LocationListModel(QtCore.QAbstractListModel):
+    """
+    Read only model on the locations of the project, Qt only requests the rows that are
+    visible so no items are created for all locations
+    """
+
+    def __init__(self, locations, parent=None):
+        super(LocationListModel, self).__init__(parent)
+        self.locations = locations
+        self.status = LocationStatus(locations)
+        self._done_brush = QtGui.QBrush(QtGui.QColor(LOCATION_DONE_COLOR))
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.locations)
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid() or index.row() >= len(self.locations):
+            return None
+        if role in (QtCore.Qt.DisplayRole, QtCore.Qt.EditRole):
+            return self.locations[index.row()].name
+        if role == QtCore.Qt.ForegroundRole and self.status.done[index.row()]:
+            return self._done_brush
+        if role == QtCore.Qt.ToolTipRole:
+            tooltip = "grondopbouw gedefinieerd" if self.status.done[index.row()] else "nog geen grondopbouw"
+            zone = self.locations[index.row()].zone
+            return f"{tooltip}, voorgestelde zone {zone}" if zone > -1 else tooltip
+        return None
+
+    def update_location(self, row: int) -> None:
+        """Update the status of the location after changing its soillayers"""
+        if 0 <= row < len(self.locations):
+            self.status.update(row, self.locations[row])
+            index = self.index(row)
+            self.dataChanged.emit(index, index)
+
+
+def set_location_model(combobox: QtWidgets.QComboBox, locations) -> LocationListModel:
+    """
+    Show the locations in the combobox using a LocationListModel, the combobox gets an
+    editable line with a completer that filters the locations on every typed character
+
+    Args:
+        combobox (QtWidgets.QComboBox): the combobox
+        locations (List[Location]): the locations
+
+    Returns:
+        LocationListModel: the model
+    """
+    model = LocationListModel(locations, combobox)
+    combobox.setModel(model)
+    combobox.setEditable(True)
+    combobox.setInsertPolicy(QtWidgets.QComboBox.NoInsert)
+    combobox.view().setUniformItemSizes(True)
+
+    completer = QtWidgets.QCompleter(model, combobox)
+    completer.setCaseSensitivity(QtCore.Qt.CaseInsensitive)
+    completer.setFilterMode(QtCore.Qt.MatchContains)
+    completer.setCompletionMode(QtWidgets.QCompleter.PopupCompletion)
+    completer.popup().setUniformItemSizes(True)
+    combobox.setCompleter(completer)
+    # select the location by row (after the name lookup of the combobox) so locations with the same name can be selected
+    completer.activated[QtCore.QModelIndex].connect(
+        lambda index: combobox.setCurrentIndex(completer.completionModel().mapToSource(index).row())
+    )
+    return model
@@ -0,0 +1,214 @@
+from typing import List, Callable, Tuple
+import numpy as np
+from matplotlib.collections import PolyCollection
+from matplotlib.colors import ListedColormap, NoNorm, to_rgba
+
+from .location import Location
+from .soiltype import SoilType
+
+# above this number of visible locations the layers are drawn as an aggregated raster
+LOD_MAX_COLUMNS = 400
+# vertical resolution of the raster
+LOD_DZ = 0.1
+# width of a location column (1.0 means the columns touch)
+COLUMN_WIDTH = 0.8
+UNKNOWN_COLOR = "#c0c0c0"
+
+
+def layer_matrix(locations: List[Location], names: List[str], z: np.ndarray) -> np.ndarray:
+    """
+    Return the soiltype of each location at each level as an index in names, len(names) for unknown
+    soiltypes and -1 for levels without a soillayer, all soillayers are rasterized at once
+
+    Args:
+        locations (List[Location]): the locations
+        names (List[str]): the soiltype names
+        z (np.ndarray): the levels from top to bottom with a constant step
+
+    Returns:
+        np.ndarray: the soiltypes with one row per location and one column per level
+    """
+    result = np.full((len(locations), len(z)), -1, dtype=np.int16)
+    counts = [len(l.soillayers) for l in locations]
+    if sum(counts) == 0 or len(z) == 0:
+        return result
+
+    index = {name: i for i, name in enumerate(names)}
+    rows = np.repeat(np.arange(len(locations)), counts)
+    tops = np.array([sl.z_top for l in locations for sl in l.soillayers])
+    bottoms = np.array([sl.z_bottom for l in locations for sl in l.soillayers])
+    codes = np.array([index.get(sl.soilcode, len(names)) for l in locations for sl in l.soillayers], dtype=np.int16)
+
+    # the cells with their center within the layer
+    dz = z[0] - z[1] if len(z) > 1 else 1.0
+    first = np.clip(np.ceil((z[0] - tops) / dz).astype(np.int64), 0, len(z))
+    last = np.clip(np.floor((z[0] - bottoms) / dz).astype(np.int64) + 1, 0, len(z))
+    lengths = np.maximum(last - first, 0)
+    cells = np.repeat(first - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+    result[np.repeat(rows, lengths), cells] = np.repeat(codes, lengths)
+    return result
+
+
+def aggregate_columns(matrix: np.ndarray, step: int, num_codes: int) -> np.ndarray:
+    """
+    Return the most common soiltype per level for each group of step locations, levels where no
+    location in the group has a soillayer stay -1
+
+    Args:
+        matrix (np.ndarray): the soiltypes, see layer_matrix
+        step (int): the number of locations per group
+        num_codes (int): the number of soiltypes
+
+    Returns:
+        np.ndarray: the soiltypes with one row per group
+    """
+    if step <= 1:
+        return matrix
+    if num_codes == 0:
+        return np.full(((len(matrix) + step - 1) // step, matrix.shape[1]), -1, dtype=matrix.dtype)
+    num_groups = (len(matrix) + step - 1) // step
+    padded = np.full((num_groups * step, matrix.shape[1]), -1, dtype=matrix.dtype)
+    padded[:len(matrix)] = matrix
+    groups = padded.reshape(num_groups, step, matrix.shape[1])
+    counts = np.stack([np.count_nonzero(groups == code, axis=1) for code in range(num_codes)], axis=0)
+    result = np.argmax(counts, axis=0).astype(matrix.dtype)
+    result[counts.max(axis=0) == 0] = -1
+    return result
+
+
+class LocationProfileView:
+    """
+    Overview of the soillayers of the locations side by side (location i is drawn at x = i), the layers
+    of the visible locations are drawn as one PolyCollection and if more than max_columns locations are
+    visible the most common soiltype per group of locations is shown as one image so zooming and panning
+    stays fast for thousands of locations
+
+    Clicking on a location calls on_select with the index of the location
+
+    Usage:
+        view = LocationProfileView(ax, project.locations, project.soiltypes, on_select=select_location)
+        view.set_current(index)
+    """
+
+    def __init__(
+            self,
+            ax,
+            locations: List[Location],
+            soiltypes: List[SoilType],
+            on_select: Callable[[int], None] = None,
+            index_range: Tuple[int, int] = None,
+            max_columns: int = LOD_MAX_COLUMNS,
+            dz: float = LOD_DZ
+        ):
+        self.ax = ax
+        self.locations = locations
+        self.on_select = on_select
+        self.max_columns = max_columns
+        self.start, self.end = index_range if index_range is not None else (0, len(locations))
+
+        self.names = [st.name for st in soiltypes]
+        colors = [to_rgba(st.color) for st in soiltypes]
+        self._colors = colors + [to_rgba(UNKNOWN_COLOR)]
+
+        tops = [sl.z_top for l in locations for sl in l.soillayers]
+        bottoms = [sl.z_bottom for l in locations for sl in l.soillayers]
+        self.z_top = max(tops) if len(tops) > 0 else 0.0
+        self.z_bottom = min(bottoms) if len(bottoms) > 0 else -1.0
+        self.dz = dz
+        self.z = np.round(self.z_top - (np.arange(max(1, int(np.ceil((self.z_top - self.z_bottom) / dz)))) + 0.5) * dz, 6)
+        self._matrix = None # built on first use
+
+        # the raster values are shifted by one, 0 (no soillayer) is transparent and unknown soiltypes are drawn in UNKNOWN_COLOR
+        self._cmap = ListedColormap([(1.0, 1.0, 1.0, 0.0)] + self._colors)
+        self._image = None
+        self._collection = None
+        self._current = None
+        self._drawn = None
+
+        ax.set_xlim(self.start - 0.5, self.end - 0.5)
+        ax.set_ylim(self.z_bottom, self.z_top)
+        ax.set_xlabel("locatie")
+        ax.set_ylabel("niveau [m tov NAP]")
+        ax.xaxis.set_major_formatter(lambda x, pos: self._location_name(x))
+        self._update()
+        ax.callbacks.connect("xlim_changed", lambda ax: self._update())
+        self._click = ax.figure.canvas.mpl_connect("button_press_event", self._on_click)
+
+    def _location_name(self, x: float) -> str:
+        i = int(round(x))
+        return self.locations[i].name if 0 <= i < len(self.locations) else ""
+
+    @property
+    def matrix(self) -> np.ndarray:
+        if self._matrix is None:
+            self._matrix = layer_matrix(self.locations, self.names, self.z)
+        return self._matrix
+
+    def visible_range(self) -> Tuple[int, int]:
+        xmin, xmax = self.ax.get_xlim()
+        return max(self.start, int(np.floor(xmin + 0.5))), min(self.end, int(np.ceil(xmax + 0.5)))
+
+    def _update(self) -> None:
+        first, last = self.visible_range()
+        num_visible = max(0, last - first)
+        step = int(np.ceil(num_visible / self.max_columns)) if num_visible > self.max_columns else 1
+        if self._drawn == (first, last, step):
+            return
+        self._drawn = (first, last, step)
+
+        if self._collection is not None:
+            self._collection.remove()
+            self._collection = None
+        if self._image is not None:
+            self._image.remove()
+            self._image = None
+
+        if step == 1:
+            self._draw_polygons(first, last)
+        else:
+            self._draw_raster(first, last, step)
+
+    def _draw_polygons(self, first: int, last: int) -> None:
+        polygons, colors = [], []
+        index = {name: i for i, name in enumerate(self.names)}
+        half = COLUMN_WIDTH / 2
+        for i in range(first, last):
+            for sl in self.locations[i].soillayers:
+                polygons.append([(i - half, sl.z_top), (i + half, sl.z_top), (i + half, sl.z_bottom), (i - half, sl.z_bottom)])
+                colors.append(self._colors[index.get(sl.soilcode, len(self.names))])
+        if len(polygons) > 0:
+            self._collection = self.ax.add_collection(PolyCollection(polygons, facecolors=colors, edgecolors="none"))
+
+    def _draw_raster(self, first: int, last: int, step: int) -> None:
+        # align the groups on multiples of step so panning does not change the groups
+        first = first - (first - self.start) % step
+        groups = aggregate_columns(self.matrix[first:last], step, len(self.names) + 1) + 1 # 0 is no soillayer
+        self._image = self.ax.imshow(
+            groups.T, cmap=self._cmap, norm=NoNorm(), interpolation="nearest", aspect="auto",
+            extent=(first - 0.5, first - 0.5 + len(groups) * step, self.z[-1] - self.dz / 2, self.z[0] + self.dz / 2),
+            zorder=1
+        )
+
+    def update_location(self, index: int) -> None:
+        """Redraw after the soillayers of the location with the given index have changed"""
+        if self._matrix is not None and 0 <= index < len(self.locations):
+            self._matrix[index] = layer_matrix([self.locations[index]], self.names, self.z)[0]
+        self._drawn = None
+        self._update()
+
+    def set_current(self, index: int) -> None:
+        """Mark the location with the given index"""
+        if self._current is not None:
+            self._current.remove()
+            self._current = None
+        if 0 <= index < len(self.locations):
+            self._current = self.ax.axvline(index, color="r", linewidth=1.0, zorder=3)
+
+    def _on_click(self, event) -> None:
+        if event.inaxes != self.ax or event.xdata is None or self.on_select is None:
+            return
+        if self.ax.figure.canvas.toolbar is not None and self.ax.figure.canvas.toolbar.mode != "":
+            return # zooming or panning
+        index = int(round(event.xdata))
+        if self.start <= index < self.end:
+            self.on_select(index)
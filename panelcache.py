@@ -0,0 +1,258 @@
+from pydantic import BaseModel
+from typing import Callable, Tuple, Optional
+from collections import OrderedDict
+from pathlib import Path
+import numpy as np
+import matplotlib.patches as patches
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+import hashlib
+import tempfile
+import threading
+import os
+
+from .helpers import file_signature
+from .soilinvestigation import SoilInvestigation
+
+# default memory and disk budgets of the panel cache in bytes
+PANEL_CACHE_MEMORY = 64 * 1024 * 1024
+PANEL_CACHE_DISK = 512 * 1024 * 1024
+PANEL_CACHE_DIR = Path(tempfile.gettempdir()) / "hdsr_tool_panels"
+
+# panel sizes are rounded to this number of pixels so small resizes reuse the panels
+PANEL_SIZE_STEP = 25
+PANEL_DPI = 100
+
+BOREHOLE_DEFAULT_COLOR = "#ccccc8"
+
+
+class Panel(BaseModel):
+    image: np.ndarray # RGBA uint8 (height, width, 4)
+    extent: Tuple[float, float, float, float] # left, right, bottom, top in data coordinates
+    title: str = ""
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    @property
+    def nbytes(self) -> int:
+        return self.image.nbytes
+
+
+def panel_size(width: int, height: int) -> Tuple[int, int]:
+    """Return the size of the panel rounded to PANEL_SIZE_STEP pixels"""
+    return (
+        max(PANEL_SIZE_STEP, int(round(width / PANEL_SIZE_STEP)) * PANEL_SIZE_STEP),
+        max(PANEL_SIZE_STEP, int(round(height / PANEL_SIZE_STEP)) * PANEL_SIZE_STEP),
+    )
+
+
+def panel_key(si: SoilInvestigation, width: int, height: int, *settings) -> str:
+    """
+    Return the cache key for the panel of a soil investigation
+
+    Args:
+        si (SoilInvestigation): the soil investigation
+        width (int): width of the panel in pixels
+        height (int): height of the panel in pixels
+        settings: the plot settings that influence the panel like QC_MAX, RF_MAX and PLOT_Y_MIN
+
+    Returns:
+        str: the key
+    """
+    if si.fingerprint != "":
+        content = si.fingerprint
+    else: # soil investigations from older projects have no fingerprint
+        content = f"{si.filename}{file_signature(si.filename)}"
+    width, height = panel_size(width, height)
+    s = f"{content}|{int(si.stype)}|{width}|{height}|{'|'.join([str(s) for s in settings])}"
+    return hashlib.blake2b(s.encode(), digest_size=16).hexdigest()
+
+
+def _rasterize(width: int, height: int, extent: Tuple[float, float, float, float], draw: Callable) -> np.ndarray:
+    """Draw on an axes that fills a transparent figure of the given size and return the pixels"""
+    width, height = panel_size(width, height)
+    figure = Figure(figsize=(width / PANEL_DPI, height / PANEL_DPI), dpi=PANEL_DPI)
+    figure.patch.set_alpha(0.0)
+    canvas = FigureCanvasAgg(figure)
+    ax = figure.add_axes([0, 0, 1, 1])
+    ax.set_axis_off()
+    ax.patch.set_alpha(0.0)
+    draw(ax)
+    ax.set_xlim(extent[0], extent[1])
+    ax.set_ylim(extent[2], extent[3])
+    canvas.draw()
+    return np.array(canvas.buffer_rgba(), dtype=np.uint8)
+
+
+def render_cpt_panel(cpt, width: int, height: int, qc_max: float, rf_max: float, z_min: float) -> Panel:
+    """
+    Render the qc (black line) and Rf (green dashed line) of a CPT above z_min to an image
+
+    Args:
+        cpt (CPT): the CPT
+        width (int): width of the panel in pixels
+        height (int): height of the panel in pixels
+        qc_max (float): qc values are cut off at this value
+        rf_max (float): Rf values are cut off at this value
+        z_min (float): the lowest level to draw
+
+    Returns:
+        Panel: the rendered panel
+    """
+    data = cpt.as_numpy()
+    data = data[data[:,0] > z_min] if len(data) > 0 else np.zeros((0, 5))
+    z_bottom = max(float(data[:,0].min()), z_min) if len(data) > 0 else z_min
+    z_top = float(data[:,0].max()) if len(data) > 0 else cpt.z_top
+    extent = (0.0, qc_max, z_bottom, max(z_top, z_bottom + 0.01))
+
+    def draw(ax):
+        ax.plot(np.minimum(data[:,1], qc_max), data[:,0], 'k-')
+        ax.plot(np.minimum(data[:,3], rf_max), data[:,0], 'g--')
+
+    return Panel(image=_rasterize(width, height, extent, draw), extent=extent, title=cpt.name)
+
+
+def render_borehole_panel(borehole, width: int, height: int, colors: dict, z_min: float) -> Panel:
+    """
+    Render the soillayers of a borehole above z_min to an image
+
+    Args:
+        borehole (Borehole): the borehole
+        width (int): width of the panel in pixels
+        height (int): height of the panel in pixels
+        colors (dict): the colors of the layers by the first character of the soilcode
+        z_min (float): the lowest level to draw
+
+    Returns:
+        Panel: the rendered panel
+    """
+    soillayers = [sl for sl in borehole.soillayers if sl.z_top >= z_min]
+    z_top = max([sl.z_top for sl in soillayers]) if len(soillayers) > 0 else borehole.z_top
+    z_bottom = max(min([sl.z_bottom for sl in soillayers]), z_min) if len(soillayers) > 0 else z_min
+    extent = (0.0, 1.0, z_bottom, max(z_top, z_bottom + 0.01))
+
+    def draw(ax):
+        for soillayer in soillayers:
+            layer_bottom = max(soillayer.z_bottom, z_min)
+            if len(soillayer.short_soilcode) > 0 and soillayer.short_soilcode[0] in colors.keys():
+                color = colors[soillayer.short_soilcode[0]]
+            else:
+                color = BOREHOLE_DEFAULT_COLOR
+            ax.add_patch(patches.Rectangle((0.1, layer_bottom), 0.8, soillayer.z_top - layer_bottom, fill=True, facecolor=color, edgecolor="#000"))
+            ax.text(0.1, layer_bottom + 0.1, soillayer.short_soilcode)
+
+    return Panel(image=_rasterize(width, height, extent, draw), extent=extent, title=borehole.name)
+
+
+class PanelCache:
+    """
+    Cache of rendered soil investigation panels with a memory budget (least recently used panels
+    are removed first) and a disk budget (oldest files are removed first)
+    """
+
+    def __init__(self, directory: str = PANEL_CACHE_DIR, max_memory: int = PANEL_CACHE_MEMORY, max_disk: int = PANEL_CACHE_DISK):
+        self.directory = Path(directory) if directory is not None else None
+        self.max_memory = max_memory
+        self.max_disk = max_disk
+        self._panels = OrderedDict()
+        self._memory = 0
+        self._disk = 0
+        self._lock = threading.Lock()
+
+        if self.directory is not None:
+            try:
+                self.directory.mkdir(parents=True, exist_ok=True)
+                self._disk = sum([f.stat().st_size for f in self.directory.glob("*.npz")])
+            except Exception as e: # log errors to the Python console in QGis
+                print(f"Could not create the panel cache directory '{self.directory}', got error '{e}'")
+                self.directory = None
+
+    def __len__(self) -> int:
+        return len(self._panels)
+
+    @property
+    def memory(self) -> int:
+        return self._memory
+
+    def get(self, key: str, render: Callable[[], Panel]) -> Panel:
+        """
+        Return the panel from memory, from disk or render it
+
+        Args:
+            key (str): the key of the panel, see panel_key
+            render (Callable[[], Panel]): function that renders the panel
+
+        Returns:
+            Panel: the panel
+        """
+        with self._lock:
+            panel = self._panels.get(key)
+            if panel is not None:
+                self._panels.move_to_end(key)
+                return panel
+
+        panel = self._load(key)
+        if panel is None:
+            panel = render()
+            self._save(key, panel)
+
+        self._add(key, panel)
+        return panel
+
+    def clear(self) -> None:
+        with self._lock:
+            self._panels.clear()
+            self._memory = 0
+
+    def _add(self, key: str, panel: Panel) -> None:
+        with self._lock:
+            if key in self._panels.keys():
+                return
+            self._panels[key] = panel
+            self._memory += panel.nbytes
+            while self._memory > self.max_memory and len(self._panels) > 1:
+                _, removed = self._panels.popitem(last=False)
+                self._memory -= removed.nbytes
+
+    def _filename(self, key: str) -> Optional[Path]:
+        if self.directory is None:
+            return None
+        return self.directory / f"{key}.npz"
+
+    def _load(self, key: str) -> Optional[Panel]:
+        filename = self._filename(key)
+        if filename is None or not filename.exists():
+            return None
+        try:
+            data = np.load(filename)
+            os.utime(filename) # keep recently used files when cleaning up
+            return Panel(image=data["image"], extent=tuple(data["extent"].tolist()), title=str(data["title"]))
+        except Exception: # a broken file will be replaced by a new render
+            return None
+
+    def _save(self, key: str, panel: Panel) -> None:
+        filename = self._filename(key)
+        if filename is None:
+            return
+        try:
+            with open(filename, "wb") as f:
+                np.savez_compressed(f, image=panel.image, extent=np.array(panel.extent), title=np.array(panel.title))
+            self._disk += filename.stat().st_size
+            if self._disk > self.max_disk:
+                self._cleanup_disk()
+        except Exception as e: # log errors to the Python console in QGis
+            print(f"Could not write panel to '{filename}', got error '{e}'")
+
+    def _cleanup_disk(self) -> None:
+        """Remove the oldest files until the cache uses 90% of the disk budget"""
+        files = [(f.stat().st_mtime, f.stat().st_size, f) for f in self.directory.glob("*.npz")]
+        self._disk = sum([f[1] for f in files])
+        for _, size, f in sorted(files, key=lambda f: f[0]):
+            if self._disk <= 0.9 * self.max_disk:
+                break
+            try:
+                f.unlink()
+                self._disk -= size
+            except Exception:
+                pass
@@ -0,0 +1,57 @@
+from typing import Callable, Any
+from collections import OrderedDict
+import threading
+
+from .helpers import file_signature
+
+# the default number of parsed files that are kept in memory
+PARSE_CACHE_SIZE = 512
+
+
+class ParseCache:
+    """
+    Least recently used cache of parsed soil investigation files, an entry is read again
+    if the file (or the archive that contains the file) has changed since it was parsed
+
+    The cached objects are shared so they should not be changed by the caller
+    """
+
+    def __init__(self, max_items: int = PARSE_CACHE_SIZE):
+        self.max_items = max_items
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+
+    def get(self, filename: str, loader: Callable[[str], Any]) -> Any:
+        """
+        Return the parsed file from the cache or parse it with the given loader
+
+        Args:
+            filename (str): the name of the file
+            loader (Callable[[str], Any]): function that parses the file, like CPT.from_file
+
+        Returns:
+            Any: the parsed file
+        """
+        key = (str(filename), loader)
+        signature = file_signature(filename)
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None and item[0] == signature:
+                self._items.move_to_end(key)
+                return item[1]
+
+        result = loader(str(filename))
+
+        with self._lock:
+            self._items[key] = (signature, result)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+        return result
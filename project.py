@@ -1,28 +1,130 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, PrivateAttr
 from pathlib import Path
-from typing import List
-import math
+from typing import List, Tuple, Optional, Dict
+import numpy as np
 import json
+import gc
 
 from .cpt import CPT
+from .borehole import Borehole
 from .soiltype import SoilType
 from .location import Location
-from .soilinvestigation import SoilInvestigation, SoilInvestigationEnum
+from .soillayer import SoilLayer
+from .soilinvestigation import SoilInvestigation, SoilInvestigationEnum, attribute_columns
+from .geopackage import export_to_geopackage
+from .damexport import export_to_dam
+from .locationloader import LocationRowError, read_locations_csv
+from .spatialindex import SpatialIndex
+from .parsecache import ParseCache
+from .interpolation import InterpolatedProfile, idw_profile, DEFAULT_DZ, DEFAULT_POWER
+from .corridor import corridor_query, polyline_chainage
+from .voxelmodel import VoxelModel
+from .calibration import cpt_borehole_pairs
+from .layerstats import LayerStatistics, compute_layer_statistics, DEFAULT_PERCENTILE
+from .gefbackend import get_gef_backend, DEFAULT_GEF_BACKEND
+from .cptcleaning import CleaningSettings, CleaningLoader
+from .zoning import SoilZone, ZoningResult, cluster_cpts, suggest_zones
+from .dependencies import DependencyTracker, DERIVED_CLOSEST, DERIVED_PROFILE, DERIVED_LAYER_STATISTICS
+
+# written to project files by Project.save, only files with this marker can be read without validation
+PROJECT_FILE_FORMAT = {"writer": "hdsr_tool", "version": 1}
+
 
 class Project(BaseModel):
     soiltypes: List[SoilType] = []
     locations: List[Location] = []
     soilinvestigations: List[SoilInvestigation] = []
+    gef_backend: str = DEFAULT_GEF_BACKEND # see gefbackend.GEF_BACKENDS
+    cpt_cleaning: Optional[CleaningSettings] = None # clean the CPTs when they are loaded, see cptcleaning
+    zones: List[SoilZone] = []
+
+    _spatial_indices: dict = PrivateAttr(default_factory=dict)
+    _attribute_columns: dict = PrivateAttr(default_factory=dict)
+    _parse_cache: ParseCache = PrivateAttr(default_factory=ParseCache)
+    _dependencies: tuple = PrivateAttr(default=None)
+    _location_results: dict = PrivateAttr(default_factory=dict)
+    # increased if the list is replaced, the caches that depend on the list are keyed on these versions
+    _soilinvestigations_version: int = PrivateAttr(default=0)
+    _locations_version: int = PrivateAttr(default=0)
+
+    def __setattr__(self, name, value):
+        super().__setattr__(name, value)
+        if name == "soilinvestigations":
+            self._soilinvestigations_version += 1
+            self._spatial_indices = {}
+            self._attribute_columns = {}
+        elif name == "locations":
+            self._locations_version += 1
 
     @classmethod
-    def from_file(obj, filename: str) -> 'Project':
+    def from_file(obj, filename: str, validate: bool = True) -> 'Project':
+        """
+        Read a project file, use validate=False only for project files written by this tool
+        to skip the (slow) pydantic validation of all locations, soillayers and soil investigations,
+        files without the PROJECT_FILE_FORMAT marker of Project.save are always validated
+
+        Args:
+            filename (str): the name of the project file
+            validate (bool): validate the contents of the file
+
+        Returns:
+            Project: the project or None if the file could not be read
+        """
         try:
-            return Project.parse_file(filename)
+            with open(filename, 'r') as f:
+                data = json.load(f)
+            if not validate and isinstance(data, dict) and data.get("file_format") == PROJECT_FILE_FORMAT:
+                return Project.from_trusted_dict(data)
+            return Project.parse_obj(data)
         except Exception as e:
             print(f"Could not read project file, got error '{e}'")
 
         return None
 
+    @classmethod
+    def from_trusted_dict(obj, data: dict) -> 'Project':
+        """
+        Create a project from a dictionary like the output of Project.dict() without validation,
+        missing values get their defaults but wrong types are not detected so only use this for
+        data that was created by this tool
+
+        Args:
+            data (dict): the project data
+
+        Returns:
+            Project: the project
+        """
+        # the garbage collector slows down creating a lot of small objects and there are no reference cycles here
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            return obj._construct_from_dict(data)
+        finally:
+            if gc_enabled:
+                gc.enable()
+
+    @classmethod
+    def _construct_from_dict(obj, data: dict) -> 'Project':
+        return Project.construct(
+            soiltypes = [SoilType.construct(**st) for st in data.get("soiltypes", [])],
+            locations = [
+                Location.construct(
+                    **{k: v for k, v in l.items() if k not in ("soillayers", "layer_statistics")},
+                    soillayers = [SoilLayer.construct(**sl) for sl in l.get("soillayers", [])],
+                    layer_statistics = [LayerStatistics.construct(**ls) for ls in l.get("layer_statistics", [])]
+                ) for l in data.get("locations", [])
+            ],
+            soilinvestigations = [
+                SoilInvestigation.construct(
+                    **{k: v for k, v in si.items() if k != "stype"},
+                    stype = SoilInvestigationEnum(si.get("stype", SoilInvestigationEnum.NONE))
+                ) for si in data.get("soilinvestigations", [])
+            ],
+            gef_backend = data.get("gef_backend", DEFAULT_GEF_BACKEND),
+            cpt_cleaning = CleaningSettings.construct(**data["cpt_cleaning"]) if data.get("cpt_cleaning") is not None else None,
+            zones = [SoilZone.construct(**z) for z in data.get("zones", [])]
+        )
+
     @property
     def has_locations(self):
         return len(self.locations) > 0
@@ -36,14 +138,295 @@ class Project(BaseModel):
         return [si for si in self.soilinvestigations if si.stype == SoilInvestigationEnum.BOREHOLE]
 
     def save(self, filename):
+        data = self.dict()
+        data["file_format"] = PROJECT_FILE_FORMAT
         f = open(filename, 'w')
-        f.write(json.dumps(self.dict()))
+        f.write(json.dumps(data))
         f.close()
     
-    def get_closest(self, x_rd: float, y_rd: float, max_distance=1e9, num=4):
-        locs = [(math.hypot(si.x_rd - x_rd, si.y_rd - y_rd), si) for si in self.soilinvestigations]
-        locs = [l for l in locs if l[0] < max_distance]
-        return sorted(locs, key=lambda x:x[0])[:num]
+    def get_spatial_index(self, stype: SoilInvestigationEnum = None) -> Tuple[SpatialIndex, List[SoilInvestigation]]:
+        """
+        Return the spatial index on the soil investigations (optionally only of the given type) and
+        the soil investigations in the order of the index, the index is rebuilt if the soil investigations
+        are replaced or added, use invalidate_spatial_index after other changes in place
+
+        Args:
+            stype (SoilInvestigationEnum): only use this type of soil investigation (optional)
+
+        Returns:
+            Tuple[SpatialIndex, List[SoilInvestigation]]: the index and the indexed soil investigations
+        """
+        key = (self._soilinvestigations_version, len(self.soilinvestigations))
+        if stype in self._spatial_indices.keys() and self._spatial_indices[stype][0] == key:
+            return self._spatial_indices[stype][1:]
+
+        if stype is None:
+            sis = self.soilinvestigations
+        else:
+            sis = [si for si in self.soilinvestigations if si.stype == stype]
+        index = SpatialIndex([si.x_rd for si in sis], [si.y_rd for si in sis])
+        self._spatial_indices[stype] = (key, index, sis)
+        return index, sis
+
+    def get_attribute_columns(self, stype: SoilInvestigationEnum = None) -> dict:
+        """
+        Return the attributes of the soil investigations in the order of the spatial index as numpy
+        arrays, see soilinvestigation.attribute_columns
+
+        Args:
+            stype (SoilInvestigationEnum): only use this type of soil investigation (optional)
+
+        Returns:
+            dict: the columns
+        """
+        index, sis = self.get_spatial_index(stype)
+        if stype in self._attribute_columns.keys() and self._attribute_columns[stype][0] is index:
+            return self._attribute_columns[stype][1]
+        columns = attribute_columns(sis)
+        self._attribute_columns[stype] = (index, columns)
+        return columns
+
+    def invalidate_spatial_index(self) -> None:
+        """Force a rebuild of the spatial index, use this after changing soil investigations in place"""
+        self._spatial_indices = {}
+        self._attribute_columns = {}
+        # changes in place can not be tracked so all derived results per location are dropped
+        self._dependencies = None
+        self._location_results = {}
+
+    @property
+    def dependencies(self) -> DependencyTracker:
+        """
+        Return the tracker of the soil investigations used by the derived results per location, the
+        tracker and the cached results start over if the locations or soil investigations were replaced
+        without set_soilinvestigations
+        """
+        key = (self._locations_version, len(self.locations), self._soilinvestigations_version, len(self.soilinvestigations))
+        if self._dependencies is None or self._dependencies[0] != key:
+            self._dependencies = (key, DependencyTracker(self.locations))
+            self._location_results = {}
+        return self._dependencies[1]
+
+    def set_soilinvestigations(self, soilinvestigations: List[SoilInvestigation]) -> Dict[str, np.ndarray]:
+        """
+        Replace the soil investigations and only invalidate the derived results of the locations that
+        used a removed or changed soil investigation or that have a new soil investigation among their
+        closest, the results are computed again when they are requested
+
+        Args:
+            soilinvestigations (List[SoilInvestigation]): the new soil investigations (a new list)
+
+        Returns:
+            Dict[str, np.ndarray]: the indices of the locations with invalidated results per kind of result, see dependencies
+        """
+        tracker = self.dependencies
+        self._record_layer_statistics(tracker)
+        dirty = tracker.update(self.soilinvestigations, soilinvestigations)
+
+        self.soilinvestigations = soilinvestigations # also invalidates the spatial index
+        self._dependencies = ((self._locations_version, len(self.locations), self._soilinvestigations_version, len(soilinvestigations)), tracker)
+        for kind, indices in dirty.items():
+            for i in indices.tolist():
+                self._location_results.pop((kind, i), None)
+        for i in dirty.get(DERIVED_LAYER_STATISTICS, np.zeros(0, dtype=np.int64)).tolist():
+            self.locations[i].layer_statistics = []
+        return dirty
+
+    def _record_layer_statistics(self, tracker: DependencyTracker) -> None:
+        # statistics read from a project file have no recorded sources, find them in the current soil investigations
+        for i, location in enumerate(self.locations):
+            stats = location.layer_statistics
+            if len(stats) > 0 and not tracker.has_result(DERIVED_LAYER_STATISTICS, i):
+                closest = self.get_closest(location.x_rd, location.y_rd, max_distance=stats[0].max_distance, num=stats[0].num, stype=SoilInvestigationEnum.CPT)
+                tracker.record(DERIVED_LAYER_STATISTICS, i, closest, stats[0].max_distance, stats[0].num, SoilInvestigationEnum.CPT)
+
+    def query(
+        self,
+        x_rd: float = None,
+        y_rd: float = None,
+        max_distance: float = None,
+        stype: SoilInvestigationEnum = None,
+        date_from: str = None,
+        date_to: str = None,
+        reaches: float = None,
+        z_top_min: float = None,
+        z_top_max: float = None,
+        has_u: bool = None,
+        max_pre_excavated_depth: float = None,
+        num: int = None
+    ) -> List[Tuple[float, SoilInvestigation]]:
+        """
+        Return the soil investigations that match all given conditions, the spatial search uses the
+        spatial index and the other conditions are applied on the attribute columns so no files are read
+
+        Example, CPTs after 2015 reaching NAP -15 m within 50 m:
+            project.query(x, y, max_distance=50, stype=SoilInvestigationEnum.CPT, date_from="20150101", reaches=-15.0)
+
+        Args:
+            x_rd (float): x coordinate of the point to search around (optional)
+            y_rd (float): y coordinate of the point to search around (optional)
+            max_distance (float): the maximum distance to the point, required if a point is given
+            stype (SoilInvestigationEnum): only this type of soil investigation (optional)
+            date_from (str): only soil investigations on or after this date as YYYYMMDD (optional)
+            date_to (str): only soil investigations on or before this date as YYYYMMDD (optional)
+            reaches (float): only soil investigations with a final depth at or below this level (optional)
+            z_top_min (float): only soil investigations with a z_top at or above this level (optional)
+            z_top_max (float): only soil investigations with a z_top at or below this level (optional)
+            has_u (bool): only soil investigations with (True) or without (False) water pressure (optional)
+            max_pre_excavated_depth (float): only soil investigations with at most this pre excavated depth (optional)
+            num (int): the maximum number of results (optional)
+
+        Returns:
+            List[Tuple[float, SoilInvestigation]]: distance (nan if no point is given) and the soil investigation,
+            sorted on distance if a point is given
+        """
+        index, sis = self.get_spatial_index(stype)
+        columns = self.get_attribute_columns(stype)
+
+        if x_rd is not None and y_rd is not None:
+            if max_distance is None:
+                raise ValueError("A maximum distance is required to search around a point")
+            indices, distances = index.query_radius(x_rd, y_rd, max_distance)
+        else:
+            indices, distances = np.arange(len(sis)), np.full(len(sis), np.nan)
+
+        mask = np.ones(len(indices), dtype=bool)
+        if date_from is not None:
+            mask &= columns["date"][indices] >= int(date_from)
+        if date_to is not None:
+            mask &= (columns["date"][indices] <= int(date_to)) & (columns["date"][indices] > 0)
+        if reaches is not None:
+            mask &= columns["z_min"][indices] <= reaches # nan (unknown final depth) never matches
+        if z_top_min is not None:
+            mask &= columns["z_top"][indices] >= z_top_min
+        if z_top_max is not None:
+            mask &= columns["z_top"][indices] <= z_top_max
+        if has_u is not None:
+            mask &= columns["has_u"][indices] == has_u
+        if max_pre_excavated_depth is not None:
+            mask &= columns["pre_excavated_depth"][indices] <= max_pre_excavated_depth
+
+        indices, distances = indices[mask][:num], distances[mask][:num]
+        return [(d, sis[i]) for i, d in zip(indices.tolist(), distances.tolist())]
+
+    def get_closest(self, x_rd: float, y_rd: float, max_distance=1e9, num=4, stype: SoilInvestigationEnum = None):
+        index, sis = self.get_spatial_index(stype)
+        indices, distances = index.nearest(x_rd, y_rd, num=num, max_distance=max_distance)
+        return [(float(d), sis[i]) for i, d in zip(indices, distances) if d < max_distance]
+
+    def get_location_closest(self, index: int, max_distance=1e9, num=4, stype: SoilInvestigationEnum = None) -> List[Tuple[float, SoilInvestigation]]:
+        """Return the closest soil investigations of the location with the given index, the result is kept until it is invalidated by set_soilinvestigations"""
+        tracker = self.dependencies
+        params = (max_distance, num, stype)
+        cached = self._location_results.get((DERIVED_CLOSEST, index))
+        if cached is not None and cached[0] == params:
+            return list(cached[1])
+
+        location = self.locations[index]
+        closest = self.get_closest(location.x_rd, location.y_rd, max_distance=max_distance, num=num, stype=stype)
+        tracker.record(DERIVED_CLOSEST, index, closest, max_distance, num, stype)
+        self._location_results[(DERIVED_CLOSEST, index)] = (params, closest)
+        return list(closest)
+
+    def location_chainage(self) -> np.ndarray:
+        """Return the chainage of the locations along the trajectory through the locations in their current order"""
+        return polyline_chainage([l.x_rd for l in self.locations], [l.y_rd for l in self.locations])
+
+    def get_corridor(self, width: float, stype: SoilInvestigationEnum = None) -> List[Tuple[float, float, SoilInvestigation]]:
+        """
+        Return the soil investigations within the given distance of the trajectory through the locations
+        (in their current order) sorted on chainage
+
+        Args:
+            width (float): the maximum distance to the trajectory
+            stype (SoilInvestigationEnum): only use this type of soil investigation (optional)
+
+        Returns:
+            List[Tuple[float, float, SoilInvestigation]]: chainage, offset (positive on the left side) and soil investigation
+        """
+        index, sis = self.get_spatial_index(stype)
+        indices, chainages, offsets = corridor_query(index, [l.x_rd for l in self.locations], [l.y_rd for l in self.locations], width)
+        return [(c, o, sis[i]) for i, c, o in zip(indices.tolist(), chainages.tolist(), offsets.tolist())]
+
+    def cpt_borehole_pairs(self, radius: float, max_days: int = None) -> List[Tuple[float, SoilInvestigation, SoilInvestigation]]:
+        """Return all CPT / borehole pairs within the given distance, see calibration.cpt_borehole_pairs"""
+        return cpt_borehole_pairs(self, radius, max_days)
+
+    def load_cpt(self, filename: str) -> CPT:
+        """
+        Return the CPT from the parse cache of the project, the CPT is cleaned if cpt_cleaning is set,
+        the result is shared and should not be changed
+        """
+        loader = get_gef_backend(self.gef_backend).read_cpt
+        if self.cpt_cleaning is not None:
+            loader = CleaningLoader(loader, self.cpt_cleaning)
+        return self._parse_cache.get(filename, loader)
+
+    def load_borehole(self, filename: str) -> Borehole:
+        """Return the borehole from the parse cache of the project, the result is shared and should not be changed"""
+        return self._parse_cache.get(filename, get_gef_backend(self.gef_backend).read_borehole)
+
+    def interpolated_profile(self, x_rd: float, y_rd: float, max_distance: float = 100.0, num: int = 4, z: np.ndarray = None, dz: float = DEFAULT_DZ, power: float = DEFAULT_POWER) -> Optional[InterpolatedProfile]:
+        """
+        Return the inverse distance weighted qc and Rf profile at the given point based on the
+        closest CPTs
+
+        Args:
+            x_rd (float): x coordinate
+            y_rd (float): y coordinate
+            max_distance (float): only use CPTs within this distance
+            num (int): the maximum number of CPTs to use
+            z (np.ndarray): the z grid to use (optional), see interpolation.common_z_grid
+            dz (float): step size of the z grid if no z grid is given
+            power (float): the inverse distance power
+
+        Returns:
+            InterpolatedProfile: the profile or None if there are no (readable) CPTs within the given distance
+        """
+        closest = self.get_closest(x_rd, y_rd, max_distance=max_distance, num=num, stype=SoilInvestigationEnum.CPT)
+        return self._interpolate_closest(x_rd, y_rd, closest, z=z, dz=dz, power=power)
+
+    def _interpolate_closest(self, x_rd: float, y_rd: float, closest: List[Tuple[float, SoilInvestigation]], z: np.ndarray = None, dz: float = DEFAULT_DZ, power: float = DEFAULT_POWER) -> Optional[InterpolatedProfile]:
+        cpts, distances = [], []
+        for dist, si in closest:
+            try:
+                cpts.append(self.load_cpt(si.filename))
+                distances.append(dist)
+            except Exception as e: # log errors to the Python console in QGis
+                print(f"Could not read CPT '{si.filename}', got error '{e}'")
+
+        profile = idw_profile(cpts, np.array(distances), z=z, dz=dz, power=power)
+        if profile is not None:
+            profile.x_rd, profile.y_rd = x_rd, y_rd
+        return profile
+
+    def interpolated_profiles(self, max_distance: float = 100.0, num: int = 4, z: np.ndarray = None, dz: float = DEFAULT_DZ, power: float = DEFAULT_POWER) -> List[Optional[InterpolatedProfile]]:
+        """
+        Return the interpolated profile for each location, see interpolated_profile, use a z grid
+        to get profiles that can be stacked
+
+        Returns:
+            List[InterpolatedProfile]: the profile for each location (None if there are no CPTs within the given distance)
+        """
+        return [self.interpolated_profile(l.x_rd, l.y_rd, max_distance=max_distance, num=num, z=z, dz=dz, power=power) for l in self.locations]
+
+    def get_location_profile(self, index: int, max_distance: float = 100.0, num: int = 4, dz: float = DEFAULT_DZ, power: float = DEFAULT_POWER) -> Optional[InterpolatedProfile]:
+        """
+        Return the interpolated profile of the location with the given index, see interpolated_profile,
+        the result is kept until it is invalidated by set_soilinvestigations and should not be changed
+        """
+        tracker = self.dependencies
+        params = (max_distance, num, dz, power, self.gef_backend, self.cpt_cleaning)
+        cached = self._location_results.get((DERIVED_PROFILE, index))
+        if cached is not None and cached[0] == params:
+            return cached[1]
+
+        location = self.locations[index]
+        closest = self.get_closest(location.x_rd, location.y_rd, max_distance=max_distance, num=num, stype=SoilInvestigationEnum.CPT)
+        profile = self._interpolate_closest(location.x_rd, location.y_rd, closest, dz=dz, power=power)
+        tracker.record(DERIVED_PROFILE, index, closest, max_distance, num, SoilInvestigationEnum.CPT)
+        self._location_results[(DERIVED_PROFILE, index)] = (params, profile)
+        return profile
     
     def reset(self):
         self.locations = []
@@ -57,34 +440,124 @@ class Project(BaseModel):
                 color = args[1]
             ))
 
-    def locations_from_csvfile(self, filename: str):
-        if Path(filename).exists():
-            lines = open(filename, 'r').readlines()
-
-            for line in lines[1:]:
-                args = [s.strip() for s in line.split(';')]
-                try:
-                    self.locations.append(Location(
-                        name = args[0],
-                        x_rd = float(args[1].replace(',','.')),
-                        y_rd = float(args[2].replace(',','.'))
-                    ))
-                except: # log errors to the Python console in QGis
-                    print(f"Could not read location from line '{line}'")
-
-    def export_to_dam(self, filename: str):
-        f = open(filename, 'w')
-        f.write("soilprofile_id;top_level;soil_name\n")
+    def locations_from_csvfile(self, filename: str, encoding: str = None) -> List[LocationRowError]:
+        """
+        Add the locations from a csv file with a header line followed by lines with name;x;y,
+        see locationloader.read_locations_csv
+
+        Args:
+            filename (str): the name of the csv file
+            encoding (str): the encoding of the file (optional), see locationloader.read_locations_csv
+
+        Returns:
+            List[LocationRowError]: the lines that could not be read
+        """
+        if not Path(filename).exists():
+            return []
+
+        table = read_locations_csv(filename, encoding=encoding)
+        # see from_trusted_dict, no reference cycles in the new locations
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            self.locations += list(table.iter_locations())
+        finally:
+            if gc_enabled:
+                gc.enable()
+        return table.errors
+
+    def compute_layer_statistics(self, max_distance: float = 100.0, num: int = 4, percentile: float = DEFAULT_PERCENTILE) -> int:
+        """
+        Compute the statistics of the nearest CPTs per soillayer for all locations with soillayers and
+        store them in the layer_statistics of the locations, see layerstats.compute_layer_statistics
+
+        Args:
+            max_distance (float): only use CPTs within this distance
+            num (int): the maximum number of CPTs per location
+            percentile (float): the percentile (0-100) to compute
+
+        Returns:
+            int: the number of locations with statistics
+        """
         for location in self.locations:
+            location.layer_statistics = []
+        return self._compute_layer_statistics([i for i, l in enumerate(self.locations) if len(l.soillayers) > 0], max_distance, num, percentile)
+
+    def update_layer_statistics(self, max_distance: float = 100.0, num: int = 4, percentile: float = DEFAULT_PERCENTILE) -> int:
+        """
+        Compute the statistics only for the locations with soillayers that have no (valid) statistics for
+        these settings, like the locations that were invalidated by set_soilinvestigations
+
+        Returns:
+            int: the number of locations with new statistics
+        """
+        indices = []
+        for i, location in enumerate(self.locations):
             if len(location.soillayers) == 0:
                 continue
-            for i, soillayer in enumerate(location.soillayers):
-                if i==0:
-                    z = 10.0
-                else:
-                    z = soillayer.z_top
-                f.write(f"{location.name};{z:.2f};{soillayer.soilcode}\n")
-        f.close()
+            stats = self.get_layer_statistics(location)
+            if None in stats or (stats[0].max_distance, stats[0].num, stats[0].percentile) != (max_distance, num, percentile):
+                indices.append(i)
+        return self._compute_layer_statistics(indices, max_distance, num, percentile)
+
+    def _compute_layer_statistics(self, indices: List[int], max_distance: float, num: int, percentile: float) -> int:
+        tracker = self.dependencies
+        on_closest = lambda i, closest: tracker.record(DERIVED_LAYER_STATISTICS, indices[i], closest, max_distance, num, SoilInvestigationEnum.CPT)
+        locations = [self.locations[i] for i in indices]
+        stats = compute_layer_statistics(self, locations, max_distance=max_distance, num=num, percentile=percentile, on_closest=on_closest)
+        for location, s in zip(locations, stats):
+            location.layer_statistics = s
+        return len(locations)
+
+    def get_layer_statistics(self, location: Location) -> List[Optional[LayerStatistics]]:
+        """Return the statistics for each soillayer of the location, None for soillayers that changed after computing the statistics"""
+        stats = location.layer_statistics
+        if len(stats) != len(location.soillayers):
+            return [None] * len(location.soillayers)
+        return [s if s.matches(sl) else None for s, sl in zip(stats, location.soillayers)]
+
+    def export_to_dam(self, filename: str, names: List[str] = None, fmt: str = None, statistics: bool = False) -> int:
+        """
+        Write the soilprofiles of the locations for DAM, the format (csv, parquet or feather) is
+        based on the extension of the filename if not given, see damexport.export_to_dam
+
+        Args:
+            filename (str): the name of the file
+            names (List[str]): only export the locations with these names (optional)
+            fmt (str): one of the damexport.DAM_FORMAT_ values (optional)
+            statistics (bool): add the stored layer statistics as extra columns, see compute_layer_statistics
+
+        Returns:
+            int: the number of soilprofile rows written
+        """
+        locations = self.locations
+        if names is not None:
+            names = set(names)
+            locations = (l for l in self.locations if l.name in names)
+        return export_to_dam(locations, filename, fmt=fmt, statistics=self.get_layer_statistics if statistics else None)
+
+    def compute_zones(self, num_zones: int, max_distance: float = 250.0, num: int = 4, **kwargs) -> ZoningResult:
+        """
+        Group the CPTs in zones with a representative profile and give each location the suggested
+        zone of its closest CPTs, see zoning.cluster_cpts for the other options
+
+        Args:
+            num_zones (int): the number of zones
+            max_distance (float): locations without CPTs within this distance get zone -1
+            num (int): the number of closest CPTs that decide the zone of a location
 
+        Returns:
+            ZoningResult: the zones and the zone of each CPT
+        """
+        result = cluster_cpts(self, num_zones, **kwargs)
+        self.zones = result.zones
+        for location, zone in zip(self.locations, suggest_zones(self, result, max_distance=max_distance, num=num).tolist()):
+            location.zone = zone
+        return result
 
+    def build_voxel_model(self, directory: str, **kwargs) -> VoxelModel:
+        """Build or update the voxel model of the CPTs in the given directory, see VoxelModel.build for the options"""
+        return VoxelModel.build(self, directory, **kwargs)
 
+    def export_to_geopackage(self, filename: str):
+        export_to_geopackage(self, filename)
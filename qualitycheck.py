@@ -0,0 +1,227 @@
+"""
+Headless quality check of the CPT and borehole GEF files, every file is fully parsed in a
+process pool and the errors and warnings are written to a JSON and / or CSV report
+
+Usage (from the directory that contains the plugin):
+    python -m hdsr_tool.qualitycheck --cpts D:/sonderingen --boreholes D:/boringen --json report.json --csv report.csv
+"""
+from pydantic import BaseModel
+from typing import List, Iterator, Tuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+import argparse
+import zipfile
+import json
+import csv
+
+from .cpt import CPT
+from .borehole import Borehole
+from .helpers import open_text, split_archive_path, case_insensitive_glob
+from .gefheader import GEFHeader, GEF_ENCODING, GEF_COLUMN_Z, GEF_COLUMN_Z_CORRECTED, GEF_COLUMN_QC, GEF_COLUMN_FS, GEF_COLUMN_TOP, GEF_COLUMN_BOTTOM, read_gef_header
+from .soilinvestigation import SoilInvestigationEnum
+from .settings import SONDERINGEN_MAP, BORINGEN_MAP
+
+# number of files that are checked by one task
+CHECK_BATCH_SIZE = 200
+
+# only the first errors in the datalines of a file are reported
+MAX_DATALINE_ERRORS = 10
+
+REQUIRED_COLUMNS = {
+    SoilInvestigationEnum.CPT: {GEF_COLUMN_QC: "qc", GEF_COLUMN_FS: "fs"}, # the depth is checked with cpt_z_column
+    SoilInvestigationEnum.BOREHOLE: {GEF_COLUMN_TOP: "top", GEF_COLUMN_BOTTOM: "bottom"},
+}
+
+STYPE_NAMES = {
+    SoilInvestigationEnum.CPT: "cpt",
+    SoilInvestigationEnum.BOREHOLE: "borehole",
+}
+
+
+class FileReport(BaseModel):
+    filename: str
+    stype: SoilInvestigationEnum
+    num_rows: int = 0
+    errors: List[str] = []
+    warnings: List[str] = []
+
+    @property
+    def is_valid(self) -> bool:
+        return len(self.errors) == 0
+
+
+def _check_header(header: GEFHeader, report: FileReport) -> None:
+    report.errors += header.errors
+    report.warnings += header.warnings
+    if header.x is None or header.y is None:
+        report.errors.append("Missing #XYID")
+    if header.z_top is None:
+        report.warnings.append("Missing or invalid #ZID, z_top is set to 0.0")
+    if header.date == "":
+        report.warnings.append("No valid #STARTDATE or #FILEDATE")
+    if report.stype == SoilInvestigationEnum.CPT and header.cpt_z_column is None:
+        report.errors.append(f"Missing #COLUMNINFO for the depth (quantity {GEF_COLUMN_Z} or {GEF_COLUMN_Z_CORRECTED})")
+    for quantity, name in REQUIRED_COLUMNS[report.stype].items():
+        if not quantity in header.columninfo.keys():
+            report.errors.append(f"Missing #COLUMNINFO for the {name} (quantity {quantity})")
+    for col_index in header.columnvoids.keys():
+        if col_index < 0 or col_index >= header.num_columns:
+            report.warnings.append(f"#COLUMNVOID for column {col_index + 1} but the file has {header.num_columns} columns")
+
+
+def check_file(filename: str, stype: SoilInvestigationEnum, zfile: zipfile.ZipFile = None) -> FileReport:
+    """
+    Fully parse a CPT or borehole GEF file and return the errors and warnings, unlike
+    CPT.from_file and Borehole.from_file this does not stop at the first error
+
+    Args:
+        filename (str): the name of the file, files in zip archives can be given as 'archive.zip!member.gef'
+        stype (SoilInvestigationEnum): the type of the soil investigation
+        zfile (zipfile.ZipFile): the opened archive if the file is an archive member (optional)
+
+    Returns:
+        FileReport: the report of the file
+    """
+    report = FileReport(filename=str(filename), stype=stype)
+    try:
+        with open_text(filename, encoding=GEF_ENCODING, zfile=zfile) as f:
+            lines = iter(f)
+            header = read_gef_header(lines, strict=False)
+            _check_header(header, report)
+            if not report.is_valid:
+                return report
+
+            if stype == SoilInvestigationEnum.CPT:
+                si = CPT(filename=str(filename))
+            else:
+                si = Borehole(filename=str(filename))
+            metadata = si._apply_header(header)
+
+            num_errors = 0
+            for i, line in enumerate(lines):
+                try:
+                    si._parse_data_line(line, metadata)
+                except ValueError as e:
+                    num_errors += 1
+                    if num_errors <= MAX_DATALINE_ERRORS:
+                        report.errors.append(f"Dataline {i + 1}: {e}")
+            if num_errors > MAX_DATALINE_ERRORS:
+                report.errors.append(f"{num_errors - MAX_DATALINE_ERRORS} more invalid datalines")
+
+            if stype == SoilInvestigationEnum.CPT:
+                report.num_rows = len(si.z)
+            else:
+                report.num_rows = len(si.soillayers)
+            if report.num_rows == 0:
+                report.errors.append("No data")
+    except Exception as e:
+        report.errors.append(f"Could not read file, got error '{e}'")
+    return report
+
+
+def _check_batch(filenames: List[str], stype: SoilInvestigationEnum, archive: str = "") -> List[FileReport]:
+    # runs in a worker process, members of the same archive share one opened archive
+    if archive == "":
+        return [check_file(filename, stype) for filename in filenames]
+    try:
+        with zipfile.ZipFile(archive) as zf:
+            return [check_file(filename, stype, zfile=zf) for filename in filenames]
+    except Exception as e:
+        return [FileReport(filename=str(filename), stype=stype, errors=[f"Could not read archive '{archive}', got error '{e}'"]) for filename in filenames]
+
+
+def iter_quality_check(files: List[Tuple[str, SoilInvestigationEnum]], max_workers: int = None, batch_size: int = CHECK_BATCH_SIZE) -> Iterator[FileReport]:
+    """
+    Check the given files in a process pool, the reports are yielded as soon as a batch is done
+    so the caller can show the progress
+
+    Args:
+        files (List[Tuple[str, SoilInvestigationEnum]]): the filenames and the type of the soil investigations
+        max_workers (int): the maximum number of processes, defaults to the number of processors
+        batch_size (int): the number of files per task
+
+    Returns:
+        Iterator[FileReport]: the reports in the order of completion
+    """
+    groups = {}
+    for filename, stype in files:
+        archive, member = split_archive_path(filename)
+        groups.setdefault((archive if member != "" else "", stype), []).append(str(filename))
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = []
+        for (archive, stype), filenames in groups.items():
+            for i in range(0, len(filenames), batch_size):
+                futures.append(executor.submit(_check_batch, filenames[i:i+batch_size], stype, archive))
+
+        for future in as_completed(futures):
+            for report in future.result():
+                yield report
+
+
+def write_json_report(reports: List[FileReport], filename: str) -> None:
+    """Write all reports and a summary to a JSON file"""
+    data = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "num_files": len(reports),
+        "num_files_with_errors": len([r for r in reports if not r.is_valid]),
+        "num_files_with_warnings": len([r for r in reports if len(r.warnings) > 0]),
+        "files": [
+            {
+                "filename": r.filename,
+                "stype": STYPE_NAMES[r.stype],
+                "num_rows": r.num_rows,
+                "errors": r.errors,
+                "warnings": r.warnings
+            } for r in reports
+        ]
+    }
+    with open(filename, "w") as f:
+        json.dump(data, f, indent=2)
+
+
+def write_csv_report(reports: List[FileReport], filename: str) -> None:
+    """Write one line per error or warning to a semicolon separated file, files without problems are skipped"""
+    with open(filename, "w", newline="") as f:
+        writer = csv.writer(f, delimiter=";")
+        writer.writerow(["filename", "stype", "level", "message"])
+        for r in reports:
+            for message in r.errors:
+                writer.writerow([r.filename, STYPE_NAMES[r.stype], "error", message])
+            for message in r.warnings:
+                writer.writerow([r.filename, STYPE_NAMES[r.stype], "warning", message])
+
+
+def main(args: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Check all CPT and borehole GEF files and write a report")
+    parser.add_argument("--cpts", nargs="*", default=[SONDERINGEN_MAP], help="directories with CPT files")
+    parser.add_argument("--boreholes", nargs="*", default=[BORINGEN_MAP], help="directories with borehole files")
+    parser.add_argument("--json", default="", help="name of the JSON report")
+    parser.add_argument("--csv", default="", help="name of the CSV report")
+    parser.add_argument("--workers", type=int, default=None, help="number of processes")
+    args = parser.parse_args(args)
+
+    files = []
+    for roots, stype in [(args.cpts, SoilInvestigationEnum.CPT), (args.boreholes, SoilInvestigationEnum.BOREHOLE)]:
+        for root in roots:
+            files += [(str(f), stype) for f in case_insensitive_glob(root, ".gef")]
+
+    reports = []
+    for report in iter_quality_check(files, max_workers=args.workers):
+        reports.append(report)
+        if len(reports) % 1000 == 0:
+            print(f"Checked {len(reports)} of {len(files)} files")
+    reports.sort(key=lambda r: r.filename)
+
+    if args.json != "":
+        write_json_report(reports, args.json)
+    if args.csv != "":
+        write_csv_report(reports, args.csv)
+
+    num_errors = len([r for r in reports if not r.is_valid])
+    print(f"Checked {len(reports)} files, {num_errors} files with errors")
+    return 1 if num_errors > 0 else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,391 @@
+from typing import List, Tuple, Any, Optional
+from urllib.parse import urlsplit, parse_qsl
+import urllib.request
+import urllib.error
+import argparse
+import asyncio
+import threading
+import json
+import numpy as np
+
+from .soilinvestigation import SoilInvestigation, SoilInvestigationEnum
+from .corridor import corridor_query
+from .project import Project
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+# the service is only meant for tools on the same machine
+LOCAL_HOSTS = ["127.0.0.1", "localhost", "::1"]
+
+# requests that arrive within this time (in seconds) are handled in the same batch
+BATCH_DELAY = 0.002
+MAX_BATCH_SIZE = 256
+
+# maximum size of a request body
+MAX_BODY_SIZE = 16 * 1024 * 1024
+
+HTTP_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 413: "Payload Too Large", 500: "Internal Server Error"}
+
+
+class QueryError(Exception):
+    """Invalid query, returned to the client as a 400 response"""
+
+
+def _stype(params: dict) -> Optional[SoilInvestigationEnum]:
+    name = str(params.get("stype", "")).strip().upper()
+    if name == "":
+        return None
+    try:
+        return SoilInvestigationEnum[name]
+    except KeyError:
+        raise QueryError(f"unknown stype '{params['stype']}', use cpt or borehole")
+
+
+def _float(params: dict, key: str, default: float = None) -> float:
+    if not key in params.keys():
+        if default is None:
+            raise QueryError(f"missing parameter '{key}'")
+        return default
+    try:
+        return float(params[key])
+    except (TypeError, ValueError):
+        raise QueryError(f"invalid value '{params[key]}' for parameter '{key}'")
+
+
+def _si_dict(si: SoilInvestigation) -> dict:
+    result = si.dict()
+    result["stype"] = si.stype.name.lower()
+    return result
+
+
+class QueryService:
+    """
+    Local HTTP/JSON service that answers queries on the soil investigations of a project, the project
+    (with its spatial index and parse cache) stays in memory so the queries are fast
+
+    The queries are collected in batches that are handled in one call in a worker thread so the event
+    loop keeps accepting requests while a batch is handled, POST /batch handles a list of queries at once
+
+    Endpoints (GET with query parameters or POST with a JSON object):
+        /closest    x, y, max_distance (1e9), num (4), stype (cpt or borehole, optional)
+        /corridor   x (list), y (list), width, stype (optional), the polyline as lists of coordinates
+        /cpt        filename, the parsed CPT with the columns z, qc, fs, Rf, u
+        /batch      queries, a list of {"path": ..., "params": {...}}
+        /status     the number of soil investigations and the size of the parse cache
+
+    Usage:
+        service = QueryService(project)
+        port = service.start_in_thread()
+        ...
+        service.stop()
+    """
+
+    def __init__(self, project: Project, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, batch_delay: float = BATCH_DELAY, max_batch_size: int = MAX_BATCH_SIZE):
+        if not host in LOCAL_HOSTS:
+            raise ValueError(f"The query service can only be bound to localhost, got '{host}'")
+        self.project = project
+        self.host = host
+        self.port = port
+        self.batch_delay = batch_delay
+        self.max_batch_size = max_batch_size
+        self.num_batches = 0
+        self.num_queries = 0
+
+        self._handlers = {
+            "/closest": self._closest,
+            "/corridor": self._corridor,
+            "/cpt": self._cpt,
+            "/status": self._status,
+        }
+        self._filenames = (None, {})
+        self._pending = []
+        self._flush_handle = None
+        self._server = None
+        self._loop = None
+        self._thread = None
+        self._started = threading.Event()
+        self._stopped = None
+        # the project is not thread safe, only one batch is handled at a time
+        self._project_lock = threading.Lock()
+
+    # the queries, these run in a worker thread
+
+    def _closest(self, params: dict) -> list:
+        x, y = _float(params, "x"), _float(params, "y")
+        max_distance = _float(params, "max_distance", 1e9)
+        num = int(_float(params, "num", 4))
+        return [
+            {"distance": d, "soilinvestigation": _si_dict(si)}
+            for d, si in self.project.get_closest(x, y, max_distance=max_distance, num=num, stype=_stype(params))
+        ]
+
+    def _corridor(self, params: dict) -> list:
+        x, y = params.get("x"), params.get("y")
+        if not isinstance(x, list) or not isinstance(y, list) or len(x) != len(y):
+            raise QueryError("x and y should be lists with the coordinates of the polyline")
+        index, sis = self.project.get_spatial_index(_stype(params))
+        indices, chainages, offsets = corridor_query(index, np.array(x, dtype=float), np.array(y, dtype=float), _float(params, "width"))
+        return [
+            {"chainage": c, "offset": o, "soilinvestigation": _si_dict(sis[i])}
+            for i, c, o in zip(indices.tolist(), chainages.tolist(), offsets.tolist())
+        ]
+
+    def _cpt(self, params: dict) -> dict:
+        filename = str(params.get("filename", ""))
+        # only serve files of the project
+        index, sis = self.project.get_spatial_index()
+        if self._filenames[0] is not index:
+            self._filenames = (index, {si.filename: si.stype for si in sis})
+        if not filename in self._filenames[1].keys():
+            raise QueryError(f"unknown soil investigation '{filename}'")
+        if self._filenames[1][filename] != SoilInvestigationEnum.CPT:
+            raise QueryError(f"soil investigation '{filename}' is not a CPT")
+        cpt = self.project.load_cpt(filename)
+        data = cpt.as_numpy()
+        return {
+            "name": cpt.name, "x": cpt.x, "y": cpt.y, "z_top": cpt.z_top, "date": cpt.startdate or cpt.filedate,
+            "columns": {column: data[:,i].tolist() for i, column in enumerate(["z", "qc", "fs", "Rf", "u"])}
+        }
+
+    def _status(self, params: dict) -> dict:
+        return {
+            "num_soilinvestigations": len(self.project.soilinvestigations),
+            "parse_cache_size": len(self.project._parse_cache),
+            "num_batches": self.num_batches,
+            "num_queries": self.num_queries,
+        }
+
+    def handle_query(self, path: str, params: dict) -> Tuple[int, Any]:
+        """
+        Handle one query and return the HTTP status and the JSON result
+
+        Args:
+            path (str): the endpoint like /closest
+            params (dict): the parameters of the query
+
+        Returns:
+            Tuple[int, Any]: the status and the result, {"error": message} for invalid queries
+        """
+        if path == "/batch":
+            queries = params.get("queries")
+            if not isinstance(queries, list):
+                return 400, {"error": "queries should be a list of {\"path\": ..., \"params\": {...}}"}
+            results = []
+            for query in queries:
+                query = query if isinstance(query, dict) else {}
+                status, result = self.handle_query(str(query.get("path", "")), query.get("params") or {})
+                results.append({"status": status, "result": result})
+            return 200, results
+
+        if not path in self._handlers.keys():
+            return 404, {"error": f"unknown endpoint '{path}'"}
+        try:
+            return 200, self._handlers[path](params)
+        except QueryError as e:
+            return 400, {"error": str(e)}
+        except Exception as e: # log errors to the Python console in QGis
+            print(f"Query service error on '{path}', got error '{e}'")
+            return 500, {"error": str(e)}
+
+    def _handle_batch(self, batch: List[Tuple[str, dict]]) -> List[Tuple[int, Any]]:
+        with self._project_lock:
+            self.num_batches += 1
+            self.num_queries += len(batch)
+            return [self.handle_query(path, params) for path, params in batch]
+
+    # batching, these run in the event loop
+
+    async def submit(self, path: str, params: dict) -> Tuple[int, Any]:
+        """Add the query to the next batch and wait for the result"""
+        future = self._loop.create_future()
+        self._pending.append((path, params, future))
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = self._loop.call_later(self.batch_delay, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, []
+        if len(batch) > 0:
+            asyncio.ensure_future(self._run_batch(batch))
+
+    async def _run_batch(self, batch: list) -> None:
+        try:
+            results = await self._loop.run_in_executor(None, self._handle_batch, [(path, params) for path, params, _ in batch])
+        except Exception as e:
+            results = [(500, {"error": str(e)})] * len(batch)
+        for (_, _, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    # HTTP
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                request_line = await reader.readline()
+                if len(request_line) == 0:
+                    break
+                method, target = (request_line.decode("latin-1").split() + ["", ""])[:2]
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    key, _, value = line.decode("latin-1").partition(":")
+                    headers[key.strip().lower()] = value.strip()
+
+                length = int(headers.get("content-length", "0") or 0)
+                if length > MAX_BODY_SIZE:
+                    await self._respond(writer, 413, {"error": "request too large"}, False)
+                    break
+                body = await reader.readexactly(length) if length > 0 else b""
+
+                url = urlsplit(target)
+                if method == "GET":
+                    params = dict(parse_qsl(url.query))
+                    status, result = await self.submit(url.path, params)
+                elif method == "POST":
+                    try:
+                        params = json.loads(body.decode("utf-8")) if len(body) > 0 else {}
+                    except ValueError as e:
+                        params = None
+                        status, result = 400, {"error": f"invalid JSON, {e}"}
+                    if isinstance(params, dict):
+                        status, result = await self.submit(url.path, params)
+                    elif params is not None:
+                        status, result = 400, {"error": "the body should be a JSON object"}
+                else:
+                    status, result = 405, {"error": f"method {method} is not supported"}
+
+                keep_alive = headers.get("connection", "").lower() != "close"
+                await self._respond(writer, status, result, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, writer: asyncio.StreamWriter, status: int, result: Any, keep_alive: bool) -> None:
+        body = json.dumps(result).encode("utf-8")
+        writer.write(
+            f"HTTP/1.1 {status} {HTTP_REASONS.get(status, '')}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode("latin-1") + body
+        )
+        await writer.drain()
+
+    async def start(self) -> int:
+        """Start listening and return the port, use port 0 to get a free port"""
+        self._loop = asyncio.get_running_loop()
+        self.project.get_spatial_index() # build the index before the first query
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self.port
+
+    async def serve_forever(self) -> None:
+        if self._server is None:
+            await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    def start_in_thread(self) -> int:
+        """Run the service in a background thread (like inside QGis) and return the port"""
+        def run():
+            asyncio.run(self._run_until_stopped())
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+        self._started.wait()
+        if self._server is None:
+            raise RuntimeError(f"Could not start the query service on {self.host}:{self.port}")
+        return self.port
+
+    async def _run_until_stopped(self) -> None:
+        self._stopped = asyncio.Event()
+        try:
+            await self.start()
+        finally:
+            self._started.set()
+        async with self._server:
+            await self._stopped.wait()
+
+    def stop(self) -> None:
+        """Stop the service that was started with start_in_thread"""
+        if self._thread is None:
+            return
+        self._loop.call_soon_threadsafe(self._stopped.set)
+        self._thread.join()
+        self._thread = None
+        self._server = None
+
+
+class QueryClient:
+    """
+    Client for a QueryService on this machine, uses only the standard library
+
+    Usage:
+        client = QueryClient(port=8765)
+        for hit in client.closest(125000, 462000, num=4, stype="cpt"):
+            print(hit["distance"], hit["soilinvestigation"]["name"])
+    """
+
+    def __init__(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, timeout: float = 30.0):
+        self.url = f"http://{host}:{port}"
+        self.timeout = timeout
+
+    def request(self, path: str, params: dict) -> Any:
+        request = urllib.request.Request(
+            self.url + path, data=json.dumps(params).encode("utf-8"), headers={"Content-Type": "application/json"}, method="POST"
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return json.loads(response.read().decode("utf-8"))
+        except urllib.error.HTTPError as e:
+            raise ValueError(json.loads(e.read().decode("utf-8")).get("error", str(e)))
+
+    def closest(self, x: float, y: float, max_distance: float = 1e9, num: int = 4, stype: str = "") -> List[dict]:
+        return self.request("/closest", {"x": x, "y": y, "max_distance": max_distance, "num": num, "stype": stype})
+
+    def corridor(self, x: List[float], y: List[float], width: float, stype: str = "") -> List[dict]:
+        return self.request("/corridor", {"x": list(x), "y": list(y), "width": width, "stype": stype})
+
+    def cpt(self, filename: str) -> dict:
+        return self.request("/cpt", {"filename": filename})
+
+    def batch(self, queries: List[Tuple[str, dict]]) -> List[dict]:
+        """Send a list of (path, params) queries in one request, returns {"status": ..., "result": ...} per query"""
+        return self.request("/batch", {"queries": [{"path": path, "params": params} for path, params in queries]})
+
+    def status(self) -> dict:
+        return self.request("/status", {})
+
+
+def main(args: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Serve the soil investigations of a project on localhost")
+    parser.add_argument("project", help="the project file")
+    parser.add_argument("--host", default=DEFAULT_HOST, choices=LOCAL_HOSTS, help="the address to listen on")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="the port to listen on")
+    args = parser.parse_args(args)
+
+    project = Project.from_file(args.project, validate=False)
+    if project is None:
+        return 1
+
+    service = QueryService(project, host=args.host, port=args.port)
+    print(f"Serving {len(project.soilinvestigations)} soil investigations on http://{args.host}:{args.port}")
+    try:
+        asyncio.run(service.serve_forever())
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
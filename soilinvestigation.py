@@ -1,5 +1,39 @@
 from pydantic import BaseModel
 from enum import IntEnum
+from typing import List, Iterator, Iterable, Tuple, Optional, Dict
+from concurrent.futures import ThreadPoolExecutor
+import queue
+import zipfile
+import hashlib
+import numpy as np
+
+from .helpers import open_text, split_archive_path, read_tail, file_size, FileEntry
+from .gefheader import GEFHeader, GEF_ENCODING, GEF_COLUMN_BOTTOM
+
+
+# number of archive members that are read by one worker
+ARCHIVE_BATCH_SIZE = 250
+
+# number of lines at the end of the data that are used for the data hash
+DATA_HASH_LINES = 20
+
+
+def _final_depth(line: str, header: GEFHeader, stype: 'SoilInvestigationEnum') -> Optional[float]:
+    """Return the deepest point (in m NAP) from the last dataline of a GEF file or None if it can not be determined"""
+    try:
+        args = line.replace(header.record_seperator, '').strip().split(header.column_seperator)
+        args = [arg.strip() for arg in args if len(arg.strip()) > 0]
+        z_top = header.z_top if header.z_top is not None else 0.0
+        if stype == SoilInvestigationEnum.CPT:
+            return round(z_top - abs(float(args[header.cpt_z_column])), 2)
+        elif stype == SoilInvestigationEnum.BOREHOLE:
+            z_bottom = float(args[header.columninfo[GEF_COLUMN_BOTTOM]])
+            if z_bottom > z_top: # positive depth values from z_top, see Borehole._parse_data_line
+                z_bottom = z_top - z_bottom
+            return round(z_bottom, 2)
+    except:
+        pass
+    return None
 
 
 class SoilInvestigationEnum(IntEnum):
@@ -13,25 +47,249 @@ class SoilInvestigation(BaseModel):
     x_rd: float
     y_rd: float
 
-    @classmethod 
-    def from_file(obj, filename) -> 'SoilInvestigation':
+    name: str = ""
+    date: str = ""
+    z_top: float = 0.0
+    z_min: Optional[float] = None
+    has_u: bool = False
+    pre_excavated_depth: float = 0.0
+
+    fingerprint: str = ""
+    aliases: List[str] = []
+
+    # the modification time and size of the file (or archive) when it was indexed, see helpers.FileEntry
+    file_mtime: Optional[float] = None
+    file_size: Optional[int] = None
+
+    @classmethod
+    def from_file(obj, filename, zfile: zipfile.ZipFile = None, stype: SoilInvestigationEnum = SoilInvestigationEnum.NONE) -> 'SoilInvestigation':
+        """
+        Read the location and the metadata of the soil investigation from the header of the file, files in
+        zip archives can be given as 'archive.zip!member.gef'
+
+        The final depth (z_min) is read from the last line of the data and is only available
+        if the type of the soil investigation is given, has_u and the pre excavated depth are
+        read from the header
+
+        The fingerprint consists of a hash of the header and a hash of the file size and
+        the last lines of the data so copies of the same file get the same fingerprint
+        without reading all data
+
+        Args:
+            filename (str): the name of the file
+            zfile (zipfile.ZipFile): the opened archive if the file is an archive member (optional)
+            stype (SoilInvestigationEnum): the type of the soil investigation (optional)
+
+        Returns:
+            SoilInvestigation: the soil investigation or None if the location could not be read
+        """
+        header = GEFHeader()
+        header_hash = hashlib.blake2b(digest_size=8)
         try:
-            lines = open(filename, 'r', encoding="latin-1").readlines()
-            for line in lines:
-                if line.find('#XYID') > -1:
-                    args = [s.strip() for s in line.split(',')]
-                    x_rd = float(args[1])
-                    y_rd = float(args[2])
-                    return SoilInvestigation(
-                        filename = str(filename),
-                        x_rd = x_rd,
-                        y_rd = y_rd
-                    )
+            # only stream the header, the end of the data is used for the final depth and the fingerprint
+            with open_text(filename, encoding=GEF_ENCODING, zfile=zfile) as f:
+                for line in f:
+                    header_hash.update(line.strip().encode(GEF_ENCODING, errors="replace"))
+                    if line.find('#EOH') > -1:
+                        break
+                    header.parse_line(line, strict=False) # the index only needs the location so do not fail on other lines
+
+                if header.x is None or header.y is None:
+                    print(f"Could not find #XYID in '{filename}'")
+                    return None
+
+                si = SoilInvestigation.construct( # trusted values, skip the pydantic validation
+                    stype = stype,
+                    filename = str(filename),
+                    x_rd = header.x,
+                    y_rd = header.y,
+                    name = header.name,
+                    date = header.date,
+                    z_top = header.z_top if header.z_top is not None else 0.0,
+                    has_u = header.has_u,
+                    pre_excavated_depth = header.pre_excavated_depth,
+                )
+
+                tail = read_tail(filename, f, num_lines=DATA_HASH_LINES)
+                data_hash = hashlib.blake2b(digest_size=8)
+                data_hash.update(str(file_size(filename, zfile)).encode())
+                data_hash.update("\n".join(tail).encode(GEF_ENCODING, errors="replace"))
+                si.fingerprint = f"{header_hash.hexdigest()}{data_hash.hexdigest()}"
+
+                if stype != SoilInvestigationEnum.NONE and len(tail) > 0:
+                    si.z_min = _final_depth(tail[-1], header, stype)
+
+                return si
         except Exception as e:
             print(f"Error reading {filename}, '{e}'")
             return None
 
-        print(f"Could not find #XYID in '{filename}'")
-        return None
+    @classmethod
+    def iter_from_files(
+            obj,
+            filenames: Iterable[str],
+            stype: SoilInvestigationEnum = SoilInvestigationEnum.NONE,
+            max_workers: int = None,
+            known: Dict[str, 'SoilInvestigation'] = None
+        ) -> Iterator[Tuple[str, Optional['SoilInvestigation']]]:
+        """
+        Read the soil investigations from the given files in parallel, the results are yielded
+        as soon as they are available so the caller can show the progress
+
+        The filenames can be a generator like helpers.iter_files, the files are submitted while
+        they are found so reading the headers overlaps with the search for the files
+
+        Files in the same zip archive are read in batches by workers that each open the
+        archive once so the archive is never extracted
+
+        If FileEntry objects are given the stat information is stored with the soil investigation and
+        the known soil investigations with the same filename, modification time and size are returned
+        (without their aliases) without reading the file again, use this to update an index
+
+        Args:
+            filenames (Iterable[str]): the files to read (or FileEntry objects)
+            stype (SoilInvestigationEnum): the type of the soil investigations
+            max_workers (int): the maximum number of threads, defaults to the ThreadPoolExecutor default
+            known (Dict[str, SoilInvestigation]): the soil investigations of a previous run by filename (optional)
+
+        Returns:
+            Iterator[Tuple[str, SoilInvestigation]]: the filename and the soil investigation (or None if it could not be read)
+        """
+        def read_file(filename):
+            return [(filename, obj.from_file(filename, stype=stype))]
+
+        def read_archive_batch(archive, batch):
+            try:
+                with zipfile.ZipFile(archive) as zf:
+                    return [(filename, obj.from_file(filename, zfile=zf, stype=stype)) for filename in batch]
+            except Exception as e:
+                print(f"Error reading archive {archive}, '{e}'")
+                return [(filename, None) for filename in batch]
+
+        def results(future):
+            for filename, si in future.result():
+                signature = signatures.pop(filename, None)
+                if si is not None and signature is not None:
+                    si.file_mtime, si.file_size = signature
+                yield filename, si
+
+        known = known or {}
+        signatures = {}
+        done = queue.Queue()
+        num_pending = 0
+        archives = {}
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            def submit(function, *args):
+                executor.submit(function, *args).add_done_callback(done.put)
+
+            for filename in filenames:
+                if isinstance(filename, FileEntry):
+                    previous = known.get(filename.filename)
+                    if previous is not None and previous.stype == stype and (previous.file_mtime, previous.file_size) == filename.signature:
+                        yield filename.filename, previous.copy(update={"aliases": []})
+                        continue
+                    signatures[filename.filename] = filename.signature
+
+                filename = str(filename)
+                archive, member = split_archive_path(filename)
+                if member == "":
+                    submit(read_file, filename)
+                    num_pending += 1
+                else:
+                    batch = archives.setdefault(archive, [])
+                    batch.append(filename)
+                    if len(batch) >= ARCHIVE_BATCH_SIZE:
+                        submit(read_archive_batch, archive, archives.pop(archive))
+                        num_pending += 1
+
+                # return the finished files while the rest of the files are found
+                while not done.empty():
+                    num_pending -= 1
+                    yield from results(done.get())
+
+            for archive, batch in archives.items():
+                submit(read_archive_batch, archive, batch)
+                num_pending += 1
+
+            while num_pending > 0:
+                num_pending -= 1
+                yield from results(done.get())
+
+
+def attribute_columns(sis: List[SoilInvestigation]) -> Dict[str, np.ndarray]:
+    """
+    Return the attributes of the soil investigations as numpy arrays for vectorized filtering
+
+    Columns:
+        stype       int, the SoilInvestigationEnum value
+        date        int, YYYYMMDD or 0 if unknown
+        z_top       float
+        z_min       float, nan if unknown
+        has_u       bool
+        pre_excavated_depth float
+
+    Args:
+        sis (List[SoilInvestigation]): the soil investigations
+
+    Returns:
+        Dict[str, np.ndarray]: the columns in the order of the soil investigations
+    """
+    return {
+        "stype": np.array([int(si.stype) for si in sis], dtype=np.int64),
+        "date": np.array([int(si.date) if si.date.isdigit() else 0 for si in sis], dtype=np.int64),
+        "z_top": np.array([si.z_top for si in sis], dtype=float),
+        "z_min": np.array([np.nan if si.z_min is None else si.z_min for si in sis], dtype=float),
+        "has_u": np.array([si.has_u for si in sis], dtype=bool),
+        "pre_excavated_depth": np.array([si.pre_excavated_depth for si in sis], dtype=float),
+    }
+
+
+def deduplicate(sis: List[SoilInvestigation]) -> List[SoilInvestigation]:
+    """
+    Keep one soil investigation per group of duplicates, duplicates have the same fingerprint
+    or the same type, coordinates and name (TESTID), the filenames of the other soil investigations
+    in the group are stored in the aliases of the kept soil investigation
+
+    The kept soil investigation is the one with the most recent date, if the dates are the
+    same the one with the first filename is kept
+
+    Args:
+        sis (List[SoilInvestigation]): the soil investigations
+
+    Returns:
+        List[SoilInvestigation]: the unique soil investigations in the original order
+    """
+    parent = list(range(len(sis)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    seen = {}
+    for i, si in enumerate(sis):
+        keys = []
+        if si.fingerprint != "":
+            keys.append(("fingerprint", si.fingerprint))
+        if si.name != "":
+            keys.append(("location", si.stype, round(si.x_rd, 2), round(si.y_rd, 2), si.name))
+        for key in keys:
+            if key in seen.keys():
+                parent[find(i)] = find(seen[key])
+            else:
+                seen[key] = i
+
+    groups = {}
+    for i in range(len(sis)):
+        groups.setdefault(find(i), []).append(i)
 
+    keep = []
+    for members in groups.values():
+        members = sorted(members, key=lambda i: sis[i].filename)
+        canonical = max(members, key=lambda i: sis[i].date) # max returns the first on ties
+        aliases = sorted(set([a for i in members for a in [sis[i].filename] + sis[i].aliases]) - set([sis[canonical].filename]))
+        sis[canonical].aliases = aliases
+        keep.append(canonical)
 
+    return [sis[i] for i in sorted(keep)]
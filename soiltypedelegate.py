@@ -0,0 +1,51 @@
+from typing import List
+from qgis.PyQt import QtCore, QtGui, QtWidgets
+
+from .soiltype import SoilType
+
+
+class SoilTypeDelegate(QtWidgets.QStyledItemDelegate):
+    """
+    Delegate for the soiltype column of the soillayer table, the cells only hold the name of
+    the soiltype and a combobox is only created while a cell is edited
+    """
+
+    def __init__(self, soiltypes: List[SoilType], parent=None):
+        super(SoilTypeDelegate, self).__init__(parent)
+        self.set_soiltypes(soiltypes)
+
+    def set_soiltypes(self, soiltypes: List[SoilType]) -> None:
+        self.names = [st.name for st in soiltypes]
+        self.index = {name: i for i, name in enumerate(self.names)}
+        self.colors = {st.name: QtGui.QColor(st.color) for st in soiltypes}
+
+    @property
+    def default_name(self) -> str:
+        return self.names[0] if len(self.names) > 0 else ""
+
+    def item(self, soilcode: str) -> QtWidgets.QTableWidgetItem:
+        """Return a table item for the given soiltype, unknown soiltypes are replaced by the first soiltype"""
+        if not soilcode in self.index.keys():
+            print(f"Error,could not find soilname '{soilcode}' in the given resources")
+            soilcode = self.default_name
+        item = QtWidgets.QTableWidgetItem(soilcode)
+        if soilcode in self.colors.keys():
+            item.setData(QtCore.Qt.DecorationRole, self.colors[soilcode])
+        return item
+
+    def createEditor(self, parent, option, index):
+        editor = QtWidgets.QComboBox(parent)
+        editor.addItems(self.names)
+        return editor
+
+    def setEditorData(self, editor, index):
+        editor.setCurrentIndex(self.index.get(index.data(QtCore.Qt.DisplayRole), 0))
+
+    def setModelData(self, editor, model, index):
+        name = editor.currentText()
+        model.setData(index, name, QtCore.Qt.DisplayRole)
+        if name in self.colors.keys():
+            model.setData(index, self.colors[name], QtCore.Qt.DecorationRole)
+
+    def updateEditorGeometry(self, editor, option, index):
+        editor.setGeometry(option.rect)
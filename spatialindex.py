@@ -0,0 +1,186 @@
+from typing import Tuple
+import numpy as np
+
+# the average number of points per grid cell if no cellsize is given
+POINTS_PER_CELL = 4
+
+# the smallest grid cell of join_within, smaller cells over the extent of the RD grid would overflow the int64 cell keys
+JOIN_MIN_CELLSIZE = 1.0
+
+
+class SpatialIndex:
+    """
+    Grid based spatial index on a set of points, the points are sorted on their grid cell
+    so all points in a range of cells on the same row can be found with a binary search
+    """
+
+    def __init__(self, x: np.ndarray, y: np.ndarray, cellsize: float = None):
+        self.x = np.asarray(x, dtype=float)
+        self.y = np.asarray(y, dtype=float)
+
+        if len(self.x) == 0:
+            self.x0, self.y0, self.nx, self.ny = 0.0, 0.0, 1, 1
+            self.cellsize = 1.0 if cellsize is None else cellsize
+            self.order = np.zeros(0, dtype=np.int64)
+            self.keys = np.zeros(0, dtype=np.int64)
+            return
+
+        self.x0, self.y0 = self.x.min(), self.y.min()
+        width, height = self.x.max() - self.x0, self.y.max() - self.y0
+
+        if cellsize is None:
+            cellsize = max(1.0, np.sqrt(max(width * height, 1.0) / len(self.x) * POINTS_PER_CELL))
+            cellsize = max(cellsize, max(width, height) / 1e6)
+        self.cellsize = cellsize
+
+        ix = ((self.x - self.x0) / cellsize).astype(np.int64)
+        iy = ((self.y - self.y0) / cellsize).astype(np.int64)
+        self.nx, self.ny = int(ix.max()) + 1, int(iy.max()) + 1
+
+        keys = iy * self.nx + ix
+        self.order = np.argsort(keys, kind="stable")
+        self.keys = keys[self.order]
+
+    def __len__(self) -> int:
+        return len(self.x)
+
+    def query_box(self, xmin: float, ymin: float, xmax: float, ymax: float) -> np.ndarray:
+        """
+        Return the indices of the points inside the given box
+
+        Args:
+            xmin (float): left
+            ymin (float): bottom
+            xmax (float): right
+            ymax (float): top
+
+        Returns:
+            np.ndarray: the indices of the points
+        """
+        if len(self.x) == 0 or xmax < xmin or ymax < ymin:
+            return np.zeros(0, dtype=np.int64)
+
+        ix0 = int(np.clip(np.floor((xmin - self.x0) / self.cellsize), 0, self.nx - 1))
+        ix1 = int(np.clip(np.floor((xmax - self.x0) / self.cellsize), 0, self.nx - 1))
+        iy0 = int(np.clip(np.floor((ymin - self.y0) / self.cellsize), 0, self.ny - 1))
+        iy1 = int(np.clip(np.floor((ymax - self.y0) / self.cellsize), 0, self.ny - 1))
+
+        rows = np.arange(iy0, iy1 + 1, dtype=np.int64) * self.nx
+        starts = np.searchsorted(self.keys, rows + ix0, side="left")
+        ends = np.searchsorted(self.keys, rows + ix1, side="right")
+        if len(starts) == 1:
+            candidates = self.order[starts[0]:ends[0]]
+        else:
+            candidates = np.concatenate([self.order[s:e] for s, e in zip(starts, ends) if e > s] + [np.zeros(0, dtype=np.int64)])
+
+        x, y = self.x[candidates], self.y[candidates]
+        return candidates[(x >= xmin) & (x <= xmax) & (y >= ymin) & (y <= ymax)]
+
+    def query_radius(self, x: float, y: float, radius: float) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Return the indices and distances of the points within the given radius sorted on distance
+
+        Args:
+            x (float): x coordinate
+            y (float): y coordinate
+            radius (float): the search radius
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: indices and distances
+        """
+        if 2 * radius / self.cellsize > max(self.nx, self.ny):
+            candidates = np.arange(len(self.x))
+        else:
+            candidates = self.query_box(x - radius, y - radius, x + radius, y + radius)
+        distances = np.hypot(self.x[candidates] - x, self.y[candidates] - y)
+        mask = distances <= radius
+        candidates, distances = candidates[mask], distances[mask]
+        order = np.argsort(distances, kind="stable")
+        return candidates[order], distances[order]
+
+    def nearest(self, x: float, y: float, num: int = 1, max_distance: float = np.inf) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Return the indices and distances of the closest points sorted on distance
+
+        Args:
+            x (float): x coordinate
+            y (float): y coordinate
+            num (int): the maximum number of points to return
+            max_distance (float): the maximum distance to the points
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: indices and distances
+        """
+        if len(self.x) == 0 or num <= 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+
+        # grow the search radius until enough points are found, if num points are found
+        # within the radius all num closest points are inside this radius
+        radius = min(self.cellsize, max_distance)
+        while True:
+            if 2 * radius / self.cellsize > max(self.nx, self.ny):
+                radius = max_distance # the grid does not help anymore, check all points
+            indices, distances = self.query_radius(x, y, radius)
+            if len(indices) >= num or radius >= max_distance:
+                break
+            radius = min(radius * 2, max_distance)
+
+        return indices[:num], distances[:num]
+
+
+def join_within(a: SpatialIndex, b: SpatialIndex, radius: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Return all pairs of points of a and b within the given distance, the points of b are bucketed
+    on a grid with cells of the size of the radius (at least JOIN_MIN_CELLSIZE) so only the 3x3 cells around each point of a
+    are compared and no loop over the points is needed
+
+    Args:
+        a (SpatialIndex): the first set of points
+        b (SpatialIndex): the second set of points
+        radius (float): the maximum distance
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray]: the indices in a, the indices in b and the distances,
+        sorted on the index in a and the distance
+    """
+    empty = (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0))
+    if len(a) == 0 or len(b) == 0 or radius < 0:
+        return empty
+
+    cellsize = max(radius, JOIN_MIN_CELLSIZE) # larger cells are still correct, the 3x3 cells cover the radius
+    x0, y0 = min(a.x.min(), b.x.min()), min(a.y.min(), b.y.min())
+    # one extra cell on each side so the neighbours of the outer cells have valid keys
+    ax = ((a.x - x0) / cellsize).astype(np.int64) + 1
+    ay = ((a.y - y0) / cellsize).astype(np.int64) + 1
+    bx = ((b.x - x0) / cellsize).astype(np.int64) + 1
+    by = ((b.y - y0) / cellsize).astype(np.int64) + 1
+    nx = int(max(ax.max(), bx.max())) + 2
+
+    bkeys = by * nx + bx
+    border = np.argsort(bkeys, kind="stable")
+    bkeys = bkeys[border]
+
+    result_a, result_b = [], []
+    for ox in (-1, 0, 1):
+        for oy in (-1, 0, 1):
+            keys = (ay + oy) * nx + (ax + ox)
+            starts = np.searchsorted(bkeys, keys, side="left")
+            counts = np.searchsorted(bkeys, keys, side="right") - starts
+            total = int(counts.sum())
+            if total == 0:
+                continue
+            # expand the ranges [start, start + count) of all points without a loop
+            ia = np.repeat(np.arange(len(keys)), counts)
+            positions = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(starts, counts)
+            result_a.append(ia)
+            result_b.append(border[positions])
+
+    if len(result_a) == 0:
+        return empty
+
+    ia, ib = np.concatenate(result_a), np.concatenate(result_b)
+    distances = np.hypot(a.x[ia] - b.x[ib], a.y[ia] - b.y[ib])
+    mask = distances <= radius
+    ia, ib, distances = ia[mask], ib[mask], distances[mask]
+    order = np.lexsort((distances, ia))
+    return ia[order], ib[order], distances[order]
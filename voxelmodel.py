@@ -0,0 +1,470 @@
+from pydantic import BaseModel
+from typing import List, Tuple, Optional
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+import json
+import numpy as np
+
+from .cpt import CPT
+from .soilinvestigation import SoilInvestigation, SoilInvestigationEnum
+from .helpers import file_signature
+from .interpolation import DEFAULT_POWER, MIN_DISTANCE
+from .geopackage import SRS_WKT_RD
+
+# number of cells in x and y direction of one chunk
+VOXEL_CHUNK_SIZE = 32
+
+VOXEL_DX = 25.0
+VOXEL_DZ = 0.1
+# only the closest CPTs within this distance are used for a cell
+VOXEL_MAX_DISTANCE = 250.0
+VOXEL_NUM_CPTS = 4
+
+VOXEL_GRID_FILE = "grid.json"
+VOXEL_MANIFEST_FILE = "chunks.json"
+
+NODATA = -9999.0
+
+# channel name -> column in CPT.as_numpy / CPT.resample
+CHANNEL_COLUMNS = {"qc": 1, "fs": 2, "Rf": 3, "u": 4}
+
+
+class VoxelGrid(BaseModel):
+    """
+    Definition of a regular 3D grid in RD coordinates and m NAP, cell (ix, iy, iz) has
+    its center at (x0 + (ix + 0.5) * dx, y0 + (iy + 0.5) * dx, z_top - iz * dz)
+    """
+    x0: float
+    y0: float
+    z_top: float
+    dx: float = VOXEL_DX
+    dz: float = VOXEL_DZ
+    nx: int
+    ny: int
+    nz: int
+    chunk_size: int = VOXEL_CHUNK_SIZE
+    channels: List[str] = ["qc", "Rf"]
+    max_distance: float = VOXEL_MAX_DISTANCE
+    num_cpts: int = VOXEL_NUM_CPTS
+    power: float = DEFAULT_POWER
+
+    @property
+    def z(self) -> np.ndarray:
+        return np.round(self.z_top - np.arange(self.nz) * self.dz, 6)
+
+    @property
+    def num_chunks(self) -> Tuple[int, int]:
+        return (self.nx + self.chunk_size - 1) // self.chunk_size, (self.ny + self.chunk_size - 1) // self.chunk_size
+
+    def chunk_bounds(self, cx: int, cy: int) -> Tuple[int, int, int, int]:
+        """Return the first and last (exclusive) cell in x and y of the chunk as ix0, ix1, iy0, iy1"""
+        ix0, iy0 = cx * self.chunk_size, cy * self.chunk_size
+        return ix0, min(ix0 + self.chunk_size, self.nx), iy0, min(iy0 + self.chunk_size, self.ny)
+
+    def chunk_extent(self, cx: int, cy: int) -> Tuple[float, float, float, float]:
+        """Return the extent of the chunk as xmin, ymin, xmax, ymax"""
+        ix0, ix1, iy0, iy1 = self.chunk_bounds(cx, cy)
+        return self.x0 + ix0 * self.dx, self.y0 + iy0 * self.dx, self.x0 + ix1 * self.dx, self.y0 + iy1 * self.dx
+
+    def cell(self, x: np.ndarray, y: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Return the cell indices of the given points, points outside the grid get -1"""
+        ix = np.floor((np.asarray(x, dtype=float) - self.x0) / self.dx).astype(np.int64)
+        iy = np.floor((np.asarray(y, dtype=float) - self.y0) / self.dx).astype(np.int64)
+        outside = (ix < 0) | (ix >= self.nx) | (iy < 0) | (iy >= self.ny)
+        return np.where(outside, -1, ix), np.where(outside, -1, iy)
+
+    def level(self, z: float) -> int:
+        """Return the index of the level closest to z or -1 if z is outside the grid"""
+        iz = int(round((self.z_top - z) / self.dz))
+        return iz if 0 <= iz < self.nz else -1
+
+
+def _chunk_filename(cx: int, cy: int) -> str:
+    return f"chunk_{cx}_{cy}.npy"
+
+
+def _same_settings(a: 'VoxelGrid', b: 'VoxelGrid') -> bool:
+    # all but the horizontal extent, chunks of grids with the same settings can be reused
+    fields = ["z_top", "dx", "dz", "nz", "chunk_size", "channels", "max_distance", "num_cpts", "power"]
+    return all(getattr(a, field) == getattr(b, field) for field in fields)
+
+
+def _remap_manifest(directory: Path, stored: 'VoxelGrid', grid: 'VoxelGrid', manifest: dict) -> dict:
+    """
+    Return the manifest of the stored model with the chunk keys of the new grid and rename the chunk
+    files, the grids have the same settings and origins that differ by whole chunks, the chunks
+    outside the new grid are removed
+
+    Returns:
+        dict: the manifest for the new grid, empty if the chunks can not be reused
+    """
+    chunk_width = grid.dx * grid.chunk_size
+    ox, oy = (stored.x0 - grid.x0) / chunk_width, (stored.y0 - grid.y0) / chunk_width
+    if abs(ox - round(ox)) > 1e-6 or abs(oy - round(oy)) > 1e-6:
+        return {}
+    ox, oy = int(round(ox)), int(round(oy))
+
+    ncx, ncy = grid.num_chunks
+    moves, result = [], {}
+    for key, entry in manifest.items():
+        cx, cy = [int(v) for v in key.split(",")]
+        path = directory / _chunk_filename(cx, cy)
+        if not (0 <= cx + ox < ncx and 0 <= cy + oy < ncy):
+            if path.exists():
+                path.unlink()
+            continue
+        result[f"{cx + ox},{cy + oy}"] = entry
+        if (ox, oy) != (0, 0) and path.exists():
+            moves.append((path, directory / _chunk_filename(cx + ox, cy + oy)))
+
+    # in two steps so no chunk is overwritten before it is moved
+    for source, _ in moves:
+        source.rename(source.with_suffix(".tmp"))
+    for source, target in moves:
+        source.with_suffix(".tmp").rename(target)
+    return result
+
+
+def interpolate_chunk(grid: VoxelGrid, cx: int, cy: int, cpts: List[CPT]) -> Optional[np.ndarray]:
+    """
+    Return the inverse distance weighted values of the CPTs on the cells of the chunk, every cell uses
+    the closest grid.num_cpts CPTs within grid.max_distance, levels without data get nan values
+
+    Args:
+        grid (VoxelGrid): the grid
+        cx (int): chunk index in x direction
+        cy (int): chunk index in y direction
+        cpts (List[CPT]): the CPTs around the chunk
+
+    Returns:
+        np.ndarray: float32 array with shape (nz, cells in y, cells in x, channels) or None if there are no CPTs
+    """
+    cpts = [cpt for cpt in cpts if len(cpt.z) > 1]
+    if len(cpts) == 0:
+        return None
+
+    ix0, ix1, iy0, iy1 = grid.chunk_bounds(cx, cy)
+    xs = grid.x0 + (np.arange(ix0, ix1) + 0.5) * grid.dx
+    ys = grid.y0 + (np.arange(iy0, iy1) + 0.5) * grid.dx
+    cellx, celly = [a.ravel() for a in np.meshgrid(xs, ys)]
+
+    # (num_cpts, nz, channels)
+    columns = [CHANNEL_COLUMNS[c] for c in grid.channels]
+    values = np.stack([cpt.resample(grid.z)[:,columns] for cpt in cpts])
+    valid = ~np.isnan(values)
+    values = np.nan_to_num(values)
+
+    # (num_cells, num_cpts) weights, only the closest CPTs within the maximum distance
+    distances = np.hypot(cellx[:,None] - np.array([cpt.x for cpt in cpts]), celly[:,None] - np.array([cpt.y for cpt in cpts]))
+    weights = np.where(distances <= grid.max_distance, 1.0 / np.power(np.maximum(distances, MIN_DISTANCE), grid.power), 0.0)
+    if len(cpts) > grid.num_cpts:
+        farthest = np.argpartition(distances, grid.num_cpts, axis=1)[:,grid.num_cpts:]
+        np.put_along_axis(weights, farthest, 0.0, axis=1)
+
+    wsum = np.einsum("cj,jzk->czk", weights, valid.astype(float))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        result = np.where(wsum > 0, np.einsum("cj,jzk->czk", weights, values) / wsum, np.nan)
+
+    # (num_cells, nz, channels) -> (nz, cells in y, cells in x, channels)
+    result = result.reshape(len(ys), len(xs), grid.nz, len(columns)).transpose(2, 0, 1, 3)
+    return result.astype(np.float32)
+
+
+def _source_signature(si: SoilInvestigation) -> str:
+    # changes if the CPT is indexed again with other contents or if the file is replaced under the same name
+    try:
+        mtime, size = file_signature(si.filename)
+    except OSError:
+        mtime, size = None, None
+    return f"{si.fingerprint};{mtime};{size}"
+
+
+def _build_chunk(directory: str, grid: VoxelGrid, cx: int, cy: int, filenames: List[str]) -> Tuple[int, int, bool, List[str]]:
+    # runs in a worker process, the chunk is written to a .npy file that is read with a memory map
+    cpts = []
+    for filename in filenames:
+        try:
+            cpts.append(CPT.from_file(filename))
+        except Exception as e: # log errors to the Python console in QGis
+            print(f"Could not read CPT '{filename}', got error '{e}'")
+
+    path = Path(directory) / _chunk_filename(cx, cy)
+    data = interpolate_chunk(grid, cx, cy, cpts)
+    if data is None:
+        if path.exists():
+            path.unlink()
+        return cx, cy, False, filenames
+
+    mm = np.lib.format.open_memmap(str(path), mode="w+", dtype=np.float32, shape=data.shape)
+    mm[:] = data
+    mm.flush()
+    del mm
+    return cx, cy, True, filenames
+
+
+class VoxelModel:
+    """
+    3D model of interpolated CPT channels stored as chunks of .npy files in a directory, the chunks
+    are opened as memory maps so a query only reads the parts of the chunks that it touches
+
+    Usage:
+        model = VoxelModel.build(project, "d:/voxels")
+        qc = model.depth_slice(-8.0, "qc")
+        model.export_slice_asc("d:/qc_nap-8.asc", -8.0, "qc")
+    """
+
+    def __init__(self, directory: str):
+        self.directory = Path(directory)
+        with open(self.directory / VOXEL_GRID_FILE, "r") as f:
+            self.grid = VoxelGrid(**json.load(f))
+        with open(self.directory / VOXEL_MANIFEST_FILE, "r") as f:
+            self.manifest = json.load(f)
+        self._chunks = {}
+
+    @classmethod
+    def build(
+        obj,
+        project,
+        directory: str,
+        bbox: Tuple[float, float, float, float] = None,
+        dx: float = VOXEL_DX,
+        dz: float = VOXEL_DZ,
+        z_range: Tuple[float, float] = None,
+        channels: List[str] = ["qc", "Rf"],
+        max_distance: float = VOXEL_MAX_DISTANCE,
+        num_cpts: int = VOXEL_NUM_CPTS,
+        max_workers: int = None
+    ) -> 'VoxelModel':
+        """
+        Build or update the voxel model of the CPTs of the project, if the directory contains a model
+        with the same settings only the chunks for which the set of nearby CPTs or one of their files has
+        changed are rebuilt
+
+        Without a bbox the extent of the CPTs and the stored model is used, snapped to whole chunks, so new
+        CPTs outside the extent only add chunks, without a z_range the levels of the stored model are kept
+
+        Args:
+            project (Project): the project with the indexed CPTs
+            directory (str): the directory of the model
+            bbox (Tuple[float, float, float, float]): xmin, ymin, xmax, ymax, defaults to the extent of the CPTs
+            dx (float): the horizontal cell size
+            dz (float): the vertical cell size
+            z_range (Tuple[float, float]): the top and bottom level, defaults to the range of the CPTs (of the first build)
+            channels (List[str]): the channels to interpolate, see CHANNEL_COLUMNS
+            max_distance (float): only use CPTs within this distance of a cell
+            num_cpts (int): the maximum number of CPTs per cell
+            max_workers (int): the maximum number of processes, defaults to the number of processors, use 0 to
+                build the chunks in the current process (like inside QGis where no worker processes can be started)
+
+        Returns:
+            VoxelModel: the model
+        """
+        index, cpts = project.get_spatial_index(SoilInvestigationEnum.CPT)
+        if len(cpts) == 0:
+            raise ValueError("There are no CPTs to build a voxel model")
+
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        stored, manifest = None, {}
+        if (directory / VOXEL_GRID_FILE).exists() and (directory / VOXEL_MANIFEST_FILE).exists():
+            with open(directory / VOXEL_GRID_FILE, "r") as f:
+                stored = VoxelGrid(**json.load(f))
+            with open(directory / VOXEL_MANIFEST_FILE, "r") as f:
+                manifest = json.load(f)
+            if (stored.dx, stored.dz, stored.chunk_size, stored.channels, stored.max_distance, stored.num_cpts) != (dx, dz, VOXEL_CHUNK_SIZE, channels, max_distance, num_cpts):
+                stored = None
+
+        if bbox is None:
+            # the upper edge is excluded, a CPT on the edge of a chunk belongs to the next chunk
+            chunk_width = dx * VOXEL_CHUNK_SIZE
+            bbox = [
+                np.floor(index.x.min() / chunk_width) * chunk_width, np.floor(index.y.min() / chunk_width) * chunk_width,
+                (np.floor(index.x.max() / chunk_width) + 1) * chunk_width, (np.floor(index.y.max() / chunk_width) + 1) * chunk_width
+            ]
+            if stored is not None:
+                bbox = [
+                    min(bbox[0], stored.x0), min(bbox[1], stored.y0),
+                    max(bbox[2], stored.x0 + stored.nx * dx), max(bbox[3], stored.y0 + stored.ny * dx)
+                ]
+        if z_range is None and stored is not None:
+            z_top, nz = stored.z_top, stored.nz
+        else:
+            if z_range is None:
+                z_mins = [si.z_min for si in cpts if si.z_min is not None]
+                z_range = (max([si.z_top for si in cpts]), min(z_mins) if len(z_mins) > 0 else min([si.z_top for si in cpts]) - 1.0)
+            z_top = round(np.ceil(z_range[0] / dz) * dz, 6)
+            nz = max(1, int(np.floor((z_top - z_range[1]) / dz)) + 1)
+
+        x0, y0 = np.floor(bbox[0] / dx) * dx, np.floor(bbox[1] / dx) * dx
+        grid = VoxelGrid(
+            x0 = x0,
+            y0 = y0,
+            z_top = z_top,
+            dx = dx,
+            dz = dz,
+            nx = max(1, int(np.ceil(round((bbox[2] - x0) / dx, 6)))),
+            ny = max(1, int(np.ceil(round((bbox[3] - y0) / dx, 6)))),
+            nz = nz,
+            channels = channels,
+            max_distance = max_distance,
+            num_cpts = num_cpts
+        )
+
+        if stored is not None and _same_settings(stored, grid):
+            manifest = _remap_manifest(directory, stored, grid, manifest)
+        else:
+            manifest = {}
+        if len(manifest) == 0:
+            for path in directory.glob("chunk_*.npy"):
+                path.unlink()
+
+        # find the CPTs that can influence each chunk and only rebuild the chunks where this set or one of the files has changed
+        tasks, sources, signatures = [], {}, {}
+        ncx, ncy = grid.num_chunks
+        for cx in range(ncx):
+            for cy in range(ncy):
+                xmin, ymin, xmax, ymax = grid.chunk_extent(cx, cy)
+                indices = index.query_box(xmin - max_distance, ymin - max_distance, xmax + max_distance, ymax + max_distance)
+                for i in indices.tolist():
+                    if not i in signatures.keys():
+                        signatures[i] = _source_signature(cpts[i])
+                chunk_sources = {cpts[i].filename: signatures[i] for i in indices.tolist()} # filename -> signature
+                key = f"{cx},{cy}"
+                entry = manifest.get(key)
+                if entry is not None and entry["sources"] == chunk_sources and (not entry["has_data"] or (directory / _chunk_filename(cx, cy)).exists()):
+                    continue
+                sources[key] = chunk_sources
+                tasks.append((cx, cy, sorted(chunk_sources.keys())))
+
+        with open(directory / VOXEL_GRID_FILE, "w") as f:
+            f.write(grid.json())
+
+        if max_workers == 0:
+            results = [_build_chunk(str(directory), grid, cx, cy, filenames) for cx, cy, filenames in tasks]
+        elif len(tasks) > 0:
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                futures = [executor.submit(_build_chunk, str(directory), grid, cx, cy, filenames) for cx, cy, filenames in tasks]
+                results = [future.result() for future in as_completed(futures)]
+        else:
+            results = []
+        for cx, cy, has_data, _ in results:
+            manifest[f"{cx},{cy}"] = {"sources": sources[f"{cx},{cy}"], "has_data": has_data}
+
+        with open(directory / VOXEL_MANIFEST_FILE, "w") as f:
+            json.dump(manifest, f)
+        return VoxelModel(directory)
+
+    def _chunk(self, cx: int, cy: int) -> Optional[np.ndarray]:
+        key = (cx, cy)
+        if not key in self._chunks.keys():
+            path = self.directory / _chunk_filename(cx, cy)
+            self._chunks[key] = np.load(str(path), mmap_mode="r") if path.exists() else None
+        return self._chunks[key]
+
+    def _channel(self, channel: str) -> int:
+        if not channel in self.grid.channels:
+            raise ValueError(f"Unknown channel '{channel}', the model contains {self.grid.channels}")
+        return self.grid.channels.index(channel)
+
+    def depth_slice(self, z: float, channel: str = "qc", bbox: Tuple[float, float, float, float] = None) -> np.ndarray:
+        """
+        Return the values at the given level, only the chunks inside the bounding box are read
+
+        Args:
+            z (float): the level
+            channel (str): the channel
+            bbox (Tuple[float, float, float, float]): xmin, ymin, xmax, ymax (optional)
+
+        Returns:
+            np.ndarray: the values with shape (ny, nx) where row 0 is the lowest y, cells outside the
+            bounding box or without data are nan
+        """
+        grid, ic = self.grid, self._channel(channel)
+        result = np.full((grid.ny, grid.nx), np.nan, dtype=np.float32)
+        iz = grid.level(z)
+        if iz < 0:
+            return result
+
+        ncx, ncy = grid.num_chunks
+        cx0, cx1, cy0, cy1 = 0, ncx - 1, 0, ncy - 1
+        if bbox is not None:
+            cx0 = max(0, int((bbox[0] - grid.x0) // (grid.dx * grid.chunk_size)))
+            cx1 = min(ncx - 1, int((bbox[2] - grid.x0) // (grid.dx * grid.chunk_size)))
+            cy0 = max(0, int((bbox[1] - grid.y0) // (grid.dx * grid.chunk_size)))
+            cy1 = min(ncy - 1, int((bbox[3] - grid.y0) // (grid.dx * grid.chunk_size)))
+
+        for cx in range(cx0, cx1 + 1):
+            for cy in range(cy0, cy1 + 1):
+                chunk = self._chunk(cx, cy)
+                if chunk is not None:
+                    ix0, ix1, iy0, iy1 = grid.chunk_bounds(cx, cy)
+                    result[iy0:iy1, ix0:ix1] = chunk[iz, :, :, ic]
+        return result
+
+    def values_at(self, x: np.ndarray, y: np.ndarray, channel: str = "qc") -> np.ndarray:
+        """
+        Return the vertical profiles at the given points, the points are grouped per chunk so
+        every chunk is opened once
+
+        Args:
+            x (np.ndarray): x coordinates
+            y (np.ndarray): y coordinates
+            channel (str): the channel
+
+        Returns:
+            np.ndarray: the values with shape (nz, number of points), see grid.z for the levels
+        """
+        grid, ic = self.grid, self._channel(channel)
+        ix, iy = grid.cell(x, y)
+        result = np.full((grid.nz, len(ix)), np.nan, dtype=np.float32)
+        inside = np.flatnonzero(ix >= 0)
+        chunks = (ix[inside] // grid.chunk_size) * grid.num_chunks[1] + iy[inside] // grid.chunk_size
+        for key in np.unique(chunks):
+            points = inside[chunks == key]
+            cx, cy = divmod(int(key), grid.num_chunks[1])
+            chunk = self._chunk(cx, cy)
+            if chunk is not None:
+                result[:,points] = chunk[:, iy[points] - cy * grid.chunk_size, ix[points] - cx * grid.chunk_size, ic]
+        return result
+
+    def section(self, x1: float, y1: float, x2: float, y2: float, channel: str = "qc", step: float = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Return a vertical section between two points
+
+        Args:
+            x1 (float): x coordinate of the start
+            y1 (float): y coordinate of the start
+            x2 (float): x coordinate of the end
+            y2 (float): y coordinate of the end
+            channel (str): the channel
+            step (float): the distance between the sampled points, defaults to the cell size
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: the distance along the section and the values with shape (nz, number of points)
+        """
+        step = self.grid.dx if step is None else step
+        length = np.hypot(x2 - x1, y2 - y1)
+        distances = np.linspace(0.0, length, max(2, int(np.ceil(length / step)) + 1))
+        t = distances / length if length > 0 else np.zeros(len(distances))
+        return distances, self.values_at(x1 + t * (x2 - x1), y1 + t * (y2 - y1), channel)
+
+    def export_slice_asc(self, filename: str, z: float, channel: str = "qc") -> None:
+        """
+        Write the values at the given level as ESRI ASCII grid with a .prj file (Amersfoort / RD New)
+        next to it so it can be added to QGIS as a raster layer
+
+        Args:
+            filename (str): the name of the .asc file
+            z (float): the level
+            channel (str): the channel
+
+        Returns:
+            None
+        """
+        grid = self.grid
+        data = self.depth_slice(z, channel)[::-1] # the first row of an ascii grid is the top row
+        with open(filename, "w") as f:
+            f.write(f"ncols {grid.nx}\nnrows {grid.ny}\nxllcorner {grid.x0}\nyllcorner {grid.y0}\ncellsize {grid.dx}\nNODATA_value {NODATA}\n")
+            np.savetxt(f, np.where(np.isnan(data), NODATA, data), fmt="%.4g")
+        with open(Path(filename).with_suffix(".prj"), "w") as f:
+            f.write(SRS_WKT_RD)
@@ -0,0 +1,292 @@
+from pydantic import BaseModel
+from typing import List, Tuple, Optional
+from concurrent.futures import ProcessPoolExecutor
+import warnings
+import numpy as np
+
+from .cpt import CPT
+from .cptcleaning import CleaningSettings, clean_cpt
+from .soilinvestigation import SoilInvestigationEnum
+from .interpolation import common_z_grid
+
+# height of the depth intervals of the feature vectors
+ZONING_FEATURE_DZ = 0.5
+# the CPTs are resampled with this step before they are averaged per interval
+ZONING_RESAMPLE_DZ = 0.1
+# number of CPTs per worker task
+ZONING_CHUNK_SIZE = 250
+
+KMEANS_BATCH_SIZE = 1024
+KMEANS_MAX_ITERATIONS = 200
+KMEANS_TOLERANCE = 1e-4
+KMEANS_NUM_INIT = 3
+# number of points per distance calculation when all points are assigned
+KMEANS_ASSIGN_CHUNK_SIZE = 8192
+
+
+class SoilZone(BaseModel):
+    """A group of CPTs with similar profiles and the representative (median) profile of the group"""
+    zone: int
+    num_cpts: int
+    x: float # center of the CPTs in the zone
+    y: float
+    z: List[float] # center of the depth intervals
+    qc: List[float] # nan where no CPT of the zone reaches
+    Rf: List[float]
+
+
+class ZoningResult(BaseModel):
+    zones: List[SoilZone]
+    filenames: List[str] # the CPTs that were used
+    labels: np.ndarray # the zone of each CPT
+
+    class Config:
+        arbitrary_types_allowed = True
+
+
+def _extract_features(filenames: List[str], z: np.ndarray, num_bins: int, backend: str, cleaning: Optional[CleaningSettings]) -> Tuple[List[str], np.ndarray]:
+    # runs in a worker process, returns the mean log10(qc) and Rf per depth interval of the readable CPTs
+    bins_per_interval = len(z) // num_bins
+    names, rows = [], []
+    for filename in filenames:
+        try:
+            cpt = CPT.from_file(filename, backend=backend)
+            if cleaning is not None:
+                cpt = clean_cpt(cpt, cleaning)[0]
+        except Exception as e: # log errors to the Python console in QGis
+            print(f"Could not read CPT '{filename}', got error '{e}'")
+            continue
+        data = cpt.resample(z)
+        qc = np.log10(np.maximum(data[:,1], 1e-3)).reshape(num_bins, bins_per_interval)
+        rf = data[:,3].reshape(num_bins, bins_per_interval)
+        with np.errstate(invalid="ignore"): # intervals without readings become nan
+            counts = np.sum(np.isfinite(qc), axis=1)
+            qc = np.where(counts > 0, np.nansum(qc, axis=1) / np.maximum(counts, 1), np.nan)
+            rf = np.where(counts > 0, np.nansum(rf, axis=1) / np.maximum(counts, 1), np.nan)
+        names.append(filename)
+        rows.append(np.concatenate([qc, rf]).astype(np.float32))
+    return names, np.array(rows, dtype=np.float32).reshape(len(rows), 2 * num_bins)
+
+
+def _squared_distances(points: np.ndarray, centers: np.ndarray) -> np.ndarray:
+    d = np.sum(points ** 2, axis=1)[:,None] - 2.0 * points @ centers.T + np.sum(centers ** 2, axis=1)[None,:]
+    return np.maximum(d, 0.0)
+
+
+def assign_clusters(points: np.ndarray, centers: np.ndarray, chunk_size: int = KMEANS_ASSIGN_CHUNK_SIZE) -> np.ndarray:
+    """Return the index of the closest center of each point, the points are handled in chunks to limit the memory use"""
+    labels = np.zeros(len(points), dtype=np.int64)
+    for start in range(0, len(points), chunk_size):
+        labels[start:start+chunk_size] = np.argmin(_squared_distances(points[start:start+chunk_size], centers), axis=1)
+    return labels
+
+
+def _kmeans_plus_plus(sample: np.ndarray, num_clusters: int, rng: np.random.Generator) -> np.ndarray:
+    # greedy k-means++, a few candidates are tried for each new center and the one that reduces the inertia most is kept
+    num_candidates = 2 + int(np.log(num_clusters))
+    centers = [sample[rng.integers(len(sample))]]
+    closest = _squared_distances(sample, np.array(centers))[:,0]
+    for _ in range(1, num_clusters):
+        total = closest.sum()
+        candidates = rng.choice(len(sample), num_candidates, p=closest / total if total > 0 else None)
+        distances = np.minimum(closest[None,:], _squared_distances(sample[candidates], sample))
+        best = int(np.argmin(distances.sum(axis=1)))
+        centers.append(sample[candidates[best]])
+        closest = distances[best]
+    return np.array(centers, dtype=float)
+
+
+def minibatch_kmeans(
+        points: np.ndarray,
+        num_clusters: int,
+        batch_size: int = KMEANS_BATCH_SIZE,
+        max_iterations: int = KMEANS_MAX_ITERATIONS,
+        tolerance: float = KMEANS_TOLERANCE,
+        num_init: int = KMEANS_NUM_INIT,
+        seed: int = 0
+    ) -> np.ndarray:
+    """
+    Return the cluster centers of the points using mini-batch k-means, every iteration only uses
+    a random sample of batch_size points so the time per iteration does not depend on the number of points
+
+    The centers are initialized with k-means++ on a sample and each center moves towards the mean of its
+    points in the batch with a step that decreases with the number of points it has seen, this is repeated
+    num_init times and the centers with the lowest inertia on the sample are returned
+
+    Args:
+        points (np.ndarray): the points, one row per point
+        num_clusters (int): the number of clusters
+        batch_size (int): the number of points per iteration
+        max_iterations (int): the maximum number of iterations
+        tolerance (float): stop if the centers move less than this (relative to the spread of the points)
+        num_init (int): the number of runs with a different initialization
+        seed (int): seed of the random generator so the result can be reproduced
+
+    Returns:
+        np.ndarray: the centers, one row per cluster
+    """
+    rng = np.random.default_rng(seed)
+    num_clusters = min(num_clusters, len(points))
+    sample = points[rng.choice(len(points), min(len(points), max(batch_size, 10 * num_clusters)), replace=False)]
+    scale = max(float(np.mean(np.var(points, axis=0))), 1e-12)
+
+    best, best_inertia = None, np.inf
+    for _ in range(max(1, num_init)):
+        centers = _kmeans_plus_plus(sample, num_clusters, rng)
+        counts = np.zeros(num_clusters)
+        for _ in range(max_iterations):
+            batch = points[rng.choice(len(points), min(batch_size, len(points)), replace=False)]
+            labels = np.argmin(_squared_distances(batch, centers), axis=1)
+            n = np.bincount(labels, minlength=num_clusters).astype(float)
+            sums = np.zeros_like(centers)
+            np.add.at(sums, labels, batch)
+
+            seen = n > 0
+            counts[seen] += n[seen]
+            step = (n[seen] / counts[seen])[:,None]
+            previous = centers.copy()
+            centers[seen] = (1.0 - step) * centers[seen] + step * sums[seen] / n[seen][:,None]
+            if np.sum((centers - previous) ** 2) / num_clusters < tolerance * scale:
+                break
+
+        inertia = float(np.sum(np.min(_squared_distances(sample, centers), axis=1)))
+        if inertia < best_inertia:
+            best, best_inertia = centers, inertia
+    return best
+
+
+def cluster_cpts(
+        project,
+        num_zones: int,
+        z_range: Tuple[float, float] = None,
+        feature_dz: float = ZONING_FEATURE_DZ,
+        spatial_weight: float = 0.5,
+        batch_size: int = KMEANS_BATCH_SIZE,
+        seed: int = 0,
+        max_workers: int = None
+    ) -> ZoningResult:
+    """
+    Group the CPTs of the project in zones with similar profiles, each CPT is reduced to the mean
+    log10(qc) and Rf per depth interval and the vectors are clustered with mini-batch k-means
+
+    The coordinates are added to the (standardized) features so CPTs that are close together are
+    more likely to end up in the same zone, spatial_weight 0.0 only uses the profiles and 1.0 gives
+    the coordinates as much weight as the whole profile
+
+    Only the feature vectors are kept in memory (2 values per depth interval per CPT)
+
+    Args:
+        project (Project): the project with the indexed CPTs
+        num_zones (int): the number of zones
+        z_range (Tuple[float, float]): the top and bottom level of the profiles (optional), defaults to the
+            highest CPT top and the level that 90% of the CPTs reach
+        feature_dz (float): the height of the depth intervals
+        spatial_weight (float): the weight of the coordinates
+        batch_size (int): the number of CPTs per k-means iteration
+        seed (int): seed of the random generator
+        max_workers (int): the maximum number of processes, use 0 to read the CPTs in the current process (like inside QGis)
+
+    Returns:
+        ZoningResult: the zones and the zone of each CPT
+    """
+    index, sis = project.get_spatial_index(SoilInvestigationEnum.CPT)
+    if len(sis) == 0:
+        raise ValueError("There are no CPTs to define zones")
+
+    if z_range is None:
+        z_mins = [si.z_min for si in sis if si.z_min is not None]
+        z_top = max([si.z_top for si in sis])
+        z_range = (z_top, float(np.percentile(z_mins, 10)) if len(z_mins) > 0 else z_top - 10.0)
+    intervals = common_z_grid(z_range[0], z_range[1], feature_dz) # the centers of the intervals
+    steps = max(1, int(round(feature_dz / ZONING_RESAMPLE_DZ)))
+    z = np.round((intervals[:,None] + feature_dz / 2 - (np.arange(steps) + 0.5) * feature_dz / steps).ravel(), 6)
+
+    filenames = [si.filename for si in sis]
+    tasks = [filenames[i:i+ZONING_CHUNK_SIZE] for i in range(0, len(filenames), ZONING_CHUNK_SIZE)]
+    args = (z, len(intervals), project.gef_backend, project.cpt_cleaning)
+    if max_workers == 0:
+        results = [_extract_features(task, *args) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(_extract_features, tasks, *[[a] * len(tasks) for a in args]))
+
+    names = [name for result in results for name in result[0]]
+    raw = np.concatenate([result[1] for result in results]) if len(names) > 0 else np.zeros((0, 2 * len(intervals)), dtype=np.float32)
+    if len(names) == 0:
+        raise ValueError("None of the CPTs could be read")
+
+    positions = {filename: i for i, filename in enumerate(filenames)}
+    rows = np.array([positions[name] for name in names])
+    x, y = index.x[rows], index.y[rows]
+
+    # standardize the features, missing intervals get the mean value
+    with np.errstate(invalid="ignore"):
+        mean, std = np.nanmean(raw, axis=0), np.nanstd(raw, axis=0)
+    mean, std = np.nan_to_num(mean), np.where(np.isfinite(std) & (std > 0), std, 1.0)
+    points = np.nan_to_num((raw - mean) / std).astype(np.float32)
+
+    if spatial_weight > 0:
+        xy = np.column_stack([x - x.mean(), y - y.mean()])
+        xy /= max(float(np.sqrt(np.mean(np.sum(xy ** 2, axis=1)))), 1e-9)
+        points = np.column_stack([points, (xy * spatial_weight * np.sqrt(points.shape[1] / 2.0)).astype(np.float32)])
+
+    centers = minibatch_kmeans(points, num_zones, batch_size=batch_size, seed=seed)
+    labels = assign_clusters(points, centers)
+
+    # number the zones without the empty clusters
+    used = np.unique(labels)
+    remap = np.full(len(centers), -1, dtype=np.int64)
+    remap[used] = np.arange(len(used))
+    labels = remap[labels]
+
+    zones = []
+    nb = len(intervals)
+    for zone in range(len(used)):
+        members = labels == zone
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning) # intervals without readings in the zone
+            profile = np.nanmedian(raw[members], axis=0)
+        zones.append(SoilZone(
+            zone = zone,
+            num_cpts = int(np.count_nonzero(members)),
+            x = float(x[members].mean()),
+            y = float(y[members].mean()),
+            z = intervals.tolist(),
+            qc = (10.0 ** profile[:nb]).tolist(),
+            Rf = profile[nb:].tolist()
+        ))
+
+    return ZoningResult(zones=zones, filenames=names, labels=labels)
+
+
+def suggest_zones(project, result: ZoningResult, max_distance: float = 250.0, num: int = 4) -> np.ndarray:
+    """
+    Return the suggested zone for each location of the project, the zone with the highest inverse
+    distance weight of the closest clustered CPTs or -1 if there is no CPT within the given distance
+
+    Args:
+        project (Project): the project with the locations
+        result (ZoningResult): the zones, see cluster_cpts
+        max_distance (float): only use CPTs within this distance
+        num (int): the number of closest CPTs to use
+
+    Returns:
+        np.ndarray: the zone of each location
+    """
+    index, sis = project.get_spatial_index(SoilInvestigationEnum.CPT)
+    positions = {filename: i for i, filename in enumerate(result.filenames)}
+    labels = np.array([result.labels[positions[si.filename]] if si.filename in positions.keys() else -1 for si in sis], dtype=np.int64)
+
+    zones = np.full(len(project.locations), -1, dtype=np.int64)
+    num_zones = len(result.zones)
+    for i, location in enumerate(project.locations):
+        indices, distances = index.nearest(location.x_rd, location.y_rd, num=num, max_distance=max_distance)
+        if len(indices) == 0:
+            continue
+        found = labels[indices]
+        valid = found >= 0
+        if not np.any(valid):
+            continue
+        weights = np.bincount(found[valid], weights=1.0 / (np.asarray(distances)[valid] + 1.0), minlength=num_zones)
+        zones[i] = int(np.argmax(weights))
+    return zones